@@ -0,0 +1,29 @@
+"""
+路由类：端点返回后、响应发送前提交请求事务
+"""
+
+from collections.abc import Callable, Coroutine
+from typing import Any
+
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+from app.models.database import commit_request_session
+
+
+class UnitOfWorkRoute(APIRoute):
+    """
+    yield 依赖的收尾代码在部分 FastAPI 版本（<0.106、>=0.118 的部分路径）中于响应发送之后才执行：
+    在那里提交会先回 2xx 再落库，提交失败客户端也无从得知，紧接着的读请求可能读不到刚写入的数据。
+    这里在响应构造完成、交给 Starlette 发送之前提交；提交失败按 500 返回
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def unit_of_work_handler(request: Request) -> Response:
+            response = await handler(request)
+            await commit_request_session(request)
+            return response
+
+        return unit_of_work_handler
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.v1.endpoints import auth, pomodoro, profile, todos
+from app.api.v1.endpoints import admin, auth, me, pomodoro, profile, storage, todos
 
 api_router = APIRouter()
 
@@ -9,3 +9,6 @@ api_router.include_router(auth.router, tags=["auth"])
 api_router.include_router(todos.router, tags=["todos"])
 api_router.include_router(pomodoro.router, tags=["pomodoro"])
 api_router.include_router(profile.router, tags=["profile"])
+api_router.include_router(me.router, tags=["me"])
+api_router.include_router(storage.router, tags=["storage"], include_in_schema=False)
+api_router.include_router(admin.router, tags=["admin"])
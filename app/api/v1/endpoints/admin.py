@@ -0,0 +1,62 @@
+"""
+管理端点（仅限 settings.admin_emails 中、邮箱已验证的用户）
+"""
+
+import os
+from typing import Literal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+
+from app.api.routing import UnitOfWorkRoute
+from app.core.config import settings
+from app.core.profiler import StackSampler, profile_worker
+from app.core.security import get_current_admin
+from app.models.schemas import StackCount, WorkerProfileResponse
+
+router = APIRouter(
+    route_class=UnitOfWorkRoute, dependencies=[Depends(get_current_admin)]
+)
+
+# JSON 结果中返回的调用栈条数
+_TOP_STACKS = 50
+
+
+@router.post("/admin/profile", response_model=WorkerProfileResponse)
+async def profile_current_worker(
+    seconds: float = Query(10.0, gt=0, le=settings.profiler_max_seconds),
+    interval_ms: float = Query(10.0, ge=1, le=1000),
+    format: Literal["json", "collapsed"] = Query("json"),
+):
+    """
+    对处理本请求的 worker 采样分析 seconds 秒
+
+    format=collapsed 时返回 collapsed 调用栈文件（flamegraph.pl / speedscope 可直接打开）；
+    多 worker 部署时只分析接到请求的那个 worker，结果带 pid 以便区分
+    """
+    if StackSampler.busy():
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="当前 worker 已有采样分析在进行",
+        )
+    profile = await profile_worker(seconds, interval_ms / 1000)
+    pid = os.getpid()
+
+    if format == "collapsed":
+        return PlainTextResponse(
+            profile.collapsed(),
+            headers={
+                "Content-Disposition": f'attachment; filename="profile-{pid}.collapsed"'
+            },
+        )
+    return WorkerProfileResponse(
+        pid=pid,
+        seconds=profile.seconds,
+        interval_ms=interval_ms,
+        samples=profile.samples,
+        categories=dict(profile.categories),
+        top_stacks=[
+            StackCount(stack=stack, count=count)
+            for stack, count in profile.stacks.most_common(_TOP_STACKS)
+        ],
+    )
@@ -1,18 +1,19 @@
 """
 认证相关 API 端点
 """
-import uuid
 
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.api.routing import UnitOfWorkRoute
 from app.models.database import get_async_session
 from app.models.schemas import (
+    AccessTokenResponse,
     MessageResponse,
     PasswordResetConfirm,
     PasswordResetRequest,
+    RefreshTokenRequest,
     TokenRefreshRequest,
-    TokenResponse,
     TokenResponseWithRefresh,
     UserLogin,
     UserRegister,
@@ -20,7 +21,7 @@ from app.models.schemas import (
 )
 from app.services.auth_service import AuthService
 
-router = APIRouter()
+router = APIRouter(route_class=UnitOfWorkRoute)
 
 
 def get_auth_service(db: AsyncSession) -> AuthService:
@@ -51,16 +52,16 @@ async def login(
     return await auth_service.login(user)
 
 
-@router.post("/refresh", response_model=TokenResponse)
+@router.post("/refresh", response_model=AccessTokenResponse)
 async def refresh_token(
-    refresh_request: TokenRefreshRequest,
+    refresh_request: RefreshTokenRequest,
     db: AsyncSession = Depends(get_async_session),
 ):
     """
     刷新访问令牌
     """
     auth_service = get_auth_service(db)
-    return await auth_service.refresh_token(refresh_request.refresh_token)
+    return await auth_service.refresh(refresh_request)
 
 
 @router.post("/logout", response_model=MessageResponse)
@@ -97,4 +98,6 @@ async def reset_password(
     确认密码重置
     """
     auth_service = get_auth_service(db)
-    return await auth_service.reset_password(reset_confirm.token, reset_confirm.new_password)
+    return await auth_service.reset_password(
+        reset_confirm.token, reset_confirm.new_password
+    )
@@ -0,0 +1,38 @@
+"""
+当前用户聚合 API 端点
+"""
+
+import uuid
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.routing import UnitOfWorkRoute
+from app.core.query_budget import query_budget
+from app.core.security import TokenData, get_token_data, get_user_session
+from app.models.schemas import BootstrapResponse
+from app.services.bootstrap_service import BootstrapService
+
+router = APIRouter(route_class=UnitOfWorkRoute)
+
+
+def get_bootstrap_service(db: AsyncSession) -> BootstrapService:
+    return BootstrapService(db)
+
+
+@router.get(
+    "/me/bootstrap",
+    response_model=BootstrapResponse,
+    dependencies=[Depends(query_budget(4))],
+)
+async def get_bootstrap(
+    token_data: TokenData = Depends(get_token_data),
+    db: AsyncSession = Depends(get_user_session),
+):
+    """
+    客户端启动数据（用户、资料、番茄钟设置、今日待办、今日专注统计）
+
+    不走 get_current_user：用户查询并入聚合的连接查询，省掉一次往返
+    """
+    bootstrap_service = get_bootstrap_service(db)
+    return await bootstrap_service.get_bootstrap(uuid.UUID(token_data.user_id))
@@ -1,33 +1,50 @@
 """
 番茄钟 API 端点
 """
-import uuid
 
-from fastapi import APIRouter, Depends, status
+from datetime import UTC, date, datetime
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.security import get_current_user
+from app.api.routing import UnitOfWorkRoute
+from app.core.query_budget import query_budget
+from app.core.security import (
+    get_current_user,
+    get_current_user_for_read,
+    get_read_session,
+)
 from app.models.database import get_async_session
 from app.models.orm import User
 from app.models.schemas import (
+    LeaderboardResponse,
+    PomodoroHeatmapResponse,
+    PomodoroSessionBatchCreate,
+    PomodoroSessionBatchResponse,
     PomodoroSessionCreate,
     PomodoroSessionResponse,
     PomodoroSettings,
     PomodoroSettingsResponse,
 )
+from app.services.focus_stats_service import FocusStatsService
+from app.services.leaderboard_service import LeaderboardService
 from app.services.pomodoro_service import PomodoroService
 
-router = APIRouter()
+router = APIRouter(route_class=UnitOfWorkRoute)
 
 
-def get_pomodoro_service(db: AsyncSession) -> PomodoroService:
-    return PomodoroService(db)
+def get_pomodoro_service(
+    db: AsyncSession, read_db: AsyncSession | None = None
+) -> PomodoroService:
+    return PomodoroService(db, read_db)
 
 
 @router.post(
     "/pomodoro/sessions",
     response_model=PomodoroSessionResponse,
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(query_budget(6))],
 )
 async def create_pomodoro_session(
     session: PomodoroSessionCreate,
@@ -41,31 +58,101 @@ async def create_pomodoro_session(
     return await pomodoro_service.create_session(session, current_user.id)
 
 
-@router.get("/pomodoro/sessions", response_model=list[PomodoroSessionResponse])
-async def get_pomodoro_sessions(
+@router.post(
+    "/pomodoro/sessions/batch",
+    response_model=PomodoroSessionBatchResponse,
+)
+async def create_pomodoro_sessions_batch(
+    batch: PomodoroSessionBatchCreate,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_session),
 ):
     """
-    获取番茄钟会话列表
+    批量上传番茄钟会话（离线补传，按 clientId 去重）
     """
     pomodoro_service = get_pomodoro_service(db)
+    return await pomodoro_service.create_sessions_batch(batch, current_user.id)
+
+
+@router.get(
+    "/pomodoro/sessions",
+    response_model=list[PomodoroSessionResponse],
+    dependencies=[Depends(query_budget(2))],
+)
+async def get_pomodoro_sessions(
+    current_user: User = Depends(get_current_user_for_read),
+    db: AsyncSession = Depends(get_async_session),
+    read_db: AsyncSession = Depends(get_read_session),
+):
+    """
+    获取番茄钟会话列表
+    """
+    pomodoro_service = get_pomodoro_service(db, read_db)
     return await pomodoro_service.get_sessions(current_user.id)
 
 
-@router.get("/pomodoro/settings", response_model=PomodoroSettingsResponse)
-async def get_pomodoro_settings(
+@router.get(
+    "/pomodoro/heatmap",
+    response_model=PomodoroHeatmapResponse,
+    dependencies=[Depends(query_budget(2))],
+)
+async def get_pomodoro_heatmap(
+    year: int | None = Query(default=None, ge=2000, le=2100),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_session),
+):
+    """
+    获取年度专注热力图（每天一个整数：专注分钟数）
+    """
+    if year is None:
+        year = datetime.now(UTC).year
+    focus_stats_service = FocusStatsService(db)
+    return await focus_stats_service.get_heatmap(current_user.id, year)
+
+
+@router.get(
+    "/pomodoro/leaderboard",
+    response_model=LeaderboardResponse,
+    dependencies=[Depends(query_budget(5))],
+)
+async def get_pomodoro_leaderboard(
+    scope: Literal["global", "school"] = "global",
+    week: date | None = Query(default=None, description="该周内任意一天，默认本周"),
+    limit: int = Query(default=50, ge=1, le=100),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session),
+):
+    """
+    获取周专注排行榜（全站 / 同校）
+    """
+    leaderboard_service = LeaderboardService(db)
+    return await leaderboard_service.get_leaderboard(
+        current_user.id, scope, week, limit
+    )
+
+
+@router.get(
+    "/pomodoro/settings",
+    response_model=PomodoroSettingsResponse,
+    dependencies=[Depends(query_budget(3))],
+)
+async def get_pomodoro_settings(
+    current_user: User = Depends(get_current_user_for_read),
+    db: AsyncSession = Depends(get_async_session),
+    read_db: AsyncSession = Depends(get_read_session),
 ):
     """
     获取番茄钟设置
     """
-    pomodoro_service = get_pomodoro_service(db)
+    pomodoro_service = get_pomodoro_service(db, read_db)
     return await pomodoro_service.get_settings(current_user.id)
 
 
-@router.put("/pomodoro/settings", response_model=PomodoroSettingsResponse)
+@router.put(
+    "/pomodoro/settings",
+    response_model=PomodoroSettingsResponse,
+    dependencies=[Depends(query_budget(3))],
+)
 async def update_pomodoro_settings(
     settings: PomodoroSettings,
     current_user: User = Depends(get_current_user),
@@ -1,37 +1,60 @@
 """
 用户资料 API 端点
 """
-import uuid
 
 from fastapi import APIRouter, Depends, File, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.security import get_current_user
+from app.api.routing import UnitOfWorkRoute
+from app.core.query_budget import query_budget
+from app.core.security import (
+    get_current_user,
+    get_current_user_for_read,
+    get_read_session,
+)
 from app.models.database import get_async_session
 from app.models.orm import User
-from app.models.schemas import AvatarUploadResponse, ProfileResponse, ProfileUpdate
+from app.models.schemas import (
+    AvatarUploadConfirm,
+    AvatarUploadResponse,
+    AvatarUploadUrlRequest,
+    AvatarUploadUrlResponse,
+    ProfileResponse,
+    ProfileUpdate,
+)
 from app.services.profile_service import ProfileService
 
-router = APIRouter()
+router = APIRouter(route_class=UnitOfWorkRoute)
 
 
-def get_profile_service(db: AsyncSession) -> ProfileService:
-    return ProfileService(db)
+def get_profile_service(
+    db: AsyncSession, read_db: AsyncSession | None = None
+) -> ProfileService:
+    return ProfileService(db, read_db)
 
 
-@router.get("/profile", response_model=ProfileResponse)
+@router.get(
+    "/profile",
+    response_model=ProfileResponse,
+    dependencies=[Depends(query_budget(3))],
+)
 async def get_profile(
-    current_user: User = Depends(get_current_user),
+    current_user: User = Depends(get_current_user_for_read),
     db: AsyncSession = Depends(get_async_session),
+    read_db: AsyncSession = Depends(get_read_session),
 ):
     """
     获取个人资料
     """
-    profile_service = get_profile_service(db)
+    profile_service = get_profile_service(db, read_db)
     return await profile_service.get_profile(current_user.id)
 
 
-@router.put("/profile", response_model=ProfileResponse)
+@router.put(
+    "/profile",
+    response_model=ProfileResponse,
+    dependencies=[Depends(query_budget(3))],
+)
 async def update_profile(
     profile: ProfileUpdate,
     current_user: User = Depends(get_current_user),
@@ -55,3 +78,29 @@ async def upload_avatar(
     """
     profile_service = get_profile_service(db)
     return await profile_service.upload_avatar(avatar, current_user.id)
+
+
+@router.post("/profile/avatar/upload-url", response_model=AvatarUploadUrlResponse)
+async def create_avatar_upload_url(
+    request: AvatarUploadUrlRequest,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session),
+):
+    """
+    申请头像直传 URL
+    """
+    profile_service = get_profile_service(db)
+    return await profile_service.create_avatar_upload_url(request, current_user.id)
+
+
+@router.post("/profile/avatar/confirm", response_model=AvatarUploadResponse)
+async def confirm_avatar_upload(
+    confirm: AvatarUploadConfirm,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_session),
+):
+    """
+    确认头像直传完成
+    """
+    profile_service = get_profile_service(db)
+    return await profile_service.confirm_avatar_upload(confirm.key, current_user.id)
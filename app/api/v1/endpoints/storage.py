@@ -0,0 +1,66 @@
+"""
+本地存储直传端点（仅 storage_backend=local 时启用，模拟对象存储的预签名 PUT）
+"""
+
+import tempfile
+
+from fastapi import APIRouter, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+
+from app.api.routing import UnitOfWorkRoute
+from app.core.config import settings
+from app.core.storage import LocalStorage, get_storage
+from app.models.schemas import MessageResponse
+
+router = APIRouter(route_class=UnitOfWorkRoute)
+
+# 预签名直传只用于头像，按头像上限加一点余量
+_MAX_UPLOAD_BYTES = settings.avatar_max_bytes + 64 * 1024
+
+
+@router.put("/storage/upload/{key:path}", response_model=MessageResponse)
+async def put_object(
+    key: str,
+    content_type: str,
+    expires: int,
+    signature: str,
+    request: Request,
+):
+    """
+    按预签名 URL 写入本地对象
+    """
+    storage = get_storage()
+    if not isinstance(storage, LocalStorage):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+    if request.headers.get("content-type") != content_type or not storage.verify(
+        key, content_type, expires, signature
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="签名无效或已过期"
+        )
+
+    content_length = request.headers.get("content-length")
+    if (
+        content_length
+        and content_length.isdigit()
+        and int(content_length) > _MAX_UPLOAD_BYTES
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="请求体过大"
+        )
+
+    # 边收边写临时文件，超限立即中止
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as buffer:
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > _MAX_UPLOAD_BYTES:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="请求体过大",
+                )
+            await run_in_threadpool(buffer.write, chunk)
+        await storage.upload_fileobj(buffer, key, content_type, received)
+
+    return MessageResponse(message="ok")
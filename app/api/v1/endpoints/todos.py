@@ -1,37 +1,76 @@
 """
 待办事项 API 端点
 """
-import uuid
 
-from fastapi import APIRouter, Depends, status
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.security import get_current_user
+from app.api.routing import UnitOfWorkRoute
+from app.core.query_budget import query_budget
+from app.core.security import (
+    get_current_user,
+    get_current_user_for_read,
+    get_read_session,
+)
 from app.models.database import get_async_session
 from app.models.orm import User
-from app.models.schemas import TodoCreate, TodoResponse, TodoUpdate
+from app.models.schemas import (
+    TodoCreate,
+    TodoFocusReportItem,
+    TodoResponse,
+    TodoUpdate,
+)
 from app.services.todo_service import TodoService
 
-router = APIRouter()
+router = APIRouter(route_class=UnitOfWorkRoute)
 
 
 def get_todo_service(db: AsyncSession) -> TodoService:
     return TodoService(db)
 
 
-@router.get("/todos", response_model=list[TodoResponse])
+@router.get(
+    "/todos",
+    response_model=list[TodoResponse],
+    dependencies=[Depends(query_budget(2))],
+)
 async def get_todos(
+    current_user: User = Depends(get_current_user_for_read),
+    read_db: AsyncSession = Depends(get_read_session),
+):
+    """
+    获取当前用户的所有Todo
+    """
+    todo_service = get_todo_service(read_db)
+    return await todo_service.get_todos(current_user.id)
+
+
+@router.get("/todos/focus-report", response_model=list[TodoFocusReportItem])
+async def get_todo_focus_report(
+    start: datetime | None = None,
+    end: datetime | None = None,
+    limit: int = Query(default=50, ge=1, le=200),
+    offset: int = Query(default=0, ge=0),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_async_session),
 ):
     """
-    获取当前用户的所有Todo
+    获取待办专注时间报表（按时间窗口汇总）
     """
     todo_service = get_todo_service(db)
-    return await todo_service.get_todos(current_user.id)
+    return await todo_service.get_focus_report(
+        current_user.id, start, end, limit, offset
+    )
 
 
-@router.post("/todos", response_model=TodoResponse, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/todos",
+    response_model=TodoResponse,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(query_budget(3))],
+)
 async def create_todo(
     todo: TodoCreate,
     current_user: User = Depends(get_current_user),
@@ -44,7 +83,11 @@ async def create_todo(
     return await todo_service.create_todo(todo, current_user.id)
 
 
-@router.put("/todos/{todo_id}", response_model=TodoResponse)
+@router.put(
+    "/todos/{todo_id}",
+    response_model=TodoResponse,
+    dependencies=[Depends(query_budget(2))],
+)
 async def update_todo(
     todo_id: str,
     todo: TodoUpdate,
@@ -58,7 +101,11 @@ async def update_todo(
     return await todo_service.update_todo(todo_id, todo, current_user.id)
 
 
-@router.delete("/todos/{todo_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete(
+    "/todos/{todo_id}",
+    status_code=status.HTTP_204_NO_CONTENT,
+    dependencies=[Depends(query_budget(2))],
+)
 async def delete_todo(
     todo_id: str,
     current_user: User = Depends(get_current_user),
@@ -0,0 +1,139 @@
+"""
+跨 worker 的进程内缓存失效（Postgres LISTEN / NOTIFY）
+
+写入方在自己的事务内发 NOTIFY：提交后才送达，回滚则不发送；本 worker 在提交后立即失效，
+其他 worker 在每个分片上保持一条专用连接 LISTEN，收到后失效本进程缓存中对应的键。
+监听连接断开期间可能漏掉通知，重连后清空所有登记的缓存；经 pgbouncer 连接时不支持 LISTEN，
+其他 worker 只能依赖缓存的 ttl 过期。
+"""
+
+import asyncio
+import contextlib
+import logging
+import uuid
+from collections.abc import Callable, Iterable
+
+import asyncpg
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from app.core.config import settings
+from app.models.database import after_commit, shard_router
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "cache_invalidation"
+# NOTIFY 载荷上限 8000 字节，留出前缀余量
+_MAX_PAYLOAD = 7000
+# 本进程标识：跳过自己发出的通知（提交后已在本地失效）
+_ORIGIN = uuid.uuid4().hex[:12]
+
+
+class CacheBus:
+    """
+    缓存失效广播
+
+    - register(name, invalidate, clear): 登记一个缓存；invalidate 接收字符串键
+    - publish(session, name, keys): 在 session 的事务中登记失效（不提交）
+    - start() / stop(): 由应用生命周期启动、停止各分片上的监听任务
+    """
+
+    def __init__(self) -> None:
+        self._caches: dict[str, tuple[Callable[[str], None], Callable[[], None]]] = {}
+        self._tasks: list[asyncio.Task] = []
+
+    def register(
+        self, name: str, invalidate: Callable[[str], None], clear: Callable[[], None]
+    ) -> None:
+        self._caches[name] = (invalidate, clear)
+
+    async def publish(
+        self, session: AsyncSession, name: str, keys: Iterable[str]
+    ) -> None:
+        keys = sorted(set(keys))
+        if not keys:
+            return
+        invalidate, _ = self._caches[name]
+        after_commit(session, lambda: self._invalidate_local(invalidate, keys))
+        for payload in _payloads(name, keys):
+            await session.execute(select(func.pg_notify(CHANNEL, payload)))
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        if settings.db_pgbouncer:
+            logger.info("经 pgbouncer 连接不支持 LISTEN，缓存只在本 worker 内失效")
+            return
+        self._tasks = [
+            asyncio.create_task(self._listen(engine)) for engine in shard_router.engines
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+
+    @staticmethod
+    def _invalidate_local(invalidate: Callable[[str], None], keys: list[str]) -> None:
+        for key in keys:
+            invalidate(key)
+
+    def _clear_all(self) -> None:
+        for _, clear in self._caches.values():
+            clear()
+
+    def _on_notify(
+        self, connection: object, pid: int, channel: str, payload: str
+    ) -> None:
+        origin, name, raw_keys = payload.split(":", 2)
+        if origin == _ORIGIN or name not in self._caches:
+            return
+        self._invalidate_local(self._caches[name][0], raw_keys.split(" "))
+
+    async def _listen(self, engine: AsyncEngine) -> None:
+        dsn = engine.url.set(drivername="postgresql").render_as_string(
+            hide_password=False
+        )
+        delay = 1.0
+        while True:
+            try:
+                conn = await asyncpg.connect(dsn)
+            except (OSError, asyncpg.PostgresError) as exc:
+                logger.warning("缓存失效监听连接失败（%s），%.0f 秒后重试", exc, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+                continue
+
+            lost = asyncio.Event()
+            conn.add_termination_listener(lambda _, lost=lost: lost.set())
+            try:
+                await conn.add_listener(CHANNEL, self._on_notify)
+                # 连接建立之前（或断线期间）的通知已经收不到了
+                self._clear_all()
+                delay = 1.0
+                await lost.wait()
+                logger.warning("缓存失效监听连接断开，重连中")
+            finally:
+                if not conn.is_closed():
+                    await conn.close()
+
+
+def _payloads(name: str, keys: list[str]) -> Iterable[str]:
+    """把键按载荷上限分组：'来源:缓存名:键 键 ...'"""
+    prefix = f"{_ORIGIN}:{name}:"
+    chunk: list[str] = []
+    size = len(prefix)
+    for key in keys:
+        if chunk and size + len(key) + 1 > _MAX_PAYLOAD:
+            yield prefix + " ".join(chunk)
+            chunk, size = [], len(prefix)
+        chunk.append(key)
+        size += len(key) + 1
+    if chunk:
+        yield prefix + " ".join(chunk)
+
+
+cache_bus = CacheBus()
@@ -0,0 +1,118 @@
+"""
+指标
+
+- Histogram：进程内固定分桶直方图（/health/pool 等按 worker 查看的 JSON 状态）
+- Prometheus 指标：/metrics 导出；设置 PROMETHEUS_MULTIPROC_DIR 时走多进程模式，
+  各 gunicorn worker 写共享目录，抓取时汇总
+"""
+
+import os
+from bisect import bisect_left
+from collections import Counter as CounterDict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client import Histogram as PromHistogram
+
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    固定分桶直方图（与 Prometheus 的 le 语义一致：值 <= 上界计入该桶）
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> dict[str, int]:
+        """累计分桶计数 {"0.001": n, ..., "+Inf": count}"""
+        result: dict[str, int] = {}
+        running = 0
+        for bound, count in zip(self.buckets, self._counts, strict=True):
+            running += count
+            result[str(bound)] = running
+        result["+Inf"] = self.count
+        return result
+
+
+# ---- Prometheus 指标 ----
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP 请求数", ["method", "route", "status"]
+)
+HTTP_LATENCY = PromHistogram(
+    "http_request_duration_seconds",
+    "HTTP 请求耗时",
+    ["method", "route"],
+    buckets=DEFAULT_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "进行中的 HTTP 请求", multiprocess_mode="livesum"
+)
+DB_QUERIES = Counter("db_queries_total", "数据库语句数", ["route"])
+DB_QUERY_SECONDS = Counter("db_query_seconds_total", "数据库语句累计耗时", ["route"])
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "已借出的连接数", multiprocess_mode="livesum"
+)
+DB_POOL_SIZE = Gauge(
+    "db_pool_size", "连接池常驻连接数上限", multiprocess_mode="livesum"
+)
+DB_POOL_CONNECTS = Counter("db_pool_connects_total", "新建数据库连接数")
+DB_POOL_INVALIDATIONS = Counter("db_pool_invalidations_total", "失效的数据库连接数")
+DB_POOL_CHECKOUT_WAIT = PromHistogram(
+    "db_pool_checkout_wait_seconds", "获取连接等待时间", buckets=DEFAULT_BUCKETS
+)
+CRYPTO_SECONDS = PromHistogram(
+    "crypto_duration_seconds",
+    "密码学操作耗时",
+    ["operation"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+
+@dataclass
+class RequestStats:
+    """单个请求内的数据库统计（由数据库事件累加，请求结束时按路由汇总）"""
+
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    # 每条 SQL 文本的执行次数（N+1 检测）
+    statements: CounterDict[str] = field(default_factory=CounterDict)
+    # 路由声明的语句数上限（query_budget 依赖写入）
+    budget: int | None = None
+
+
+current_request_stats: ContextVar[RequestStats | None] = ContextVar(
+    "current_request_stats", default=None
+)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """
+    导出 Prometheus 文本格式（多进程模式下汇总所有 worker）
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -1,7 +1,25 @@
-from fastapi import FastAPI
+import asyncio
+import time
+
+from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from app.core.config import settings
+from app.core.metrics import (
+    DB_QUERIES,
+    DB_QUERY_SECONDS,
+    HTTP_IN_FLIGHT,
+    HTTP_LATENCY,
+    HTTP_REQUESTS,
+    RequestStats,
+    current_request_stats,
+)
+from app.core.query_budget import check_request, debug_headers
+from app.core.tracing import root_span
+from app.models.database import STICKY_COOKIE, replica_router
 
 
 def setup_cors(app: FastAPI) -> None:
@@ -15,3 +33,308 @@ def setup_cors(app: FastAPI) -> None:
         allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
         allow_headers=["Authorization", "Content-Type"],
     )
+
+
+class _BodyTooLarge(HTTPException):
+    """
+    分块传输的请求体超限
+
+    从 receive 中抛出：FastAPI 解析请求体时把其他异常转成 400，HTTPException 则原样交给异常处理返回 413
+    """
+
+    def __init__(self) -> None:
+        super().__init__(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="请求体过大"
+        )
+
+
+class BodySizeLimitMiddleware:
+    """
+    按路径限制请求体大小（纯 ASGI 中间件）
+
+    Content-Length 超限时在读取请求体之前直接返回 413；
+    没有 Content-Length（分块传输）时边读边计数，超限即中止。
+    超限后下游若仍返回了其他状态码（异常被捕获改写），响应统一替换为 413。
+    """
+
+    def __init__(self, app: ASGIApp, limits: dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = (
+            self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        )
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = Headers(scope=scope).get("content-length")
+        if (
+            content_length is not None
+            and content_length.isdigit()
+            and int(content_length) > limit
+        ):
+            await _too_large(scope, receive, send)
+            return
+
+        received = 0
+        overflowed = False
+        response_started = False
+        replaced = False
+
+        async def limited_receive() -> Message:
+            nonlocal received, overflowed
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    overflowed = True
+                    raise _BodyTooLarge
+            return message
+
+        async def guarded_send(message: Message) -> None:
+            nonlocal response_started, replaced
+            if message["type"] == "http.response.start":
+                response_started = True
+                if (
+                    overflowed
+                    and message["status"] != status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                ):
+                    replaced = True
+                    await _too_large(scope, receive, send)
+                    return
+            if not replaced:
+                await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except _BodyTooLarge:
+            if not response_started:
+                await _too_large(scope, receive, send)
+
+
+async def _too_large(scope: Scope, receive: Receive, send: Send) -> None:
+    response = JSONResponse(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        content={"detail": "请求体过大"},
+    )
+    await response(scope, receive, send)
+
+
+def setup_body_limits(app: FastAPI) -> None:
+    """
+    设置请求体大小限制（头像上传额外预留 64KB multipart 开销）
+    """
+    app.add_middleware(
+        BodySizeLimitMiddleware,
+        limits={"/profile/avatar": settings.avatar_max_bytes + 64 * 1024},
+    )
+
+
+class ReadYourWritesMiddleware:
+    """
+    写请求成功后标记该用户的 stickiness 窗口（纯 ASGI 中间件）
+
+    本 worker 内按用户记录，同时下发 Cookie 让其他 worker 也把该客户端的读请求路由到主库。
+    用户 ID 由 get_token_data 依赖写入 request.state。
+    """
+
+    _SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] in self._SAFE_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        async def marking_send(message: Message) -> None:
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                user_id = scope.get("state", {}).get("user_id")
+                if user_id is not None:
+                    replica_router.mark_write(user_id)
+                    cookie = (
+                        f"{STICKY_COOKIE}={replica_router.sticky_until()}; "
+                        f"Max-Age={replica_router.sticky_seconds}; Path=/; HttpOnly; SameSite=Lax"
+                    )
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"set-cookie", cookie.encode("latin-1")),
+                    ]
+            await send(message)
+
+        await self.app(scope, receive, marking_send)
+
+
+def setup_read_your_writes(app: FastAPI) -> None:
+    """
+    配置了只读副本时启用写后读主库的 stickiness
+    """
+    if replica_router.enabled:
+        app.add_middleware(ReadYourWritesMiddleware)
+
+
+class InFlightTracker:
+    """
+    进行中的请求计数（每个 worker 一份），关闭时等待其归零
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    def enter(self) -> None:
+        self.count += 1
+        self._idle.clear()
+        HTTP_IN_FLIGHT.inc()
+
+    def exit(self) -> None:
+        self.count -= 1
+        HTTP_IN_FLIGHT.dec()
+        if self.count == 0:
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """等待进行中的请求结束，超时返回 False"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except TimeoutError:
+            return False
+        return True
+
+
+in_flight = InFlightTracker()
+
+
+class InFlightMiddleware:
+    """统计进行中的 HTTP 请求（纯 ASGI 中间件）"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        in_flight.enter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            in_flight.exit()
+
+
+def setup_in_flight(app: FastAPI) -> None:
+    """
+    设置进行中请求统计（放在最外层，优雅关闭时据此等待）
+    """
+    app.add_middleware(InFlightMiddleware)
+
+
+def route_label(scope: Scope) -> str:
+    """路由模板作为指标标签（未匹配的路径归为一类，避免标签基数失控）"""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    按路由记录请求耗时、状态码与数据库语句数 / 耗时（纯 ASGI 中间件）
+
+    数据库统计在请求内累加到上下文变量，请求结束时一次性计入指标并检查语句预算；
+    debug 模式下把语句数与耗时写入响应头
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        stats = RequestStats()
+        token = current_request_stats.set(stats)
+        status_code = 500
+
+        async def recording_send(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.debug:
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        *debug_headers(stats),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, recording_send)
+        finally:
+            current_request_stats.reset(token)
+            route = route_label(scope)
+            method = scope["method"]
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            if stats.db_queries:
+                DB_QUERIES.labels(route).inc(stats.db_queries)
+                DB_QUERY_SECONDS.labels(route).inc(stats.db_seconds)
+            check_request(method, route, stats)
+
+
+def setup_metrics(app: FastAPI) -> None:
+    """
+    设置请求指标中间件
+    """
+    app.add_middleware(MetricsMiddleware)
+
+
+class TracingMiddleware:
+    """
+    请求入口的链路追踪（纯 ASGI 中间件）：按采样策略开始根 span，
+    读取上游 traceparent / X-Request-ID，被采样的响应带 X-Trace-Id 头便于对照日志
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        with root_span(
+            "http.request", headers.get("traceparent"), headers.get("x-request-id")
+        ) as root:
+            if root is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def traced_send(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    root.attributes["http.status_code"] = message["status"]
+                    message["headers"] = [
+                        *message.get("headers", []),
+                        (b"x-trace-id", root.trace_id.encode()),
+                    ]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, traced_send)
+            finally:
+                route = route_label(scope)
+                root.name = f"{scope['method']} {route}"
+                root.attributes["http.method"] = scope["method"]
+                root.attributes["http.route"] = route
+
+
+def setup_tracing(app: FastAPI) -> None:
+    """
+    设置链路追踪中间件（settings.trace_enabled 关闭时不添加）
+    """
+    if settings.trace_enabled:
+        app.add_middleware(TracingMiddleware)
@@ -0,0 +1,177 @@
+"""
+按需采样分析器：在当前 worker 内以固定间隔采集所有线程的调用栈
+
+采样在独立线程中进行，被分析的事件循环照常处理请求。事件循环线程的样本以当前运行的
+asyncio 任务（协程名）为根，循环空闲等待 IO 时记为 <idle>；线程池线程（bcrypt、文件 IO 等）
+以线程名为根。结果为 collapsed 格式（每行 "帧;帧;帧 次数"），可直接交给
+flamegraph.pl 或 speedscope 生成火焰图。
+"""
+
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from types import FrameType
+
+# 按模块归类样本，便于区分常见的 CPU 热点
+CATEGORIES: dict[str, tuple[str, ...]] = {
+    "bcrypt": ("passlib.", "bcrypt"),
+    "jwt": ("jose.",),
+    "json": (
+        "json.",
+        "fastapi.encoders",
+        "fastapi.routing.serialize_response",
+        "pydantic.",
+    ),
+    "orm": ("sqlalchemy.orm.", "sqlalchemy.engine.result"),
+    "db_driver": ("asyncpg.", "sqlalchemy.dialects."),
+    "images": ("PIL.", "app.utils.images"),
+}
+
+# 事件循环没有运行任务、栈顶停在这些模块时视为等待 IO（含 uvloop 下停在入口函数的情况）
+_IDLE_LOOP_MODULES = (
+    "selectors",
+    "asyncio.base_events",
+    "asyncio.runners",
+    "uvicorn.server",
+)
+# 空闲线程池线程的栈顶帧（不计入样本）
+_IDLE_THREAD_FRAMES = {
+    "threading.Condition.wait",
+    "threading.Event.wait",
+    "queue.Queue.get",
+    "concurrent.futures.thread._worker",
+}
+
+
+@dataclass
+class Profile:
+    """一次采样的结果"""
+
+    seconds: float
+    interval: float
+    samples: int = 0
+    stacks: Counter = field(default_factory=Counter)
+    categories: Counter = field(default_factory=Counter)
+
+    def collapsed(self) -> str:
+        return (
+            "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+            + "\n"
+        )
+
+
+def _frame_label(frame: FrameType) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    code = frame.f_code
+    return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _stack(frame: FrameType | None) -> list[str]:
+    # 从栈底到栈顶
+    labels: list[str] = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+def _loop_idle(frame: FrameType) -> bool:
+    return frame.f_globals.get("__name__", "").startswith(_IDLE_LOOP_MODULES)
+
+
+def _category(labels: list[str]) -> str:
+    # 取离栈顶最近的已知模块
+    for label in reversed(labels):
+        for category, prefixes in CATEGORIES.items():
+            if label.startswith(prefixes):
+                return category
+    return "other"
+
+
+class StackSampler:
+    """
+    采样线程：start() 后每 interval 秒采集一次，stop() 返回结果；同一时间只允许一个采样
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float):
+        self.loop = loop
+        self.interval = interval
+        self._loop_thread = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+        self._profile = Profile(seconds=0.0, interval=interval)
+        self._started = 0.0
+
+    @classmethod
+    def busy(cls) -> bool:
+        return cls._lock.locked()
+
+    def start(self) -> None:
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("已有采样在进行")
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> Profile:
+        self._stop.set()
+        self._thread.join()
+        self._profile.seconds = time.perf_counter() - self._started
+        self._lock.release()
+        return self._profile
+
+    def _sample(self) -> None:
+        profile = self._profile
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            if thread_id == self._loop_thread:
+                task = asyncio.current_task(self.loop)
+                if task is None and _loop_idle(frame):
+                    root, labels = "loop", ["<idle>"]
+                else:
+                    root = (
+                        "loop"
+                        if task is None
+                        else f"task:{task.get_coro().__qualname__}"
+                    )
+                    labels = _stack(frame)
+            else:
+                if _frame_label(frame) in _IDLE_THREAD_FRAMES:
+                    continue
+                root, labels = (
+                    f"thread:{names.get(thread_id, thread_id)}",
+                    _stack(frame),
+                )
+            profile.stacks[";".join([root, *labels])] += 1
+            profile.categories[
+                "idle" if labels == ["<idle>"] else _category(labels)
+            ] += 1
+        profile.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+
+async def profile_worker(seconds: float, interval: float) -> Profile:
+    """
+    对当前 worker 采样 seconds 秒（调用方在事件循环中等待，期间照常处理其他请求）
+    """
+    sampler = StackSampler(asyncio.get_running_loop(), interval)
+    sampler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        # 等待采样线程退出可能长达一个采样间隔，不在事件循环上阻塞
+        profile = await asyncio.to_thread(sampler.stop)
+    return profile
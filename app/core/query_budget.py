@@ -0,0 +1,127 @@
+"""
+每请求 SQL 语句预算与 N+1 检测
+
+路由通过依赖声明预算：
+    @router.get("/todos", dependencies=[Depends(query_budget(2))])
+
+请求结束时（MetricsMiddleware）超出预算或出现重复语句会记警告日志；
+debug 模式下响应头带 X-DB-Queries / X-DB-Time-Ms / X-DB-Query-Budget。
+
+测试中用 capture_request_stats() 收集请求统计，再用 assert_query_budgets() 断言：
+    with capture_request_stats() as records:
+        client.get("/todos", headers=auth)
+    assert_query_budgets(records)
+"""
+
+import logging
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from app.core.config import settings
+from app.core.metrics import RequestStats, current_request_stats
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RequestRecord:
+    """一次已完成请求的数据库统计"""
+
+    method: str
+    route: str
+    stats: RequestStats
+
+    @property
+    def over_budget(self) -> bool:
+        return (
+            self.stats.budget is not None and self.stats.db_queries > self.stats.budget
+        )
+
+    @property
+    def repeated(self) -> dict[str, int]:
+        """执行次数达到 N+1 阈值的语句"""
+        threshold = settings.db_repeated_statement_threshold
+        return {sql: n for sql, n in self.stats.statements.items() if n >= threshold}
+
+
+# 测试期间活跃的收集器
+_recorders: list[list[RequestRecord]] = []
+
+
+def query_budget(max_queries: int) -> Callable[[], Awaitable[None]]:
+    """
+    声明路由的 SQL 语句数上限（依赖注入用；异步依赖，不占线程池）
+    """
+
+    async def declare() -> None:
+        stats = current_request_stats.get()
+        if stats is not None:
+            stats.budget = max_queries
+
+    return declare
+
+
+def debug_headers(stats: RequestStats) -> list[tuple[bytes, bytes]]:
+    """响应开始时已执行语句的统计头（请求结束后的提交不计入）"""
+    headers = [
+        (b"x-db-queries", str(stats.db_queries).encode()),
+        (b"x-db-time-ms", f"{stats.db_seconds * 1000:.1f}".encode()),
+    ]
+    if stats.budget is not None:
+        headers.append((b"x-db-query-budget", str(stats.budget).encode()))
+    return headers
+
+
+def check_request(method: str, route: str, stats: RequestStats) -> None:
+    """
+    请求结束时检查预算与重复语句，并交给测试收集器
+    """
+    record = RequestRecord(method, route, stats)
+    if record.over_budget:
+        logger.warning(
+            "%s %s 执行了 %d 条 SQL，超出预算 %d",
+            method,
+            route,
+            stats.db_queries,
+            stats.budget,
+        )
+    for sql, count in record.repeated.items():
+        logger.warning(
+            "%s %s 疑似 N+1：同一语句执行 %d 次: %s", method, route, count, sql
+        )
+    for records in _recorders:
+        records.append(record)
+
+
+@contextmanager
+def capture_request_stats() -> Iterator[list[RequestRecord]]:
+    """收集此期间完成的请求统计（测试用）"""
+    records: list[RequestRecord] = []
+    _recorders.append(records)
+    try:
+        yield records
+    finally:
+        _recorders.remove(records)
+
+
+def assert_query_budgets(
+    records: list[RequestRecord], allow_repeated: bool = False
+) -> None:
+    """
+    任一请求超出预算（或出现 N+1 重复语句）时抛出 AssertionError
+    """
+    problems = []
+    for record in records:
+        if record.over_budget:
+            problems.append(
+                f"{record.method} {record.route}: {record.stats.db_queries} 条 SQL，"
+                f"预算 {record.stats.budget}"
+            )
+        if not allow_repeated:
+            for sql, count in record.repeated.items():
+                problems.append(
+                    f"{record.method} {record.route}: 重复执行 {count} 次: {sql}"
+                )
+    if problems:
+        raise AssertionError("SQL 预算检查失败:\n" + "\n".join(problems))
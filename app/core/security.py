@@ -1,21 +1,32 @@
 """
 安全模块：JWT 认证、密码哈希
 """
+
+import hashlib
 import secrets
 import uuid
-from datetime import datetime, timedelta, timezone
+from collections.abc import AsyncGenerator
+from datetime import UTC, datetime, timedelta
+from functools import lru_cache
 from typing import Any
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from pydantic import BaseModel
-from sqlalchemy import select
+from sqlalchemy import Select, bindparam, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
-from app.models.database import get_async_session
+from app.core.metrics import CRYPTO_SECONDS
+from app.core.tracing import span
+from app.models.database import (
+    STICKY_COOKIE,
+    bind_user_shard,
+    get_async_session,
+    open_read_session,
+)
 
 # 密码哈希上下文
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -26,6 +37,7 @@ security = HTTPBearer()
 
 class TokenData(BaseModel):
     """JWT Token 载荷"""
+
     user_id: str
     email: str
     exp: datetime
@@ -33,26 +45,24 @@ class TokenData(BaseModel):
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """验证密码"""
-    return pwd_context.verify(plain_password, hashed_password)
+    with CRYPTO_SECONDS.labels("bcrypt_verify").time():
+        return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
     """生成密码哈希"""
-    return pwd_context.hash(password)
+    with CRYPTO_SECONDS.labels("bcrypt_hash").time():
+        return pwd_context.hash(password)
 
 
 def create_access_token(user_id: uuid.UUID, email: str) -> str:
     """
     创建 Access Token (短期)
     """
-    expire = datetime.now(timezone.utc) + timedelta(minutes=settings.access_token_expire_minutes)
-    payload = {
-        "sub": str(user_id),
-        "email": email,
-        "exp": expire,
-        "type": "access"
-    }
-    return jwt.encode(payload, settings.secret_key, algorithm=settings.algorithm)
+    expire = datetime.now(UTC) + timedelta(minutes=settings.access_token_expire_minutes)
+    payload = {"sub": str(user_id), "email": email, "exp": expire, "type": "access"}
+    with CRYPTO_SECONDS.labels("jwt_encode").time():
+        return jwt.encode(payload, settings.secret_key, algorithm=settings.algorithm)
 
 
 def create_refresh_token(user_id: uuid.UUID) -> tuple[str, str, datetime]:
@@ -61,14 +71,25 @@ def create_refresh_token(user_id: uuid.UUID) -> tuple[str, str, datetime]:
     返回: (原始token, token哈希, 过期时间)
     """
     raw_token = secrets.token_urlsafe(32)
-    token_hash = pwd_context.hash(raw_token)
-    expires_at = datetime.now(timezone.utc) + timedelta(days=settings.refresh_token_expire_days)
+    with CRYPTO_SECONDS.labels("bcrypt_hash").time():
+        token_hash = pwd_context.hash(raw_token)
+    expires_at = datetime.now(UTC) + timedelta(days=settings.refresh_token_expire_days)
     return raw_token, token_hash, expires_at
 
 
+def token_lookup(raw_token: str) -> str:
+    """
+    令牌的查找键（SHA-256 前 16 位十六进制，建索引）：按它定位到一行后再做 bcrypt 校验
+
+    令牌本身是 256 位随机数，公开查找键不降低安全性
+    """
+    return hashlib.sha256(raw_token.encode()).hexdigest()[:16]
+
+
 def verify_refresh_token(raw_token: str, token_hash: str) -> bool:
     """验证 Refresh Token"""
-    return pwd_context.verify(raw_token, token_hash)
+    with CRYPTO_SECONDS.labels("bcrypt_verify").time():
+        return pwd_context.verify(raw_token, token_hash)
 
 
 def decode_access_token(token: str) -> TokenData:
@@ -76,76 +97,162 @@ def decode_access_token(token: str) -> TokenData:
     解码并验证 Access Token
     """
     try:
-        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
-        
+        with CRYPTO_SECONDS.labels("jwt_decode").time():
+            payload = jwt.decode(
+                token, settings.secret_key, algorithms=[settings.algorithm]
+            )
+
         if payload.get("type") != "access":
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token type"
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token type"
             )
-        
+
         user_id = payload.get("sub")
         email = payload.get("email")
         exp = payload.get("exp")
-        
+
         if not user_id or not email:
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload"
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token payload"
             )
-        
+
         return TokenData(
-            user_id=user_id,
-            email=email,
-            exp=datetime.fromtimestamp(exp, tz=timezone.utc)
+            user_id=user_id, email=email, exp=datetime.fromtimestamp(exp, tz=UTC)
         )
-    
+
     except JWTError as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=f"Token validation failed: {str(e)}"
+            detail=f"Token validation failed: {str(e)}",
         )
 
 
-async def get_current_user(
+def get_token_data(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> TokenData:
+    """
+    解析访问令牌（依赖注入），并把用户 ID 记到 request.state 供中间件使用
+    """
+    with span("auth.decode_token"):
+        token_data = decode_access_token(credentials.credentials)
+    request.state.user_id = token_data.user_id
+    return token_data
+
+
+def get_user_session(
+    token_data: TokenData = Depends(get_token_data),
     db: AsyncSession = Depends(get_async_session),
-) -> Any:
+) -> AsyncSession:
     """
-    获取当前认证用户（依赖注入）
+    获取绑定到当前用户所属分片的会话（依赖注入）
+
+    与 get_async_session 是同一个请求级会话，同一请求中的其他依赖与端点拿到的都是已绑定的会话
     """
+    bind_user_shard(db, uuid.UUID(token_data.user_id))
+    return db
+
+
+async def get_read_session(
+    request: Request,
+    token_data: TokenData = Depends(get_token_data),
+    db: AsyncSession = Depends(get_user_session),
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    获取只读会话（依赖注入）：配置了副本且不在写后 stickiness 窗口内时走副本，否则复用主库会话
+    """
+    async with open_read_session(
+        token_data.user_id, request.cookies.get(STICKY_COOKIE)
+    ) as read_db:
+        yield read_db if read_db is not None else db
+
+
+@lru_cache
+def user_by_id_stmt() -> Select:
+    # 每个请求都要执行：构造一次，缓存键随语句对象记忆，编译结果命中引擎缓存
     from app.models.orm import User
-    
-    token = credentials.credentials
-    token_data = decode_access_token(token)
-    
-    # 查询用户
+
+    return select(User).where(User.id == bindparam("user_id"))
+
+
+async def _load_user(db: AsyncSession, token_data: TokenData) -> Any:
     result = await db.execute(
-        select(User).where(User.id == uuid.UUID(token_data.user_id))
+        user_by_id_stmt(), {"user_id": uuid.UUID(token_data.user_id)}
     )
-    user = result.scalar_one_or_none()
-    
+    return result.scalar_one_or_none()
+
+
+def _check_user(user: Any) -> Any:
     if not user:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found"
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
         )
-    
+
     if not user.is_active:
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="User account is disabled"
+            status_code=status.HTTP_403_FORBIDDEN, detail="User account is disabled"
         )
-    
+
     return user
 
 
+async def get_current_user(
+    token_data: TokenData = Depends(get_token_data),
+    db: AsyncSession = Depends(get_user_session),
+) -> Any:
+    """
+    获取当前认证用户（依赖注入）
+    """
+    with span("auth.get_current_user"):
+        return _check_user(await _load_user(db, token_data))
+
+
+async def get_current_user_for_read(
+    token_data: TokenData = Depends(get_token_data),
+    read_db: AsyncSession = Depends(get_read_session),
+    db: AsyncSession = Depends(get_user_session),
+) -> Any:
+    """
+    获取当前认证用户（只读端点用，在副本上查询）
+
+    刚注册的用户可能还没复制到副本，查不到时回主库确认
+    """
+    with span("auth.get_current_user", replica=read_db is not db):
+        user = await _load_user(read_db, token_data)
+        if user is None and read_db is not db:
+            user = await _load_user(db, token_data)
+        return _check_user(user)
+
+
+async def get_current_admin(
+    token_data: TokenData = Depends(get_token_data),
+    user: Any = Depends(get_current_user),
+    db: AsyncSession = Depends(get_user_session),
+) -> TokenData:
+    """
+    要求当前用户是管理员（依赖注入）
+
+    按数据库中的用户判断，不看令牌里的邮箱：账号启用、邮箱已验证，
+    且存储的邮箱（注册时已规范化）与 settings.admin_emails 精确匹配
+    """
+    admins = {email.strip().lower() for email in settings.admin_emails}
+    is_admin = user.is_verified and user.email in admins
+    # 管理端点（如采样分析）可能持续数十秒：校验完立即归还连接
+    await db.rollback()
+    if not is_admin:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="需要管理员权限"
+        )
+    return token_data
+
+
 def create_password_reset_token() -> tuple[str, str, datetime]:
     """
     创建密码重置令牌
     返回: (原始token, token哈希, 过期时间)
     """
     raw_token = secrets.token_urlsafe(32)
-    token_hash = pwd_context.hash(raw_token)
-    expires_at = datetime.now(timezone.utc) + timedelta(hours=1)  # 1小时有效
+    with CRYPTO_SECONDS.labels("bcrypt_hash").time():
+        token_hash = pwd_context.hash(raw_token)
+    expires_at = datetime.now(UTC) + timedelta(hours=1)  # 1小时有效
     return raw_token, token_hash, expires_at
@@ -0,0 +1,221 @@
+"""
+慢查询日志
+
+耗时超过 settings.slow_query_ms 的语句以 JSON 行写入滚动日志文件，包含：
+    - SQL 文本与脱敏后的绑定参数（字符串、二进制只保留长度）
+    - 发起查询的业务代码位置（app 包内、models / utils 以外的最内层调用）
+    - 按 slow_query_explain_sample_rate 采样，另取连接执行的 EXPLAIN 执行计划，
+      以及计划中的顺序扫描表（todos / pomodoro_sessions 出现顺序扫描时另记警告）；
+      EXPLAIN 在事务中执行且总是回滚，只读语句才带 ANALYZE
+
+查找顺序扫描：
+    jq -c 'select(.seq_scans | length > 0) | {caller, seq_scans}' logs/slow_query.log
+"""
+
+import asyncio
+import json
+import logging
+import random
+import sys
+import uuid
+from datetime import UTC, date, datetime, time, timedelta
+from decimal import Decimal
+from types import FrameType
+from typing import Any
+
+from greenlet import getcurrent
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.sql.expression import CTE, CompoundSelect, Select
+
+from app.core.config import settings
+from app.utils.logfile import rotating_file_logger
+
+logger = logging.getLogger(__name__)
+
+# 出现顺序扫描时额外告警的表
+WATCHED_TABLES = frozenset({"todos", "pomodoro_sessions"})
+
+# 定位调用方时跳过的模块（数据库基础设施本身）
+_SKIP_MODULES = ("app.models.", "app.utils.", __name__)
+
+# 原样记录的参数类型，其余按类型与长度脱敏
+_PLAIN_TYPES = (bool, int, float, Decimal, uuid.UUID, datetime, date, time, timedelta)
+
+# EXPLAIN 等锁的上限：采样分析不应长时间占用连接
+_EXPLAIN_LOCK_TIMEOUT = "500ms"
+
+# 进行中的 EXPLAIN 任务（持有引用，避免被回收）
+_explain_tasks: set[asyncio.Task] = set()
+
+
+def _get_file_logger() -> logging.Logger:
+    # 首次记录时才创建日志目录与文件
+    return rotating_file_logger(
+        "app.slow_query",
+        settings.slow_query_log_file,
+        settings.slow_query_log_max_bytes,
+        settings.slow_query_log_backups,
+    )
+
+
+def redact(value: Any) -> Any:
+    """
+    脱敏绑定参数：数值、UUID、时间原样保留，字符串与二进制只保留类型和长度
+    """
+    if value is None or isinstance(value, _PLAIN_TYPES):
+        return value
+    if isinstance(value, str):
+        return f"<str:{len(value)}>"
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f"<bytes:{len(value)}>"
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return f"<{type(value).__name__}>"
+
+
+def _caller_frame() -> FrameType | None:
+    # 事件在 SQLAlchemy 的子 greenlet 中触发，业务协程的调用栈挂在父 greenlet 上
+    current = getcurrent()
+    if current.parent is not None and current.parent.gr_frame is not None:
+        return current.parent.gr_frame
+    return sys._getframe(1)
+
+
+def find_caller() -> str:
+    """
+    发起查询的业务代码位置，形如 app.services.todo_service.get_todos:42
+    """
+    frame = _caller_frame()
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module.startswith("app.") and not module.startswith(_SKIP_MODULES):
+            return f"{module}.{frame.f_code.co_name}:{frame.f_lineno}"
+        frame = frame.f_back
+    return "unknown"
+
+
+def _seq_scans(plan: Any) -> list[str]:
+    # 遍历 JSON 执行计划，收集顺序扫描的表
+    tables: list[str] = []
+
+    def walk(node: dict[str, Any]) -> None:
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name"):
+            tables.append(node["Relation Name"])
+        for child in node.get("Plans", ()):
+            walk(child)
+
+    for entry in plan:
+        walk(entry["Plan"])
+    return tables
+
+
+def is_read_only(context: Any) -> bool:
+    """
+    按编译结果判断语句是否只读：INSERT / UPDATE / DELETE 以及 CTE 中嵌套的写语句都不算；
+    文本 SQL 无从判断，按写语句处理
+    """
+    if context.isinsert or context.isupdate or context.isdelete:
+        return False
+    statement = getattr(context.compiled, "statement", None)
+    if not isinstance(statement, (Select, CompoundSelect)):
+        return False
+    for node in visitors.iterate(statement):
+        # 只引用了 CTE 的列时，遍历不会经过 CTE 本身，从列所属的表找回
+        table = getattr(node, "table", None)
+        if isinstance(node, UpdateBase) or (
+            isinstance(table, CTE) and isinstance(table.element, UpdateBase)
+        ):
+            return False
+    return True
+
+
+async def _explain(
+    target: Engine,
+    statement: str,
+    parameters: Any,
+    analyze: bool,
+    record: dict[str, Any],
+) -> None:
+    # EXPLAIN ANALYZE 会真正执行语句：只对只读语句使用；且总在事务中执行并回滚，
+    # 即便误判也不会留下写入
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    try:
+        async with AsyncEngine(target).connect() as conn:
+            raw = await conn.get_raw_connection()
+            driver = raw.driver_connection
+            transaction = driver.transaction()
+            await transaction.start()
+            try:
+                await driver.execute(
+                    f"SET LOCAL lock_timeout = '{_EXPLAIN_LOCK_TIMEOUT}'"
+                )
+                plan = await driver.fetchval(
+                    f"EXPLAIN ({options}) {statement}", *(parameters or ())
+                )
+            finally:
+                await transaction.rollback()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        record["explain"] = plan
+        record["seq_scans"] = _seq_scans(plan)
+    except Exception as exc:
+        record["explain_error"] = repr(exc)
+    _write(record)
+
+
+def _write(record: dict[str, Any]) -> None:
+    _get_file_logger().info(json.dumps(record, ensure_ascii=False, default=str))
+    watched = WATCHED_TABLES.intersection(record.get("seq_scans", ()))
+    if watched:
+        logger.warning(
+            "慢查询在 %s 上顺序扫描（%.1f ms，%s）",
+            ", ".join(sorted(watched)),
+            record["duration_ms"],
+            record["caller"],
+        )
+
+
+def record_slow_query(
+    conn: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    seconds: float,
+    executemany: bool,
+) -> None:
+    """
+    记录一条慢查询（由 after_cursor_execute 事件调用）
+    """
+    record: dict[str, Any] = {
+        "ts": datetime.now(UTC).isoformat(),
+        "duration_ms": round(seconds * 1000, 1),
+        "caller": find_caller(),
+        "statement": statement,
+    }
+    if executemany:
+        record["batch_size"] = len(parameters)
+        record["parameters"] = redact(parameters[0]) if parameters else None
+    else:
+        record["parameters"] = redact(parameters)
+
+    sampled = (
+        not executemany and random.random() < settings.slow_query_explain_sample_rate
+    )
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        sampled = False
+    if not sampled:
+        _write(record)
+        return
+
+    params = tuple(parameters) if parameters else ()
+    task = loop.create_task(
+        _explain(conn.engine, statement, params, is_read_only(context), record)
+    )
+    _explain_tasks.add(task)
+    task.add_done_callback(_explain_tasks.discard)
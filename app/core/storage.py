@@ -0,0 +1,284 @@
+"""
+对象存储模块：存储后端抽象，腾讯云 COS 与本地文件系统两种实现
+"""
+
+import hashlib
+import hmac
+import mimetypes
+import os
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import IO, Any
+from urllib.parse import quote, urlencode
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.tracing import traced
+
+_MB = 1024 * 1024
+
+
+@dataclass
+class ObjectInfo:
+    """对象元信息"""
+
+    size: int
+    content_type: str | None
+
+
+class StorageBackend(ABC):
+    """存储后端接口（同步 SDK 的调用由实现方放到线程池）"""
+
+    @abstractmethod
+    def public_url(self, key: str) -> str:
+        """对象的公开访问 URL"""
+
+    @abstractmethod
+    def presign_put(self, key: str, content_type: str, expires: int) -> str:
+        """生成限时有效的直传 PUT URL"""
+
+    @abstractmethod
+    async def upload_fileobj(
+        self,
+        fileobj: IO[bytes],
+        key: str,
+        content_type: str,
+        size: int,
+        cache_control: str | None = None,
+    ) -> None:
+        """流式上传文件对象"""
+
+    @abstractmethod
+    async def head(self, key: str) -> ObjectInfo | None:
+        """读取对象元信息，不存在返回 None"""
+
+    @abstractmethod
+    async def read(self, key: str, max_bytes: int) -> bytes:
+        """读取对象内容（最多 max_bytes + 1 字节，供调用方判断超限）"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """删除对象（不存在时忽略）"""
+
+    async def exists(self, key: str) -> bool:
+        return await self.head(key) is not None
+
+
+class CosStorage(StorageBackend):
+    """
+    COS 存储客户端
+
+    每个 worker 复用一个 CosS3Client（内部 HTTP 连接池保持长连接）；
+    SDK 是同步实现，所有网络调用都放到线程池，避免阻塞事件循环。
+    """
+
+    def __init__(self) -> None:
+        self._client: Any = None
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            # SDK 未安装时抛出 ImportError，由调用方处理
+            from qcloud_cos import CosConfig, CosS3Client
+
+            config = CosConfig(
+                Region=settings.cos_region,
+                SecretId=settings.cos_secret_id,
+                SecretKey=settings.cos_secret_key,
+                Timeout=settings.cos_timeout_seconds,
+                PoolConnections=settings.cos_pool_size,
+                PoolMaxSize=settings.cos_pool_size,
+            )
+            self._client = CosS3Client(config)
+        return self._client
+
+    def public_url(self, key: str) -> str:
+        return f"https://{settings.cos_bucket}.cos.{settings.cos_region}.myqcloud.com/{key}"
+
+    def presign_put(self, key: str, content_type: str, expires: int) -> str:
+        # 纯本地签名计算，不发网络请求
+        return self.client.get_presigned_url(
+            Bucket=settings.cos_bucket,
+            Key=key,
+            Method="PUT",
+            Expired=expires,
+            Headers={"Content-Type": content_type},
+        )
+
+    @traced("cos.upload")
+    async def upload_fileobj(
+        self,
+        fileobj: IO[bytes],
+        key: str,
+        content_type: str,
+        size: int,
+        cache_control: str | None = None,
+    ) -> None:
+        """
+        流式上传文件对象（不整体读入内存），大文件走分块上传
+        """
+        await run_in_threadpool(
+            self._upload, fileobj, key, content_type, size, cache_control
+        )
+
+    @traced("cos.head")
+    async def head(self, key: str) -> ObjectInfo | None:
+        return await run_in_threadpool(self._head, key)
+
+    @traced("cos.read")
+    async def read(self, key: str, max_bytes: int) -> bytes:
+        return await run_in_threadpool(self._read, key, max_bytes)
+
+    @traced("cos.delete")
+    async def delete(self, key: str) -> None:
+        await run_in_threadpool(
+            self.client.delete_object, Bucket=settings.cos_bucket, Key=key
+        )
+
+    def _upload(
+        self,
+        fileobj: IO[bytes],
+        key: str,
+        content_type: str,
+        size: int,
+        cache_control: str | None,
+    ) -> None:
+        fileobj.seek(0)
+        extra = {"CacheControl": cache_control} if cache_control else {}
+        if size < settings.cos_multipart_threshold_bytes:
+            self.client.put_object(
+                Bucket=settings.cos_bucket,
+                Body=fileobj,
+                Key=key,
+                ContentType=content_type,
+                **extra,
+            )
+        else:
+            self.client.upload_file_from_buffer(
+                Bucket=settings.cos_bucket,
+                Key=key,
+                Body=fileobj,
+                PartSize=max(1, settings.cos_multipart_part_bytes // _MB),
+                MAXThread=settings.cos_multipart_threads,
+                ContentType=content_type,
+                **extra,
+            )
+
+    def _head(self, key: str) -> ObjectInfo | None:
+        from qcloud_cos.cos_exception import CosServiceError
+
+        try:
+            headers = self.client.head_object(Bucket=settings.cos_bucket, Key=key)
+        except CosServiceError as e:
+            if e.get_status_code() == 404:
+                return None
+            raise
+        return ObjectInfo(
+            size=int(headers.get("Content-Length", 0)),
+            content_type=headers.get("Content-Type"),
+        )
+
+    def _read(self, key: str, max_bytes: int) -> bytes:
+        response = self.client.get_object(Bucket=settings.cos_bucket, Key=key)
+        return response["Body"].get_raw_stream().read(max_bytes + 1)
+
+
+class LocalStorage(StorageBackend):
+    """
+    本地文件系统存储（开发与测试用，不依赖 COS）
+
+    直传 URL 指向本服务的 PUT /storage/upload/{key}，用 HMAC 签名校验；
+    文件通过 /storage/files 静态路由对外提供。
+    """
+
+    def __init__(self, root: str, base_url: str):
+        self.root = os.path.abspath(root)
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(self.root, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"invalid key: {key}")
+        return path
+
+    def public_url(self, key: str) -> str:
+        return f"{self.base_url}/storage/files/{quote(key)}"
+
+    def presign_put(self, key: str, content_type: str, expires: int) -> str:
+        expires_at = int(time.time()) + expires
+        query = urlencode(
+            {
+                "content_type": content_type,
+                "expires": expires_at,
+                "signature": self.sign(key, content_type, expires_at),
+            }
+        )
+        return f"{self.base_url}/storage/upload/{quote(key)}?{query}"
+
+    def sign(self, key: str, content_type: str, expires_at: int) -> str:
+        message = f"{key}\n{content_type}\n{expires_at}".encode()
+        return hmac.new(
+            settings.secret_key.encode(), message, hashlib.sha256
+        ).hexdigest()
+
+    def verify(
+        self, key: str, content_type: str, expires_at: int, signature: str
+    ) -> bool:
+        if expires_at < time.time():
+            return False
+        return hmac.compare_digest(self.sign(key, content_type, expires_at), signature)
+
+    async def upload_fileobj(
+        self,
+        fileobj: IO[bytes],
+        key: str,
+        content_type: str,
+        size: int,
+        cache_control: str | None = None,
+    ) -> None:
+        await run_in_threadpool(self._write, fileobj, key)
+
+    async def head(self, key: str) -> ObjectInfo | None:
+        try:
+            size = os.path.getsize(self.path_for(key))
+        except FileNotFoundError:
+            return None
+        return ObjectInfo(size=size, content_type=mimetypes.guess_type(key)[0])
+
+    async def read(self, key: str, max_bytes: int) -> bytes:
+        return await run_in_threadpool(self._read, key, max_bytes)
+
+    async def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+    def _write(self, fileobj: IO[bytes], key: str) -> None:
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fileobj.seek(0)
+        # 先写临时文件再改名，读者不会看到写了一半的对象
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            while chunk := fileobj.read(_MB):
+                f.write(chunk)
+        os.replace(tmp_path, path)
+
+    def _read(self, key: str, max_bytes: int) -> bytes:
+        with open(self.path_for(key), "rb") as f:
+            return f.read(max_bytes + 1)
+
+
+@lru_cache
+def get_storage() -> StorageBackend:
+    """每个 worker 一个存储后端实例（按 settings.storage_backend 选择）"""
+    if settings.storage_backend == "local":
+        return LocalStorage(
+            settings.storage_local_root, settings.storage_public_base_url
+        )
+    return CosStorage()
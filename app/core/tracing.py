@@ -0,0 +1,272 @@
+"""
+轻量链路追踪
+
+请求入口（TracingMiddleware）按采样率决定是否追踪；上游带 W3C traceparent 时沿用其 trace ID，
+并在 settings.trace_parent_based 开启时跟随其采样标记（默认关闭：外部请求可伪造该标记）。
+被采样的请求在以下边界记录 span：
+    - 请求本身（根 span，名称为 "方法 路由"）
+    - 认证依赖（令牌解析、get_current_user）
+    - 服务方法（@trace_methods 标注的服务类的公开异步方法）
+    - SQL 语句（数据库引擎事件）
+    - 外部调用（COS 对象存储）
+
+未采样的请求只多一次上下文变量读取，开销可忽略。请求结束时整条链路一次交给导出器；
+默认 jsonl 导出器每个 span 写一行到本地滚动文件，无需收集端：
+    jq -c 'select(.trace_id == "<trace id>")' logs/traces.jsonl
+"""
+
+import importlib
+import inspect
+import json
+import logging
+import random
+import re
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from functools import wraps
+from typing import Any, TypeVar
+
+from app.core.config import settings
+from app.utils.logfile import rotating_file_logger
+
+logger = logging.getLogger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+C = TypeVar("C", bound=type)
+
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+_TRACE_ID = re.compile(r"^[0-9a-f]{32}$")
+_ZERO_TRACE_ID = "0" * 32
+_ZERO_SPAN_ID = "0" * 16
+
+
+@dataclass(slots=True)
+class Span:
+    """一个已开始的 span；start 为 Unix 时间戳（秒），duration 结束时填写（秒）"""
+
+    trace_id: str
+    span_id: str
+    parent_id: str | None
+    name: str
+    start: float
+    duration: float = 0.0
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+    _perf_start: float = field(default=0.0, repr=False)
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        del data["_perf_start"]
+        return data
+
+
+class SpanExporter:
+    """导出器接口：请求结束时以整条链路调用一次"""
+
+    def export(self, spans: list[Span]) -> None:
+        raise NotImplementedError
+
+
+class JsonLinesExporter(SpanExporter):
+    """每个 span 一行 JSON，写入本地滚动文件"""
+
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        self._logger = rotating_file_logger("app.traces", path, max_bytes, backups)
+
+    def export(self, spans: list[Span]) -> None:
+        for span in spans:
+            record = span.to_dict()
+            record["service"] = settings.app_name
+            self._logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+# 当前链路已结束的 span（同一请求内的子任务、线程池共享同一个列表）
+_finished: ContextVar[list[Span] | None] = ContextVar("finished_spans", default=None)
+_exporter: SpanExporter | None = None
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits) or 1:0{bits // 4}x}"
+
+
+def get_exporter() -> SpanExporter:
+    """
+    按 settings.trace_exporter 创建导出器：jsonl，或 "模块:工厂" 形式的自定义导出器
+    """
+    global _exporter
+    if _exporter is None:
+        if settings.trace_exporter == "jsonl":
+            _exporter = JsonLinesExporter(
+                settings.trace_log_file,
+                settings.trace_log_max_bytes,
+                settings.trace_log_backups,
+            )
+        else:
+            module, _, attr = settings.trace_exporter.partition(":")
+            _exporter = getattr(importlib.import_module(module), attr)()
+    return _exporter
+
+
+def set_exporter(exporter: SpanExporter | None) -> None:
+    """替换导出器（None 表示下次按配置重新创建）"""
+    global _exporter
+    _exporter = exporter
+
+
+def parse_traceparent(value: str | None) -> tuple[str, str, bool] | None:
+    """
+    解析 W3C traceparent，返回 (trace ID, 上游 span ID, 是否已采样)；格式无效时返回 None
+    """
+    if not value:
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == _ZERO_TRACE_ID or parent_id == _ZERO_SPAN_ID:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+
+def current_span() -> Span | None:
+    return _current_span.get()
+
+
+def _start(
+    name: str, trace_id: str, parent_id: str | None, attributes: dict[str, Any]
+) -> Span:
+    return Span(
+        trace_id=trace_id,
+        span_id=_new_id(64),
+        parent_id=parent_id,
+        name=name,
+        start=time.time(),
+        attributes=attributes,
+        _perf_start=time.perf_counter(),
+    )
+
+
+@contextmanager
+def root_span(
+    name: str, traceparent: str | None = None, request_id: str | None = None
+) -> Iterator[Span | None]:
+    """
+    开始一条链路（请求入口用）；未被采样时产出 None
+
+    上游 traceparent 有效时沿用其 trace ID；否则使用格式合法的 X-Request-ID（nginx 的 $request_id）
+    """
+    parent = parse_traceparent(traceparent)
+    if parent is not None and settings.trace_parent_based:
+        sampled = parent[2]
+    else:
+        sampled = random.random() < settings.trace_sample_rate
+    if not sampled:
+        yield None
+        return
+
+    if parent is not None:
+        trace_id, parent_id = parent[0], parent[1]
+    elif request_id and _TRACE_ID.match(request_id):
+        trace_id, parent_id = request_id, None
+    else:
+        trace_id, parent_id = _new_id(128), None
+
+    root = _start(name, trace_id, parent_id, {})
+    finished: list[Span] = []
+    span_token = _current_span.set(root)
+    finished_token = _finished.set(finished)
+    try:
+        yield root
+    except BaseException as exc:
+        root.error = repr(exc)
+        raise
+    finally:
+        root.duration = time.perf_counter() - root._perf_start
+        _current_span.reset(span_token)
+        _finished.reset(finished_token)
+        try:
+            get_exporter().export([root, *finished])
+        except Exception:
+            logger.exception("链路导出失败: %s", trace_id)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    """
+    在当前链路内记录一个子 span；当前请求未被采样时什么也不做并产出 None
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = _start(name, parent.trace_id, parent.span_id, attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as exc:
+        child.error = repr(exc)
+        raise
+    finally:
+        child.duration = time.perf_counter() - child._perf_start
+        _current_span.reset(token)
+        finished = _finished.get()
+        if finished is not None:
+            finished.append(child)
+
+
+def record_span(name: str, seconds: float, **attributes: Any) -> None:
+    """
+    记录一个刚结束、耗时为 seconds 的子 span（事件回调等无法包裹执行过程的场合）
+    """
+    parent = _current_span.get()
+    finished = _finished.get()
+    if parent is None or finished is None:
+        return
+    child = _start(name, parent.trace_id, parent.span_id, attributes)
+    child.start -= seconds
+    child.duration = seconds
+    finished.append(child)
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """
+    函数装饰器：在被采样的请求中为每次调用记录 span（支持同步与异步函数）
+    """
+
+    def decorate(fn: F) -> F:
+        if inspect.iscoroutinefunction(fn):
+
+            @wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                if _current_span.get() is None:
+                    return await fn(*args, **kwargs)
+                with span(name):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _current_span.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def trace_methods(cls: C) -> C:
+    """
+    类装饰器：为类中所有公开的异步方法记录 span，名称为 "类名.方法名"
+    """
+    for attr, member in list(vars(cls).items()):
+        if not attr.startswith("_") and inspect.iscoroutinefunction(member):
+            setattr(cls, attr, traced(f"{cls.__name__}.{attr}")(member))
+    return cls
@@ -0,0 +1,75 @@
+"""
+启动预热：让 worker 的首批请求不再承担建连、加载 bcrypt、编译 SQL 与生成 OpenAPI 的开销
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.core.config import settings
+from app.core.security import get_password_hash, user_by_id_stmt
+from app.models.database import open_shard_session, shard_router
+from app.services.pomodoro_service import SETTINGS_BY_USER
+from app.services.todo_service import TODOS_BY_USER
+
+logger = logging.getLogger(__name__)
+
+# 预热查询用的占位用户（不存在的 ID，只读不写）
+_WARMUP_USER_ID = uuid.UUID(int=0)
+
+
+async def _open_connections(target: AsyncEngine, count: int) -> None:
+    # 同时持有 count 个连接，归还后留在池中
+    async def hold() -> None:
+        async with target.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(hold() for _ in range(count)))
+
+
+async def _warm_statements(shard: int) -> None:
+    # 编译热点语句进引擎缓存，并在一个连接上创建预处理语句
+    params = {"user_id": _WARMUP_USER_ID}
+    async with open_shard_session(shard) as db:
+        for stmt in (user_by_id_stmt(), TODOS_BY_USER, SETTINGS_BY_USER):
+            await db.execute(stmt, params)
+
+
+async def warm_up(app: FastAPI) -> dict[str, float]:
+    """
+    执行各项预热，返回每项耗时（秒）；数据库预热失败只记日志，不阻止启动
+    """
+    timings: dict[str, float] = {}
+
+    start = time.perf_counter()
+    app.openapi()
+    timings["openapi"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # 首次调用加载 bcrypt 后端
+    await run_in_threadpool(get_password_hash, "warmup")
+    timings["bcrypt"] = time.perf_counter() - start
+
+    connections = min(settings.db_warmup_connections, settings.db_pool_size)
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(
+            *(_open_connections(target, connections) for target in shard_router.engines)
+        )
+        timings["db_pool"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(_warm_statements(shard) for shard in range(len(shard_router.engines)))
+        )
+        timings["statements"] = time.perf_counter() - start
+    except Exception:
+        logger.exception("数据库预热失败，首批请求将按需建立连接")
+
+    return timings
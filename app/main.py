@@ -1,27 +1,106 @@
+import asyncio
+import contextlib
+import logging
+from contextlib import asynccontextmanager
+
 from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.staticfiles import StaticFiles
 
 from app.api.v1.api import api_router
+from app.core.cache_bus import cache_bus
 from app.core.config import settings
-from app.core.middleware import setup_cors
-from app.models.schemas import HealthResponse, MessageResponse
+from app.core.metrics import render_metrics
+from app.core.middleware import (
+    in_flight,
+    setup_body_limits,
+    setup_cors,
+    setup_in_flight,
+    setup_metrics,
+    setup_read_your_writes,
+    setup_tracing,
+)
+from app.core.storage import LocalStorage, get_storage
+from app.core.warmup import warm_up
+from app.models.database import (
+    close_db,
+    pool_status,
+    refresh_shard_overrides,
+    run_shard_override_refresh,
+    shard_router,
+)
+from app.models.schemas import HealthResponse, MessageResponse, PoolStatsResponse
+from app.services.leaderboard_service import run_leaderboard_prune
+from app.services.pomodoro_service import session_write_buffer
+from app.utils.images import shutdown_image_pool
 
 # 加载环境变量
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    应用生命周期
+
+    启动：加载分片迁移记录、预热（连接池、bcrypt、热点语句、OpenAPI）、启动后台任务
+    （迁移记录刷新、排行榜过期汇总清理）
+    关闭：等待进行中的请求、写完缓冲数据、停止后台任务、关闭连接池
+    """
+    background: list[asyncio.Task] = []
+    if shard_router.enabled:
+        # 先同步加载一次迁移记录，避免首批请求按哈希环路由到迁移前的分片
+        await refresh_shard_overrides()
+        background.append(asyncio.create_task(run_shard_override_refresh()))
+    timings = await warm_up(app)
+    logger.info(
+        "预热完成: %s", {name: round(seconds, 3) for name, seconds in timings.items()}
+    )
+    cache_bus.start()
+    if settings.pomodoro_write_behind:
+        session_write_buffer.start()
+    if settings.leaderboard_prune_interval_seconds > 0:
+        background.append(asyncio.create_task(run_leaderboard_prune()))
+    yield
+    if not await in_flight.drain(settings.shutdown_drain_seconds):
+        logger.warning("关闭时仍有 %d 个请求未完成", in_flight.count)
+    await session_write_buffer.stop()
+    await cache_bus.stop()
+    for task in background:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    shutdown_image_pool()
+    await close_db()
+
+
 # 创建FastAPI应用
 app = FastAPI(
     title=settings.app_name,
     version=settings.app_version,
     debug=settings.debug,
+    lifespan=lifespan,
 )
 
-# 设置中间件
+# 设置中间件（后添加的在外层；CORS 在其余中间件外层保证错误响应也带跨域头，
+# 根 span 包住指标与其余中间件，请求计数最外层）
+setup_read_your_writes(app)
+setup_body_limits(app)
 setup_cors(app)
+setup_metrics(app)
+setup_tracing(app)
+setup_in_flight(app)
 
 # 注册路由
 app.include_router(api_router)
 
+# 本地存储后端：对外提供已上传的文件
+_storage = get_storage()
+if isinstance(_storage, LocalStorage):
+    app.mount("/storage/files", StaticFiles(directory=_storage.root), name="storage")
+
 
 @app.get("/", response_model=HealthResponse)
 async def health_check():
@@ -33,6 +112,23 @@ async def health_check():
     )
 
 
+@app.get("/health/pool", response_model=PoolStatsResponse)
+async def pool_stats():
+    """
+    数据库连接池状态（当前 worker）
+    """
+    return PoolStatsResponse(**pool_status())
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """
+    Prometheus 指标（多进程模式下汇总所有 worker；读共享目录，放在线程池执行）
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/api/", response_model=MessageResponse)
 async def read_root():
     """
@@ -2,29 +2,471 @@
 数据库连接和会话管理模块
 使用 SQLAlchemy 2.0 async 风格
 """
-from collections.abc import AsyncGenerator
 
-from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import DeclarativeBase
+import asyncio
+import hashlib
+import itertools
+import logging
+import time
+import uuid
+from bisect import bisect
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable
+from contextlib import asynccontextmanager
+from typing import Any, TypeVar
+
+from sqlalchemy import event, text
+from sqlalchemy.engine.default import CACHE_HIT, CACHE_MISS
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.orm import DeclarativeBase, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.requests import Request
 
 from app.core.config import settings
+from app.core.metrics import (
+    DB_POOL_CHECKED_OUT,
+    DB_POOL_CHECKOUT_WAIT,
+    DB_POOL_CONNECTS,
+    DB_POOL_INVALIDATIONS,
+    DB_POOL_SIZE,
+    Histogram,
+    current_request_stats,
+)
+from app.core.slow_query import record_slow_query
+from app.core.tracing import record_span
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# session.info 中记录分片序号的键
+SHARD_INFO_KEY = "shard"
+# session.info 中的键：当前事务是否有写入、提交后执行的回调
+_WRITES_KEY = "has_writes"
+_AFTER_COMMIT_KEY = "after_commit"
+
+# 写请求后下发的 Cookie：值为 stickiness 窗口截止时间（epoch 秒）
+STICKY_COOKIE = "th_rw"
+
+
+class PoolMetrics:
+    """连接池指标（每个 worker 一份）"""
+
+    def __init__(self) -> None:
+        self.checkout_wait = Histogram()
+        self.connects = 0
+        self.invalidations = 0
+
+
+pool_metrics = PoolMetrics()
+
+
+class StatementCacheMetrics:
+    """SQLAlchemy 编译缓存命中统计（每个 worker 一份）"""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0  # 无缓存键或禁用缓存的语句，每次都重新编译
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses + self.uncached
+        return self.hits / total if total else 0.0
+
+
+statement_cache_metrics = StatementCacheMetrics()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    记录连接获取等待时间的连接池（含池满排队与新建连接的耗时）
+    """
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            pool_metrics.checkout_wait.observe(waited)
+            DB_POOL_CHECKOUT_WAIT.observe(waited)
+
+
+def _unique_statement_name() -> str:
+    return f"__asyncpg_{uuid.uuid4().hex}__"
+
+
+def _connect_args() -> dict[str, Any]:
+    # pgbouncer 需要在 ignore_startup_parameters 中放行 statement_timeout
+    server_settings = {"application_name": settings.app_name}
+    if settings.db_statement_timeout_ms > 0:
+        server_settings["statement_timeout"] = str(settings.db_statement_timeout_ms)
+    connect_args: dict[str, Any] = {
+        "server_settings": server_settings,
+        "prepared_statement_cache_size": settings.db_prepared_statement_cache_size,
+    }
+    if settings.db_pgbouncer:
+        # 池化代理下同一服务端连接会轮换给不同客户端，缓存的预处理语句可能不存在或重名
+        connect_args["prepared_statement_cache_size"] = 0
+        connect_args["statement_cache_size"] = 0
+    if settings.db_pgbouncer or settings.db_prepared_statement_names == "unique":
+        connect_args["prepared_statement_name_func"] = _unique_statement_name
+    return connect_args
+
+
+def create_engine(url: str) -> AsyncEngine:
+    """
+    按 Settings 中的连接池配置创建异步引擎
+    """
+    new_engine = create_async_engine(
+        url,
+        echo=settings.debug,  # 开发模式下打印 SQL
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_recycle=settings.db_pool_recycle,
+        # always: 每次取连接前检查；none: 依赖 pool_recycle 与断线后自动失效，省一次往返
+        pool_pre_ping=settings.db_pool_pre_ping == "always",
+        query_cache_size=settings.db_compiled_cache_size,
+        connect_args=_connect_args(),
+    )
+    pool_events = new_engine.sync_engine.pool
+    event.listen(pool_events, "connect", _on_connect)
+    event.listen(pool_events, "invalidate", _on_invalidate)
+    event.listen(pool_events, "checkout", _on_checkout)
+    event.listen(pool_events, "checkin", _on_checkin)
+    event.listen(new_engine.sync_engine, "before_cursor_execute", _on_cursor_execute)
+    event.listen(new_engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    DB_POOL_SIZE.inc(settings.db_pool_size)
+    return new_engine
+
+
+def _on_connect(dbapi_connection: Any, connection_record: Any) -> None:
+    pool_metrics.connects += 1
+    DB_POOL_CONNECTS.inc()
+
+
+def _on_invalidate(
+    dbapi_connection: Any, connection_record: Any, exception: Any
+) -> None:
+    pool_metrics.invalidations += 1
+    DB_POOL_INVALIDATIONS.inc()
+
+
+def _on_checkout(
+    dbapi_connection: Any, connection_record: Any, connection_proxy: Any
+) -> None:
+    DB_POOL_CHECKED_OUT.inc()
+
+
+def _on_checkin(dbapi_connection: Any, connection_record: Any) -> None:
+    DB_POOL_CHECKED_OUT.dec()
+
+
+def _on_cursor_execute(
+    conn: Any,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    if context is not None:
+        context._query_start = time.perf_counter()
+    cache_hit = getattr(context, "cache_hit", None)
+    if cache_hit is CACHE_HIT:
+        statement_cache_metrics.hits += 1
+    elif cache_hit is CACHE_MISS:
+        statement_cache_metrics.misses += 1
+    elif context is not None and context.compiled is not None:
+        statement_cache_metrics.uncached += 1
+
+
+def _after_cursor_execute(
+    conn: Any,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    if context is None:
+        return
+    elapsed = time.perf_counter() - context._query_start
+    if settings.slow_query_ms and elapsed * 1000 >= settings.slow_query_ms:
+        record_slow_query(conn, statement, parameters, context, elapsed, executemany)
+    record_span("db.query", elapsed, statement=statement, executemany=executemany)
+    stats = current_request_stats.get()
+    if stats is None:
+        return
+    stats.db_queries += 1
+    stats.db_seconds += elapsed
+    stats.statements[statement] += 1
+
+
+def pool_status(target: AsyncEngine | None = None) -> dict[str, Any]:
+    """
+    连接池实时状态
+    """
+    pool = (target or engine).sync_engine.pool
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": settings.db_max_overflow,
+        "connects": pool_metrics.connects,
+        "invalidations": pool_metrics.invalidations,
+        "checkout_wait_count": pool_metrics.checkout_wait.count,
+        "checkout_wait_sum": pool_metrics.checkout_wait.sum,
+        "checkout_wait_buckets": pool_metrics.checkout_wait.cumulative(),
+        "statement_cache_hits": statement_cache_metrics.hits,
+        "statement_cache_misses": statement_cache_metrics.misses,
+        "statement_cache_uncached": statement_cache_metrics.uncached,
+        "statement_cache_hit_rate": statement_cache_metrics.hit_rate,
+    }
+
+
+def _ring_hash(value: bytes) -> int:
+    return int.from_bytes(hashlib.sha1(value).digest()[:8], "big")
+
+
+class ShardRouter:
+    """
+    按用户分片路由
+
+    0 号分片是 DATABASE_URL，其后依次是 DATABASE_SHARD_URLS；每个分片是完整的库结构，
+    一个用户的所有数据（含 users 行）都在其所属分片上。
+    所属分片由一致性哈希环决定（追加分片时只有约 1/N 的用户需要迁移），
+    被迁移工具挪动过的用户记在 0 号分片的 user_shard_overrides 表中，优先于哈希环。
+    """
+
+    def __init__(self, engines: list[AsyncEngine], virtual_nodes: int):
+        self.engines = engines
+        ring = sorted(
+            (_ring_hash(f"shard-{index}#{node}".encode()), index)
+            for index in range(len(engines))
+            for node in range(virtual_nodes)
+        )
+        self._points = [point for point, _ in ring]
+        self._owners = [index for _, index in ring]
+        self._overrides: dict[uuid.UUID, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.engines) > 1
+
+    def ring_shard(self, user_id: uuid.UUID) -> int:
+        """哈希环上的所属分片（不考虑迁移记录）"""
+        position = bisect(self._points, _ring_hash(user_id.bytes)) % len(self._points)
+        return self._owners[position]
+
+    def shard_for(self, user_id: uuid.UUID) -> int:
+        if not self.enabled:
+            return 0
+        return self._overrides.get(user_id, self.ring_shard(user_id))
+
+    def set_overrides(self, overrides: dict[uuid.UUID, int]) -> None:
+        # 忽略指向已下线分片的记录
+        self._overrides = {
+            user_id: shard
+            for user_id, shard in overrides.items()
+            if 0 <= shard < len(self.engines)
+        }
+
 
 # 创建异步数据库引擎
-engine = create_async_engine(
-    settings.database_url,
-    echo=settings.debug,  # 开发模式下打印 SQL
-    pool_pre_ping=True,  # 连接前检查
-    pool_size=5,
-    max_overflow=10,
+engine = create_engine(settings.database_url)
+
+shard_router = ShardRouter(
+    [engine, *(create_engine(url) for url in settings.database_shard_urls)],
+    settings.shard_virtual_nodes,
 )
 
+
+class RoutingSession(Session):
+    """
+    按 session.info["shard"] 选择引擎的会话（未绑定时为 0 号分片）
+    """
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, **kw: Any) -> Any:
+        return shard_router.engines[self.info.get(SHARD_INFO_KEY, 0)].sync_engine
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _mark_dml(orm_execute_state: Any) -> None:
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        orm_execute_state.session.info[_WRITES_KEY] = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_flush(session: Session, flush_context: Any) -> None:
+    session.info[_WRITES_KEY] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _run_after_commit(session: Session) -> None:
+    session.info.pop(_WRITES_KEY, None)
+    for callback in session.info.pop(_AFTER_COMMIT_KEY, []):
+        callback()
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _discard_after_commit(session: Session) -> None:
+    session.info.pop(_WRITES_KEY, None)
+    session.info.pop(_AFTER_COMMIT_KEY, None)
+
+
+def mark_writes(session: AsyncSession) -> None:
+    """
+    标记当前事务有写入（语句外层不是 INSERT/UPDATE/DELETE 的写入，如 CTE 中的 INSERT）
+    """
+    session.info[_WRITES_KEY] = True
+
+
+def has_writes(session: AsyncSession) -> bool:
+    """当前事务是否有（或待刷新的）写入"""
+    return bool(
+        session.info.get(_WRITES_KEY) or session.new or session.dirty or session.deleted
+    )
+
+
+def after_commit(session: AsyncSession, callback: Callable[[], None]) -> None:
+    """
+    登记事务提交后执行的回调（更新进程内缓存等）；事务回滚时丢弃
+    """
+    session.info.setdefault(_AFTER_COMMIT_KEY, []).append(callback)
+
+
+# 会话工厂参数（主库与副本共用）
+_session_options: dict[str, Any] = {
+    "class_": AsyncSession,
+    "expire_on_commit": False,
+    "autocommit": False,
+    "autoflush": False,
+}
+
 # 创建异步会话工厂
 async_session_maker = async_sessionmaker(
-    engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autocommit=False,
-    autoflush=False,
+    engine, sync_session_class=RoutingSession, **_session_options
+)
+
+
+def bind_user_shard(session: AsyncSession, user_id: uuid.UUID) -> None:
+    """
+    把会话绑定到用户所属分片（须在会话执行任何语句之前调用）
+    """
+    shard = shard_router.shard_for(user_id)
+    if session.info.get(SHARD_INFO_KEY, 0) == shard:
+        return
+    if session.in_transaction():
+        raise RuntimeError("会话已开始事务，不能再切换分片")
+    session.info[SHARD_INFO_KEY] = shard
+
+
+def open_shard_session(shard: int) -> AsyncSession:
+    """打开指定分片上的会话"""
+    return async_session_maker(info={SHARD_INFO_KEY: shard})
+
+
+async def fan_out(fn: Callable[[AsyncSession], Awaitable[T]]) -> list[T]:
+    """
+    在每个分片上各开一个会话并发执行 fn（只读，不提交），按分片序号返回结果
+    """
+
+    async def run(shard: int) -> T:
+        async with open_shard_session(shard) as session:
+            return await fn(session)
+
+    return list(
+        await asyncio.gather(*(run(i) for i in range(len(shard_router.engines))))
+    )
+
+
+async def refresh_shard_overrides() -> None:
+    """
+    从 0 号分片加载用户迁移记录
+    """
+    async with engine.connect() as conn:
+        result = await conn.execute(
+            text("SELECT user_id, shard FROM user_shard_overrides")
+        )
+        shard_router.set_overrides(
+            {uuid.UUID(str(row.user_id)): row.shard for row in result}
+        )
+
+
+async def run_shard_override_refresh() -> None:
+    """
+    周期刷新迁移记录（分片部署时由应用生命周期启动）
+    """
+    while True:
+        try:
+            await refresh_shard_overrides()
+        except Exception:
+            logger.exception("刷新分片迁移记录失败")
+        await asyncio.sleep(settings.shard_override_refresh_seconds)
+
+
+class ReplicaRouter:
+    """
+    读副本路由
+
+    只读请求轮询各副本；用户写入后的 stickiness 窗口内仍读主库，避免读到复制延迟前的旧数据。
+    窗口同时记录在本进程（按用户）和客户端 Cookie（跨 worker）中。
+    """
+
+    def __init__(self, urls: list[str], sticky_seconds: int):
+        self.engines = [create_engine(url) for url in urls]
+        self._makers = [async_sessionmaker(e, **_session_options) for e in self.engines]
+        self._cycle = itertools.cycle(self._makers)
+        self.sticky_seconds = sticky_seconds
+        self._recent_writers: TTLCache[str, bool] = TTLCache(100_000, sticky_seconds)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._makers)
+
+    def mark_write(self, user_id: str) -> None:
+        self._recent_writers.set(user_id, True)
+
+    def sticky_until(self) -> int:
+        return int(time.time()) + self.sticky_seconds
+
+    def choose(
+        self, user_id: str | None, sticky_cookie: str | None
+    ) -> async_sessionmaker[AsyncSession] | None:
+        """
+        返回副本会话工厂；应读主库时返回 None
+        """
+        if not self._makers:
+            return None
+        if user_id is not None and self._recent_writers.get(user_id):
+            return None
+        if (
+            sticky_cookie
+            and sticky_cookie.isdigit()
+            and int(sticky_cookie) > time.time()
+        ):
+            return None
+        return next(self._cycle)
+
+
+# 只读副本属于单库部署；分片部署时忽略副本配置
+replica_router = ReplicaRouter(
+    [] if shard_router.enabled else settings.database_replica_urls,
+    settings.read_your_writes_seconds,
 )
 
 
@@ -33,32 +475,72 @@ class Base(DeclarativeBase):
     pass
 
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
+# 请求级会话登记在 ASGI scope 中的键（UnitOfWorkRoute 在发送响应前据此提交）
+REQUEST_SESSION_KEY = "app.db_session"
+
+
+async def get_async_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
     """
     获取数据库会话（依赖注入用）
+
+    一个请求一个事务：服务层只 flush 不提交，由 UnitOfWorkRoute 在端点返回后、响应发送前提交；
+    这里的提交只兜底未经 UnitOfWorkRoute 的路由。只读请求不发 COMMIT，直接归还连接（连接池归还时回滚）
     """
     async with async_session_maker() as session:
+        request.scope[REQUEST_SESSION_KEY] = session
         try:
             yield session
-            await session.commit()
+            if has_writes(session):
+                await session.commit()
         except Exception:
             await session.rollback()
             raise
         finally:
+            request.scope.pop(REQUEST_SESSION_KEY, None)
             await session.close()
 
 
+async def commit_request_session(request: Request) -> None:
+    """提交当前请求的会话（有写入时）；失败直接抛出，由调用方按 500 返回"""
+    session = request.scope.get(REQUEST_SESSION_KEY)
+    if session is not None and has_writes(session):
+        await session.commit()
+
+
+# 兼容旧名称
+get_db = get_async_session
+
+
+@asynccontextmanager
+async def open_read_session(
+    user_id: str | None, sticky_cookie: str | None
+) -> AsyncIterator[AsyncSession | None]:
+    """
+    打开只读副本会话（不提交）；应读主库时产出 None
+    """
+    maker = replica_router.choose(user_id, sticky_cookie)
+    if maker is None:
+        yield None
+        return
+    async with maker() as session:
+        yield session
+
+
 async def init_db() -> None:
     """
     初始化数据库（创建所有表）
     注意：生产环境应使用 Alembic 迁移
     """
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    for shard in shard_router.engines:
+        async with shard.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
 
 
 async def close_db() -> None:
     """
     关闭数据库连接
     """
-    await engine.dispose()
+    for shard in shard_router.engines:
+        await shard.dispose()
+    for replica in replica_router.engines:
+        await replica.dispose()
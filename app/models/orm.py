@@ -1,11 +1,22 @@
 """
 SQLAlchemy ORM 模型定义
 """
+
 import uuid
-from datetime import datetime
+from datetime import date, datetime
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, Text
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import (
+    Boolean,
+    Date,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    Text,
+    UniqueConstraint,
+)
+from sqlalchemy.dialects.postgresql import JSONB, UUID
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
@@ -14,55 +25,64 @@ from app.models.database import Base
 
 class User(Base):
     """用户表"""
+
     __tablename__ = "users"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True),
-        primary_key=True,
-        default=uuid.uuid4
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
+    )
+    email: Mapped[str] = mapped_column(
+        String(255), unique=True, nullable=False, index=True
     )
-    email: Mapped[str] = mapped_column(String(255), unique=True, nullable=False, index=True)
     password_hash: Mapped[str] = mapped_column(String(255), nullable=False)
     is_verified: Mapped[bool] = mapped_column(Boolean, default=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True)
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
-        server_default=func.now()
+        DateTime(timezone=True), server_default=func.now()
     )
     updated_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
-        server_default=func.now(),
-        onupdate=func.now()
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
 
     # 关系
-    profile: Mapped["Profile"] = relationship(back_populates="user", uselist=False, cascade="all, delete-orphan")
-    todos: Mapped[list["Todo"]] = relationship(back_populates="user", cascade="all, delete-orphan")
-    pomodoro_sessions: Mapped[list["PomodoroSession"]] = relationship(back_populates="user", cascade="all, delete-orphan")
-    pomodoro_settings: Mapped["PomodoroSettings"] = relationship(back_populates="user", uselist=False, cascade="all, delete-orphan")
-    refresh_tokens: Mapped[list["RefreshToken"]] = relationship(back_populates="user", cascade="all, delete-orphan")
+    profile: Mapped["Profile"] = relationship(
+        back_populates="user", uselist=False, cascade="all, delete-orphan"
+    )
+    todos: Mapped[list["Todo"]] = relationship(
+        back_populates="user", cascade="all, delete-orphan"
+    )
+    pomodoro_sessions: Mapped[list["PomodoroSession"]] = relationship(
+        back_populates="user", cascade="all, delete-orphan"
+    )
+    pomodoro_settings: Mapped["PomodoroSettings"] = relationship(
+        back_populates="user", uselist=False, cascade="all, delete-orphan"
+    )
+    refresh_tokens: Mapped[list["RefreshToken"]] = relationship(
+        back_populates="user", cascade="all, delete-orphan"
+    )
 
 
 class Profile(Base):
     """用户资料表"""
+
     __tablename__ = "profiles"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True),
-        ForeignKey("users.id", ondelete="CASCADE"),
-        primary_key=True
+        UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
     )
     name: Mapped[str | None] = mapped_column(String(100), nullable=True)
     school: Mapped[str | None] = mapped_column(String(200), nullable=True)
-    avatar: Mapped[str | None] = mapped_column(Text, nullable=True)  # COS URL
+    avatar: Mapped[str | None] = mapped_column(
+        Text, nullable=True
+    )  # COS URL（最大尺寸）
+    avatar_variants: Mapped[dict[str, str] | None] = mapped_column(
+        JSONB, nullable=True
+    )  # {"64": URL, ...}
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
-        server_default=func.now()
+        DateTime(timezone=True), server_default=func.now()
     )
     updated_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
-        server_default=func.now(),
-        onupdate=func.now()
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
 
     # 关系
@@ -71,37 +91,43 @@ class Profile(Base):
 
 class Todo(Base):
     """待办事项表（含日历排程字段）"""
+
     __tablename__ = "todos"
+    __table_args__ = (
+        # 列表按创建时间倒序：按用户取行与排序都走索引，同时覆盖按 user_id 的查找
+        Index("idx_todos_user_created", "user_id", "created_at"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True),
-        primary_key=True,
-        default=uuid.uuid4
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
     )
     user_id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True),
-        ForeignKey("users.id", ondelete="CASCADE"),
-        nullable=False,
-        index=True
+        UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False
     )
     title: Mapped[str] = mapped_column(String(500), nullable=False)
     description: Mapped[str | None] = mapped_column(Text, nullable=True)
     is_completed: Mapped[bool] = mapped_column(Boolean, default=False)
-    
+
     # 日历排程字段（Calendar 是 Todo 的延伸）
-    start_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
-    end_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    start_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    end_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
     all_day: Mapped[bool] = mapped_column(Boolean, default=False)
     color: Mapped[str | None] = mapped_column(String(20), nullable=True)
-    
+
+    # 关联番茄钟会话的累计专注分钟数（随会话写入维护的计数列）
+    focus_minutes: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
+
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
-        server_default=func.now()
+        DateTime(timezone=True), server_default=func.now()
     )
     updated_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
-        server_default=func.now(),
-        onupdate=func.now()
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
 
     # 关系
@@ -110,63 +136,108 @@ class Todo(Base):
 
 class PomodoroSession(Base):
     """番茄钟会话表"""
+
     __tablename__ = "pomodoro_sessions"
+    __table_args__ = (
+        # 客户端生成的会话ID，离线补传 / 重试时去重
+        UniqueConstraint(
+            "user_id", "client_id", name="uq_pomodoro_sessions_user_client"
+        ),
+        # 最近会话列表与按时间窗口的报表：按用户取行、按完成时间排序 / 过滤都走索引
+        Index("idx_pomodoro_sessions_user_completed", "user_id", "completed_at"),
+    )
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True),
-        primary_key=True,
-        default=uuid.uuid4
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
     )
     user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), nullable=False
+    )
+    client_id: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    todo_id: Mapped[uuid.UUID | None] = mapped_column(
         UUID(as_uuid=True),
-        ForeignKey("users.id", ondelete="CASCADE"),
-        nullable=False,
-        index=True
+        ForeignKey("todos.id", ondelete="SET NULL"),
+        nullable=True,
+        index=True,
     )
     title: Mapped[str | None] = mapped_column(String(500), nullable=True)
     duration: Mapped[int] = mapped_column(Integer, nullable=False)
-    completed_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    completed_at: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
-        server_default=func.now()
+        DateTime(timezone=True), server_default=func.now()
     )
     updated_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
-        server_default=func.now(),
-        onupdate=func.now()
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
 
     # 关系
     user: Mapped["User"] = relationship(back_populates="pomodoro_sessions")
 
 
+class PomodoroDailyStat(Base):
+    """番茄钟每日汇总表（按用户、按天累计专注时长，供热力图等统计使用）"""
+
+    __tablename__ = "pomodoro_daily_stats"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    day: Mapped[date] = mapped_column(Date, primary_key=True)  # UTC 自然日
+    focus_minutes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    session_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
+class PomodoroWeeklyTotal(Base):
+    """番茄钟周排行榜汇总表（每周每用户一行，新的一周自然从空表开始）"""
+
+    __tablename__ = "pomodoro_weekly_totals"
+    __table_args__ = (
+        # 全站榜 Top-K 与排名计数都走索引，不需要对全体用户排序
+        Index("idx_weekly_totals_rank", "week_start", "focus_minutes"),
+        Index("idx_weekly_totals_school_rank", "week_start", "school", "focus_minutes"),
+    )
+
+    week_start: Mapped[date] = mapped_column(Date, primary_key=True)  # ISO 周一（UTC）
+    user_id: Mapped[uuid.UUID] = mapped_column(
+        UUID(as_uuid=True), ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    school: Mapped[str | None] = mapped_column(
+        String(200), nullable=True
+    )  # 冗余自 profiles.school
+    focus_minutes: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+
 class PomodoroSettings(Base):
     """番茄钟设置表"""
+
     __tablename__ = "pomodoro_settings"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True),
-        primary_key=True,
-        default=uuid.uuid4
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
     )
     user_id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True),
         ForeignKey("users.id", ondelete="CASCADE"),
         unique=True,
-        nullable=False
+        nullable=False,
     )
     work_time: Mapped[int] = mapped_column(Integer, default=25)
     short_break_time: Mapped[int] = mapped_column(Integer, default=5)
     long_break_time: Mapped[int] = mapped_column(Integer, default=15)
     sessions_until_long_break: Mapped[int] = mapped_column(Integer, default=4)
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
-        server_default=func.now()
+        DateTime(timezone=True), server_default=func.now()
     )
     updated_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
-        server_default=func.now(),
-        onupdate=func.now()
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
 
     # 关系
@@ -175,24 +246,26 @@ class PomodoroSettings(Base):
 
 class RefreshToken(Base):
     """刷新令牌表"""
+
     __tablename__ = "refresh_tokens"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True),
-        primary_key=True,
-        default=uuid.uuid4
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
     )
     user_id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True),
         ForeignKey("users.id", ondelete="CASCADE"),
         nullable=False,
-        index=True
+        index=True,
     )
     token_hash: Mapped[str] = mapped_column(String(255), nullable=False, unique=True)
-    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # 查找键（security.token_lookup）；为空的是加列之前签发的令牌
+    lookup: Mapped[str | None] = mapped_column(String(16), nullable=True, index=True)
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
-        server_default=func.now()
+        DateTime(timezone=True), server_default=func.now()
     )
 
     # 关系
@@ -201,23 +274,37 @@ class RefreshToken(Base):
 
 class PasswordResetToken(Base):
     """密码重置令牌表"""
+
     __tablename__ = "password_reset_tokens"
 
     id: Mapped[uuid.UUID] = mapped_column(
-        UUID(as_uuid=True),
-        primary_key=True,
-        default=uuid.uuid4
+        UUID(as_uuid=True), primary_key=True, default=uuid.uuid4
     )
     user_id: Mapped[uuid.UUID] = mapped_column(
         UUID(as_uuid=True),
         ForeignKey("users.id", ondelete="CASCADE"),
         nullable=False,
-        index=True
+        index=True,
     )
     token_hash: Mapped[str] = mapped_column(String(255), nullable=False, unique=True)
-    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+    # 查找键（security.token_lookup）；为空的是加列之前签发的令牌
+    lookup: Mapped[str | None] = mapped_column(String(16), nullable=True, index=True)
+    expires_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), nullable=False
+    )
     used: Mapped[bool] = mapped_column(Boolean, default=False)
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True),
-        server_default=func.now()
+        DateTime(timezone=True), server_default=func.now()
+    )
+
+
+class UserShardOverride(Base):
+    """用户分片迁移记录表（仅 0 号分片使用，优先于一致性哈希）"""
+
+    __tablename__ = "user_shard_overrides"
+
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True)
+    shard: Mapped[int] = mapped_column(Integer, nullable=False)
+    moved_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
     )
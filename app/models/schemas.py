@@ -1,24 +1,38 @@
-from datetime import datetime
+import uuid
+from datetime import date, datetime
+from typing import Annotated
 
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import AfterValidator, BaseModel, EmailStr, Field
+
+
+def _normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+# 邮箱统一按小写存储与查询：唯一约束、登录与管理员判断都是精确比较
+NormalizedEmail = Annotated[EmailStr, AfterValidator(_normalize_email)]
 
 
 # ============ 用户认证相关 ============
 
+
 class UserRegister(BaseModel):
     """用户注册请求"""
-    email: EmailStr
+
+    email: NormalizedEmail
     password: str = Field(min_length=6, max_length=128)
 
 
 class UserLogin(BaseModel):
     """用户登录请求"""
-    email: EmailStr
+
+    email: NormalizedEmail
     password: str
 
 
 class TokenResponse(BaseModel):
     """登录成功响应（带刷新令牌）"""
+
     access_token: str
     refresh_token: str
     token_type: str = "bearer"
@@ -26,11 +40,13 @@ class TokenResponse(BaseModel):
 
 class TokenRefreshRequest(BaseModel):
     """刷新令牌请求"""
+
     refresh_token: str
 
 
 class TokenResponseWithRefresh(BaseModel):
     """完整的 Token 响应"""
+
     access_token: str
     refresh_token: str
     token_type: str = "bearer"
@@ -38,28 +54,33 @@ class TokenResponseWithRefresh(BaseModel):
 
 class RefreshTokenRequest(BaseModel):
     """刷新令牌请求"""
+
     refresh_token: str
 
 
 class AccessTokenResponse(BaseModel):
     """刷新令牌响应"""
+
     access_token: str
     token_type: str = "bearer"
 
 
 class PasswordResetRequest(BaseModel):
     """请求密码重置"""
-    email: EmailStr
+
+    email: NormalizedEmail
 
 
 class PasswordResetConfirm(BaseModel):
     """执行密码重置"""
+
     token: str
     new_password: str = Field(min_length=6, max_length=128)
 
 
 class UserResponse(BaseModel):
     """用户信息响应"""
+
     id: str
     email: str
     is_verified: bool
@@ -71,8 +92,10 @@ class UserResponse(BaseModel):
 
 # ============ Todo 相关模型 ============
 
+
 class TodoCreate(BaseModel):
     """创建待办"""
+
     title: str = Field(max_length=500)
     description: str | None = None
     # 日历排程字段（可选）
@@ -84,6 +107,7 @@ class TodoCreate(BaseModel):
 
 class TodoUpdate(BaseModel):
     """更新待办"""
+
     title: str | None = None
     description: str | None = None
     is_completed: bool | None = None
@@ -96,6 +120,7 @@ class TodoUpdate(BaseModel):
 
 class TodoResponse(BaseModel):
     """待办响应"""
+
     id: str
     user_id: str
     title: str
@@ -106,6 +131,8 @@ class TodoResponse(BaseModel):
     end_at: datetime | None = None
     all_day: bool = False
     color: str | None = None
+    # 关联番茄钟的累计专注分钟数
+    focus_minutes: int = 0
     created_at: datetime
     updated_at: datetime
 
@@ -113,22 +140,51 @@ class TodoResponse(BaseModel):
         from_attributes = True
 
 
+class TodoFocusReportItem(BaseModel):
+    """待办专注时间报表行"""
+
+    todo_id: str
+    title: str
+    focus_minutes: int
+    session_count: int
+
+
 # ============ 番茄钟相关模型 ============
 
+
 class PomodoroSessionCreate(BaseModel):
     """创建番茄钟会话"""
+
     title: str
     duration: int
     completedAt: str  # 前端传 ISO 字符串
+    clientId: str | None = Field(
+        default=None, max_length=64
+    )  # 客户端生成的ID，重试去重
+    todoId: uuid.UUID | None = None  # 关联的待办
+
+
+class PomodoroSessionBatchItem(PomodoroSessionCreate):
+    """批量上传中的单个会话（必须带客户端ID）"""
+
+    clientId: str = Field(min_length=1, max_length=64)
+
+
+class PomodoroSessionBatchCreate(BaseModel):
+    """批量上传番茄钟会话（离线补传）"""
+
+    sessions: list[PomodoroSessionBatchItem] = Field(min_length=1, max_length=500)
 
 
 class PomodoroSessionResponse(BaseModel):
     """番茄钟会话响应"""
+
     id: str
     user_id: str
     title: str | None = None
     duration: int
     completedAt: str | None = None
+    todoId: str | None = None
     created_at: datetime
     updated_at: datetime
 
@@ -136,8 +192,16 @@ class PomodoroSessionResponse(BaseModel):
         from_attributes = True
 
 
+class PomodoroSessionBatchResponse(BaseModel):
+    """批量上传响应"""
+
+    created: list[PomodoroSessionResponse]
+    duplicates: list[str]  # 已存在而被跳过的 clientId
+
+
 class PomodoroSettings(BaseModel):
     """番茄钟设置（前端兼容格式）"""
+
     workTime: int
     shortBreakTime: int
     longBreakTime: int
@@ -146,21 +210,51 @@ class PomodoroSettings(BaseModel):
 
 class PomodoroSettingsResponse(BaseModel):
     """番茄钟设置响应"""
+
     workTime: int
     shortBreakTime: int
     longBreakTime: int
     sessionsUntilLongBreak: int
 
 
+class PomodoroHeatmapResponse(BaseModel):
+    """年度专注热力图响应（days[i] 为 startDate 之后第 i 天的专注分钟数）"""
+
+    year: int
+    startDate: date
+    days: list[int]
+
+
+class LeaderboardEntry(BaseModel):
+    """排行榜条目"""
+
+    rank: int
+    userId: str
+    name: str | None = None
+    focusMinutes: int
+
+
+class LeaderboardResponse(BaseModel):
+    """周专注排行榜响应"""
+
+    scope: str
+    weekStart: date
+    entries: list[LeaderboardEntry]
+    me: LeaderboardEntry | None = None
+
+
 # ============ 个人资料相关模型 ============
 
+
 class ProfileResponse(BaseModel):
     """个人资料响应"""
+
     id: str
     user_id: str
     name: str | None = None
     school: str | None = None
     avatar: str | None = None
+    avatar_variants: dict[str, str] | None = None
     created_at: datetime | None = None
     updated_at: datetime | None = None
 
@@ -170,6 +264,7 @@ class ProfileResponse(BaseModel):
 
 class ProfileUpdate(BaseModel):
     """更新个人资料"""
+
     name: str | None = None
     school: str | None = None
     avatar: str | None = None
@@ -177,18 +272,105 @@ class ProfileUpdate(BaseModel):
 
 class AvatarUploadResponse(BaseModel):
     """头像上传响应"""
+
     url: str
+    variants: dict[str, str] = {}  # 尺寸 -> URL
+
+
+class AvatarUploadUrlRequest(BaseModel):
+    """申请头像直传 URL"""
+
+    content_type: str
+    size: int = Field(gt=0)
+
+
+class AvatarUploadUrlResponse(BaseModel):
+    """头像直传 URL 响应（客户端用 PUT 携带 headers 上传）"""
+
+    upload_url: str
+    key: str
+    method: str = "PUT"
+    headers: dict[str, str]
+    expires_at: datetime
+
+
+class AvatarUploadConfirm(BaseModel):
+    """确认头像直传完成"""
+
+    key: str
+
+
+# ============ 启动聚合 ============
+
+
+class TodayFocusStats(BaseModel):
+    """今日专注统计"""
+
+    focusMinutes: int = 0
+    sessionCount: int = 0
+
+
+class BootstrapResponse(BaseModel):
+    """客户端启动聚合数据（一次请求取回首屏所需全部数据）"""
+
+    user: UserResponse
+    profile: ProfileResponse
+    settings: PomodoroSettingsResponse
+    todos: list[TodoResponse]
+    today: TodayFocusStats
 
 
 # ============ 通用响应模型 ============
 
+
 class MessageResponse(BaseModel):
     """通用消息响应"""
+
     message: str
 
 
 class HealthResponse(BaseModel):
     """健康检查响应"""
+
     status: str
     message: str
     version: str
+
+
+class PoolStatsResponse(BaseModel):
+    """数据库连接池状态"""
+
+    size: int
+    checked_out: int
+    checked_in: int
+    overflow: int
+    max_overflow: int
+    connects: int
+    invalidations: int
+    checkout_wait_count: int
+    checkout_wait_sum: float
+    checkout_wait_buckets: dict[str, int]  # 累计分桶（秒）
+    statement_cache_hits: int  # SQLAlchemy 编译缓存
+    statement_cache_misses: int
+    statement_cache_uncached: int
+    statement_cache_hit_rate: float
+
+
+class StackCount(BaseModel):
+    """collapsed 格式的一条调用栈及其样本数"""
+
+    stack: str
+    count: int
+
+
+class WorkerProfileResponse(BaseModel):
+    """单个 worker 的采样分析结果"""
+
+    pid: int
+    seconds: float
+    interval_ms: float
+    samples: int
+    categories: dict[
+        str, int
+    ]  # bcrypt / jwt / json / orm / db_driver / images / idle / other
+    top_stacks: list[StackCount]
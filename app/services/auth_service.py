@@ -1,11 +1,14 @@
 """
 认证服务：注册、登录、刷新令牌、密码重置
 """
+
 import uuid
-from datetime import datetime, timezone
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime
+from typing import Any, TypeVar
 
 from fastapi import HTTPException, status
-from sqlalchemy import delete, select
+from sqlalchemy import delete, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.security import (
@@ -13,9 +16,13 @@ from app.core.security import (
     create_password_reset_token,
     create_refresh_token,
     get_password_hash,
+    pwd_context,
+    token_lookup,
     verify_password,
     verify_refresh_token,
 )
+from app.core.tracing import trace_methods
+from app.models.database import bind_user_shard, fan_out, shard_router
 from app.models.orm import PasswordResetToken, Profile, RefreshToken, User
 from app.models.schemas import (
     AccessTokenResponse,
@@ -29,50 +36,73 @@ from app.models.schemas import (
     UserResponse,
 )
 
+T = TypeVar("T")
+
 
+@trace_methods
 class AuthService:
     def __init__(self, db: AsyncSession):
         self.db = db
 
+    async def _find(
+        self, lookup: Callable[[AsyncSession], Awaitable[T | None]]
+    ) -> T | None:
+        """
+        执行按用户以外条件（邮箱、令牌）的查找
+
+        单库时直接用当前会话；分片部署时并发查询各分片，返回第一个命中的结果。
+        每次查找的开销 × 分片数：lookup 须走索引（令牌按 lookup 列定位，只校验命中的那一行），
+        不能按过期时间等宽条件取出一批行再逐个 bcrypt 校验
+        """
+        if not shard_router.enabled:
+            return await lookup(self.db)
+        results = await fan_out(lookup)
+        return next((result for result in results if result is not None), None)
+
+    async def _load_user(self, user_id: uuid.UUID) -> User | None:
+        """把会话绑定到用户所属分片并读取用户"""
+        bind_user_shard(self.db, user_id)
+        return await self.db.get(User, user_id)
+
     async def register(self, user_data: UserRegister) -> UserResponse:
         """
         用户注册
         """
-        # 检查邮箱是否已注册
-        result = await self.db.execute(
-            select(User).where(User.email == user_data.email)
+        # 检查邮箱是否已注册（分片部署时查询所有分片）
+        existing_user_id = await self._find(
+            lambda db: _user_id_by_email(db, user_data.email)
         )
-        existing_user = result.scalar_one_or_none()
-        
-        if existing_user:
+
+        if existing_user_id:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="该邮箱已被注册"
+                status_code=status.HTTP_400_BAD_REQUEST, detail="该邮箱已被注册"
             )
-        
+
         # 创建用户
         password_hash = get_password_hash(user_data.password)
+        user_id = uuid.uuid4()
+        bind_user_shard(self.db, user_id)
         new_user = User(
+            id=user_id,
             email=user_data.email,
             password_hash=password_hash,
             is_verified=False,
-            is_active=True
+            is_active=True,
         )
         self.db.add(new_user)
-        await self.db.flush()
-        
-        # 创建空的个人资料
+
+        # 创建空的个人资料（ID 已在本地生成，与用户一次 flush 写入）
         profile = Profile(id=new_user.id)
         self.db.add(profile)
-        
-        await self.db.commit()
+
+        await self.db.flush()
         await self.db.refresh(new_user)
-        
+
         return UserResponse(
             id=str(new_user.id),
             email=new_user.email,
             is_verified=new_user.is_verified,
-            created_at=new_user.created_at
+            created_at=new_user.created_at,
         )
 
     async def login(self, user_login: UserLogin) -> TokenResponse:
@@ -80,98 +110,82 @@ class AuthService:
         用户登录
         """
         # 查询用户
-        result = await self.db.execute(
-            select(User).where(User.email == user_login.email)
-        )
-        user = result.scalar_one_or_none()
-        
+        user_id = await self._find(lambda db: _user_id_by_email(db, user_login.email))
+        user = await self._load_user(user_id) if user_id else None
+
         if not user or not verify_password(user_login.password, user.password_hash):
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="邮箱或密码错误"
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="邮箱或密码错误"
             )
-        
+
         if not user.is_active:
             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="账号已被禁用"
+                status_code=status.HTTP_403_FORBIDDEN, detail="账号已被禁用"
             )
-        
+
         # 生成 tokens
         access_token = create_access_token(user.id, user.email)
         raw_refresh, token_hash, expires_at = create_refresh_token(user.id)
-        
+
         # 保存 refresh token
         refresh_token_record = RefreshToken(
             user_id=user.id,
             token_hash=token_hash,
-            expires_at=expires_at
+            lookup=token_lookup(raw_refresh),
+            expires_at=expires_at,
         )
         self.db.add(refresh_token_record)
-        await self.db.commit()
-        
+        await self.db.flush()
+
         return TokenResponse(
-            access_token=access_token,
-            refresh_token=raw_refresh,
-            token_type="bearer"
+            access_token=access_token, refresh_token=raw_refresh, token_type="bearer"
         )
 
     async def refresh(self, request: RefreshTokenRequest) -> AccessTokenResponse:
         """
         刷新 Access Token
         """
-        # 查找所有未过期的 refresh tokens
-        result = await self.db.execute(
-            select(RefreshToken).where(
-                RefreshToken.expires_at > datetime.now(timezone.utc)
-            )
+        # 查找并验证未过期的 refresh token
+        token_user_id = await self._find(
+            lambda db: _refresh_token_user_id(db, request.refresh_token)
         )
-        tokens = result.scalars().all()
-        
-        # 验证 token
-        valid_token = None
-        for token in tokens:
-            if verify_refresh_token(request.refresh_token, token.token_hash):
-                valid_token = token
-                break
-        
-        if not valid_token:
+
+        if not token_user_id:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="无效或已过期的刷新令牌"
+                detail="无效或已过期的刷新令牌",
             )
-        
+
         # 获取用户
-        result = await self.db.execute(
-            select(User).where(User.id == valid_token.user_id)
-        )
-        user = result.scalar_one_or_none()
-        
+        user = await self._load_user(token_user_id)
+
         if not user or not user.is_active:
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="用户不存在或已被禁用"
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="用户不存在或已被禁用"
             )
-        
+
         # 生成新的 access token
         access_token = create_access_token(user.id, user.email)
-        
-        return AccessTokenResponse(
-            access_token=access_token,
-            token_type="bearer"
-        )
 
-    async def logout(self, user_id: uuid.UUID, refresh_token: str | None = None) -> MessageResponse:
+        return AccessTokenResponse(access_token=access_token, token_type="bearer")
+
+    async def logout(
+        self, user_id: uuid.UUID, refresh_token: str | None = None
+    ) -> MessageResponse:
         """
         用户登出（使 refresh token 失效）
         """
+        bind_user_shard(self.db, user_id)
         if refresh_token:
             # 删除特定的 refresh token
             result = await self.db.execute(
-                select(RefreshToken).where(RefreshToken.user_id == user_id)
+                select(RefreshToken).where(
+                    RefreshToken.user_id == user_id,
+                    _lookup_matches(RefreshToken.lookup, refresh_token),
+                )
             )
             tokens = result.scalars().all()
-            
+
             for token in tokens:
                 if verify_refresh_token(refresh_token, token.token_hash):
                     await self.db.delete(token)
@@ -181,40 +195,40 @@ class AuthService:
             await self.db.execute(
                 delete(RefreshToken).where(RefreshToken.user_id == user_id)
             )
-        
-        await self.db.commit()
+
         return MessageResponse(message="登出成功")
 
-    async def request_password_reset(self, request: PasswordResetRequest) -> MessageResponse:
+    async def request_password_reset(
+        self, request: PasswordResetRequest
+    ) -> MessageResponse:
         """
         请求密码重置（发送邮件）
         """
         # 查询用户
-        result = await self.db.execute(
-            select(User).where(User.email == request.email)
-        )
-        user = result.scalar_one_or_none()
-        
+        user_id = await self._find(lambda db: _user_id_by_email(db, request.email))
+        user = await self._load_user(user_id) if user_id else None
+
         # 即使用户不存在也返回成功（防止邮箱枚举攻击）
         if not user:
             return MessageResponse(message="如果该邮箱已注册，您将收到密码重置邮件")
-        
+
         # 创建重置令牌
         raw_token, token_hash, expires_at = create_password_reset_token()
-        
+
         reset_token = PasswordResetToken(
             user_id=user.id,
             token_hash=token_hash,
+            lookup=token_lookup(raw_token),
             expires_at=expires_at,
-            used=False
+            used=False,
         )
         self.db.add(reset_token)
-        await self.db.commit()
-        
+        await self.db.flush()
+
         # TODO: 发送邮件
         # 目前先返回 token（生产环境应改为邮件发送）
         # await send_password_reset_email(user.email, raw_token)
-        
+
         return MessageResponse(message="如果该邮箱已注册，您将收到密码重置邮件")
 
     async def reset_password(self, request: PasswordResetConfirm) -> MessageResponse:
@@ -222,48 +236,74 @@ class AuthService:
         执行密码重置
         """
         # 查找有效的重置令牌
-        result = await self.db.execute(
-            select(PasswordResetToken).where(
-                PasswordResetToken.expires_at > datetime.now(timezone.utc),
-                PasswordResetToken.used == False  # noqa: E712
-            )
-        )
-        tokens = result.scalars().all()
-        
-        valid_token = None
-        for token in tokens:
-            # passlib 的 verify 可以验证任何哈希
-            from app.core.security import pwd_context
-            if pwd_context.verify(request.token, token.token_hash):
-                valid_token = token
-                break
-        
-        if not valid_token:
+        found = await self._find(lambda db: _reset_token_ids(db, request.token))
+
+        if not found:
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="无效或已过期的重置令牌"
+                status_code=status.HTTP_400_BAD_REQUEST, detail="无效或已过期的重置令牌"
             )
-        
+
         # 更新密码
-        result = await self.db.execute(
-            select(User).where(User.id == valid_token.user_id)
-        )
-        user = result.scalar_one_or_none()
-        
+        token_id, token_user_id = found
+        user = await self._load_user(token_user_id)
+        valid_token = await self.db.get(PasswordResetToken, token_id)
+
         if not user:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="用户不存在"
+                status_code=status.HTTP_404_NOT_FOUND, detail="用户不存在"
             )
-        
+
         user.password_hash = get_password_hash(request.new_password)
         valid_token.used = True
-        
+
         # 使所有 refresh tokens 失效
         await self.db.execute(
             delete(RefreshToken).where(RefreshToken.user_id == user.id)
         )
-        
-        await self.db.commit()
-        
+
         return MessageResponse(message="密码重置成功")
+
+
+async def _user_id_by_email(db: AsyncSession, email: str) -> uuid.UUID | None:
+    result = await db.execute(select(User.id).where(User.email == email))
+    return result.scalar_one_or_none()
+
+
+def _lookup_matches(lookup_column: Any, raw_token: str) -> Any:
+    # lookup 为空的是加列之前签发的令牌，过期前仍逐个校验
+    return or_(lookup_column == token_lookup(raw_token), lookup_column.is_(None))
+
+
+async def _refresh_token_user_id(db: AsyncSession, raw_token: str) -> uuid.UUID | None:
+    result = await db.execute(
+        select(RefreshToken.user_id, RefreshToken.token_hash).where(
+            _lookup_matches(RefreshToken.lookup, raw_token),
+            RefreshToken.expires_at > datetime.now(UTC),
+        )
+    )
+    for user_id, token_hash in result.all():
+        if verify_refresh_token(raw_token, token_hash):
+            return user_id
+    return None
+
+
+async def _reset_token_ids(
+    db: AsyncSession, raw_token: str
+) -> tuple[uuid.UUID, uuid.UUID] | None:
+    """返回 (令牌ID, 用户ID)"""
+    result = await db.execute(
+        select(
+            PasswordResetToken.id,
+            PasswordResetToken.user_id,
+            PasswordResetToken.token_hash,
+        ).where(
+            _lookup_matches(PasswordResetToken.lookup, raw_token),
+            PasswordResetToken.expires_at > datetime.now(UTC),
+            PasswordResetToken.used == False,  # noqa: E712
+        )
+    )
+    for token_id, user_id, token_hash in result.all():
+        # passlib 的 verify 可以验证任何哈希
+        if pwd_context.verify(raw_token, token_hash):
+            return token_id, user_id
+    return None
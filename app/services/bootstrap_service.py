@@ -0,0 +1,132 @@
+"""
+启动聚合服务：一次请求返回用户、资料、番茄钟设置、今日待办与今日专注统计
+"""
+
+import uuid
+from datetime import UTC, datetime, time, timedelta
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.tracing import trace_methods
+from app.models.orm import PomodoroDailyStat, PomodoroSettings, Profile, Todo, User
+from app.models.schemas import (
+    BootstrapResponse,
+    PomodoroSettingsResponse,
+    ProfileResponse,
+    TodayFocusStats,
+    TodoResponse,
+    UserResponse,
+)
+from app.services.pomodoro_service import PomodoroService
+from app.services.profile_service import ProfileService
+from app.services.todo_service import to_todo_response
+
+
+@trace_methods
+class BootstrapService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_bootstrap(self, user_id: uuid.UUID) -> BootstrapResponse:
+        """
+        获取启动数据：用户 + 资料 + 设置 + 今日统计一条连接查询，今日待办一条查询
+        """
+        now = datetime.now(UTC)
+        today = now.date()
+
+        result = await self.db.execute(
+            select(User, Profile, PomodoroSettings, PomodoroDailyStat)
+            .outerjoin(Profile, Profile.id == User.id)
+            .outerjoin(PomodoroSettings, PomodoroSettings.user_id == User.id)
+            .outerjoin(
+                PomodoroDailyStat,
+                and_(
+                    PomodoroDailyStat.user_id == User.id, PomodoroDailyStat.day == today
+                ),
+            )
+            .where(User.id == user_id)
+        )
+        row = result.one_or_none()
+
+        # 与 get_current_user 的校验保持一致
+        if row is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found"
+            )
+        user, profile, settings, daily_stat = row
+        if not user.is_active:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="User account is disabled"
+            )
+
+        return BootstrapResponse(
+            user=UserResponse(
+                id=str(user.id),
+                email=user.email,
+                is_verified=user.is_verified,
+                created_at=user.created_at,
+            ),
+            profile=await self._profile_response(user_id, profile),
+            settings=await self._settings_response(user_id, settings),
+            todos=await self._get_today_todos(user_id, now),
+            today=TodayFocusStats(
+                focusMinutes=daily_stat.focus_minutes if daily_stat else 0,
+                sessionCount=daily_stat.session_count if daily_stat else 0,
+            ),
+        )
+
+    async def _profile_response(
+        self, user_id: uuid.UUID, profile: Profile | None
+    ) -> ProfileResponse:
+        if profile is None:
+            # 极少数老用户没有资料行，走懒创建
+            return await ProfileService(self.db).get_profile(user_id)
+        return ProfileResponse(
+            id=str(profile.id),
+            user_id=str(profile.id),
+            name=profile.name,
+            school=profile.school,
+            avatar=profile.avatar,
+            avatar_variants=profile.avatar_variants,
+            created_at=profile.created_at,
+            updated_at=profile.updated_at,
+        )
+
+    async def _settings_response(
+        self, user_id: uuid.UUID, settings: PomodoroSettings | None
+    ) -> PomodoroSettingsResponse:
+        if settings is None:
+            # 首次使用：以默认值创建
+            return await PomodoroService(self.db).get_settings(user_id)
+        return PomodoroSettingsResponse(
+            workTime=settings.work_time,
+            shortBreakTime=settings.short_break_time,
+            longBreakTime=settings.long_break_time,
+            sessionsUntilLongBreak=settings.sessions_until_long_break,
+        )
+
+    async def _get_today_todos(
+        self, user_id: uuid.UUID, now: datetime
+    ) -> list[TodoResponse]:
+        """
+        今日待办：排程在今天（UTC）的，以及未排程且未完成的
+        """
+        day_start = datetime.combine(now.date(), time.min, tzinfo=UTC)
+        day_end = day_start + timedelta(days=1)
+
+        result = await self.db.execute(
+            select(Todo)
+            .where(
+                Todo.user_id == user_id,
+                or_(
+                    and_(Todo.start_at >= day_start, Todo.start_at < day_end),
+                    and_(Todo.start_at.is_(None), Todo.is_completed.is_(False)),
+                ),
+            )
+            .order_by(Todo.start_at.asc().nulls_last(), Todo.created_at.desc())
+        )
+        todos = result.scalars().all()
+
+        return [to_todo_response(todo) for todo in todos]
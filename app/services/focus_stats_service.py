@@ -0,0 +1,195 @@
+"""
+专注统计服务：每日汇总表、年度热力图
+"""
+
+import time
+import uuid
+from array import array
+from collections.abc import Iterable
+from datetime import UTC, date, datetime
+
+from sqlalchemy import Date, cast, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache_bus import cache_bus
+from app.core.config import settings
+from app.core.tracing import trace_methods
+from app.models.orm import PomodoroDailyStat, PomodoroSession
+from app.models.schemas import PomodoroHeatmapResponse
+from app.utils.cache import TTLCache
+
+# 热力图每年固定 366 格（闰年），array('H') 单格上限 65535 分钟
+HEATMAP_DAYS = 366
+_MAX_DAY_MINUTES = 0xFFFF
+
+
+def session_day(completed_at: datetime | None) -> date:
+    """
+    会话归属的 UTC 自然日（未提供完成时间时按当前时间计）
+    """
+    moment = completed_at or datetime.now(UTC)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=UTC)
+    return moment.astimezone(UTC).date()
+
+
+class HeatmapCache:
+    """
+    按 (用户, 年份) 缓存热力图，每项是 366 格的 array('H')（约 732 字节）
+
+    新会话提交后整年失效而不是增量累加：其他连接可能在写入方提交前后读库重建，
+    累加会重复计入或被旧数据覆盖；读库期间被失效过的年份不写回缓存
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._cache: TTLCache[tuple[uuid.UUID, int], array] = TTLCache(maxsize, ttl)
+
+    def get(self, user_id: uuid.UUID, year: int) -> array | None:
+        return self._cache.get((user_id, year))
+
+    def put(self, user_id: uuid.UUID, year: int, days: array, since: float) -> None:
+        """since: 开始读取汇总表时的 time.monotonic()"""
+        self._cache.set_if_unchanged((user_id, year), days, since)
+
+    def invalidate(self, key: str) -> None:
+        """key: heatmap_key() 生成的 '用户ID:年份'"""
+        user_id, year = key.split(":")
+        self._cache.invalidate((uuid.UUID(user_id), int(year)))
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+heatmap_cache = HeatmapCache(
+    settings.heatmap_cache_size, settings.heatmap_cache_ttl_seconds
+)
+cache_bus.register("heatmap", heatmap_cache.invalidate, heatmap_cache.clear)
+
+
+def heatmap_key(user_id: uuid.UUID, day: date) -> str:
+    return f"{user_id}:{day.year}"
+
+
+@trace_methods
+class FocusStatsService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def record_sessions(
+        self, sessions: Iterable[tuple[uuid.UUID, datetime | None, int]]
+    ) -> dict[tuple[uuid.UUID, date], int]:
+        """
+        累加每日汇总并登记热力图缓存失效（同一事务内执行，不提交）
+
+        sessions: (用户ID, 完成时间, 时长) 序列
+        返回: {(用户ID, 日期): 新增分钟数}
+        """
+        totals: dict[tuple[uuid.UUID, date], list[int]] = {}
+        for user_id, completed_at, duration in sessions:
+            entry = totals.setdefault((user_id, session_day(completed_at)), [0, 0])
+            entry[0] += max(duration, 0)
+            entry[1] += 1
+
+        if not totals:
+            return {}
+
+        # 同一语句中冲突键不能重复，上面已按 (用户, 日期) 聚合
+        stmt = insert(PomodoroDailyStat).values(
+            [
+                {
+                    "user_id": user_id,
+                    "day": day,
+                    "focus_minutes": minutes,
+                    "session_count": count,
+                }
+                for (user_id, day), (minutes, count) in totals.items()
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PomodoroDailyStat.user_id, PomodoroDailyStat.day],
+            set_={
+                "focus_minutes": PomodoroDailyStat.focus_minutes
+                + stmt.excluded.focus_minutes,
+                "session_count": PomodoroDailyStat.session_count
+                + stmt.excluded.session_count,
+                "updated_at": func.now(),
+            },
+        )
+        await self.db.execute(stmt)
+        await cache_bus.publish(
+            self.db, "heatmap", (heatmap_key(user_id, day) for user_id, day in totals)
+        )
+
+        return {key: minutes for key, (minutes, _) in totals.items()}
+
+    async def get_heatmap(
+        self, user_id: uuid.UUID, year: int
+    ) -> PomodoroHeatmapResponse:
+        """
+        获取年度热力图（优先读进程内缓存，未命中时从每日汇总表重建）
+        """
+        days = heatmap_cache.get(user_id, year)
+        if days is None:
+            since = time.monotonic()
+            days = await self._load_year(user_id, year)
+            heatmap_cache.put(user_id, year, days, since)
+
+        start = date(year, 1, 1)
+        days_in_year = (date(year + 1, 1, 1) - start).days
+        return PomodoroHeatmapResponse(
+            year=year,
+            startDate=start,
+            days=days[:days_in_year].tolist(),
+        )
+
+    async def _load_year(self, user_id: uuid.UUID, year: int) -> array:
+        """
+        从每日汇总表读取一年的数据（主键范围扫描，最多 366 行）
+        """
+        result = await self.db.execute(
+            select(PomodoroDailyStat.day, PomodoroDailyStat.focus_minutes).where(
+                PomodoroDailyStat.user_id == user_id,
+                PomodoroDailyStat.day >= date(year, 1, 1),
+                PomodoroDailyStat.day < date(year + 1, 1, 1),
+            )
+        )
+
+        days = array("H", bytes(2 * HEATMAP_DAYS))
+        for day, minutes in result.all():
+            days[day.timetuple().tm_yday - 1] = min(minutes, _MAX_DAY_MINUTES)
+        return days
+
+    async def rebuild_daily_stats(self, user_id: uuid.UUID) -> None:
+        """
+        从会话表重建某个用户的每日汇总并登记热力图缓存失效（数据修复 / 历史数据回填用，不提交）
+
+        只重写有会话的日期；由 scripts/backfill_daily_stats.py 调用
+        """
+        moment = func.coalesce(PomodoroSession.completed_at, PomodoroSession.created_at)
+        day = cast(func.timezone("UTC", moment), Date)
+        source = (
+            select(
+                PomodoroSession.user_id,
+                day.label("day"),
+                func.sum(PomodoroSession.duration).label("focus_minutes"),
+                func.count().label("session_count"),
+            )
+            .where(PomodoroSession.user_id == user_id)
+            .group_by(PomodoroSession.user_id, day)
+        )
+        stmt = insert(PomodoroDailyStat).from_select(
+            ["user_id", "day", "focus_minutes", "session_count"], source
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PomodoroDailyStat.user_id, PomodoroDailyStat.day],
+            set_={
+                "focus_minutes": stmt.excluded.focus_minutes,
+                "session_count": stmt.excluded.session_count,
+                "updated_at": func.now(),
+            },
+        ).returning(PomodoroDailyStat.day)
+        days = (await self.db.scalars(stmt)).all()
+        await cache_bus.publish(
+            self.db, "heatmap", (heatmap_key(user_id, day) for day in days)
+        )
@@ -0,0 +1,271 @@
+"""
+周专注排行榜服务（全站榜 / 学校榜）
+"""
+
+import asyncio
+import logging
+import uuid
+from collections.abc import Iterable
+from datetime import UTC, date, datetime, timedelta
+
+from fastapi import HTTPException, status
+from sqlalchemy import Row, Select, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.tracing import trace_methods
+from app.models.database import fan_out, open_shard_session, shard_router
+from app.models.orm import PomodoroWeeklyTotal, Profile
+from app.models.schemas import LeaderboardEntry, LeaderboardResponse
+from app.services.focus_stats_service import session_day
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SCOPE_GLOBAL = "global"
+SCOPE_SCHOOL = "school"
+
+# (周一, 范围, 学校, 条数) -> Top-K 条目；短 TTL 挡住榜单页的重复读取
+_top_k_cache: TTLCache[tuple[date, str, str | None, int], list[LeaderboardEntry]] = (
+    TTLCache(1024, settings.leaderboard_cache_ttl_seconds)
+)
+
+
+def week_start_of(day: date) -> date:
+    """ISO 周的周一"""
+    return day - timedelta(days=day.weekday())
+
+
+@trace_methods
+class LeaderboardService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def record_sessions(
+        self, sessions: Iterable[tuple[uuid.UUID, datetime | None, int]]
+    ) -> None:
+        """
+        累加周汇总（同一事务内执行，不提交）
+
+        sessions: (用户ID, 完成时间, 时长) 序列
+        """
+        totals: dict[tuple[date, uuid.UUID], int] = {}
+        for user_id, completed_at, duration in sessions:
+            key = (week_start_of(session_day(completed_at)), user_id)
+            totals[key] = totals.get(key, 0) + max(duration, 0)
+
+        if not totals:
+            return
+
+        stmt = insert(PomodoroWeeklyTotal).values(
+            [
+                {
+                    "week_start": week_start,
+                    "user_id": user_id,
+                    "school": select(Profile.school)
+                    .where(Profile.id == user_id)
+                    .scalar_subquery(),
+                    "focus_minutes": minutes,
+                }
+                for (week_start, user_id), minutes in totals.items()
+            ]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[
+                PomodoroWeeklyTotal.week_start,
+                PomodoroWeeklyTotal.user_id,
+            ],
+            set_={
+                "focus_minutes": PomodoroWeeklyTotal.focus_minutes
+                + stmt.excluded.focus_minutes,
+                "school": stmt.excluded.school,
+                "updated_at": func.now(),
+            },
+        )
+        await self.db.execute(stmt)
+
+    async def sync_school(self, user_id: uuid.UUID, school: str | None) -> None:
+        """
+        用户修改学校后同步本周汇总行（不提交）
+        """
+        this_week = week_start_of(datetime.now(UTC).date())
+        await self.db.execute(
+            update(PomodoroWeeklyTotal)
+            .where(
+                PomodoroWeeklyTotal.week_start == this_week,
+                PomodoroWeeklyTotal.user_id == user_id,
+            )
+            .values(school=school)
+        )
+
+    async def get_leaderboard(
+        self,
+        user_id: uuid.UUID,
+        scope: str = SCOPE_GLOBAL,
+        week: date | None = None,
+        limit: int = 50,
+    ) -> LeaderboardResponse:
+        """
+        获取周排行榜 Top-K 及当前用户排名
+        """
+        week_start = week_start_of(week or datetime.now(UTC).date())
+
+        school = None
+        if scope == SCOPE_SCHOOL:
+            result = await self.db.execute(
+                select(Profile.school).where(Profile.id == user_id)
+            )
+            school = result.scalar_one_or_none()
+            if not school:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="请先在个人资料中设置学校",
+                )
+
+        cache_key = (week_start, scope, school, limit)
+        entries = _top_k_cache.get(cache_key)
+        if entries is None:
+            entries = await self._load_top_k(week_start, school, limit)
+            _top_k_cache.set(cache_key, entries)
+
+        return LeaderboardResponse(
+            scope=scope,
+            weekStart=week_start,
+            entries=entries,
+            me=await self._get_rank(user_id, week_start, school),
+        )
+
+    async def prune(self, keep_weeks: int | None = None) -> int:
+        """
+        删除过期周的汇总行（周期任务调用），返回删除行数
+
+        分片部署时逐个分片清理
+        """
+        keep = keep_weeks or settings.leaderboard_keep_weeks
+        cutoff = week_start_of(datetime.now(UTC).date()) - timedelta(weeks=keep)
+        stmt = delete(PomodoroWeeklyTotal).where(
+            PomodoroWeeklyTotal.week_start < cutoff
+        )
+        if not shard_router.enabled:
+            result = await self.db.execute(stmt)
+            await self.db.commit()
+            return result.rowcount
+
+        deleted = 0
+        for shard in range(len(shard_router.engines)):
+            async with open_shard_session(shard) as db:
+                result = await db.execute(stmt)
+                await db.commit()
+                deleted += result.rowcount
+        return deleted
+
+    def _scope_filter(self, week_start: date, school: str | None) -> list:
+        conditions = [PomodoroWeeklyTotal.week_start == week_start]
+        if school is not None:
+            conditions.append(PomodoroWeeklyTotal.school == school)
+        return conditions
+
+    async def _load_top_k(
+        self, week_start: date, school: str | None, limit: int
+    ) -> list[LeaderboardEntry]:
+        """
+        沿 (week_start[, school], focus_minutes) 索引倒序取前 K 名
+
+        分片部署时各分片各取前 K 名再归并
+        """
+        stmt = (
+            select(
+                PomodoroWeeklyTotal.user_id,
+                PomodoroWeeklyTotal.focus_minutes,
+                Profile.name,
+            )
+            .outerjoin(Profile, Profile.id == PomodoroWeeklyTotal.user_id)
+            .where(*self._scope_filter(week_start, school))
+            .order_by(
+                PomodoroWeeklyTotal.focus_minutes.desc(),
+                PomodoroWeeklyTotal.user_id,
+            )
+            .limit(limit)
+        )
+        if shard_router.enabled:
+            shard_rows = await fan_out(lambda db: _fetch_all(db, stmt))
+            rows = sorted(
+                (row for shard in shard_rows for row in shard),
+                key=lambda row: (-row[1], row[0]),
+            )[:limit]
+        else:
+            rows = await _fetch_all(self.db, stmt)
+
+        # 并列名次采用竞赛排名（1, 2, 2, 4）
+        entries: list[LeaderboardEntry] = []
+        for position, (entry_user_id, minutes, name) in enumerate(rows, 1):
+            rank = position
+            if entries and entries[-1].focusMinutes == minutes:
+                rank = entries[-1].rank
+            entries.append(
+                LeaderboardEntry(
+                    rank=rank,
+                    userId=str(entry_user_id),
+                    name=name,
+                    focusMinutes=minutes,
+                )
+            )
+        return entries
+
+    async def _get_rank(
+        self, user_id: uuid.UUID, week_start: date, school: str | None
+    ) -> LeaderboardEntry | None:
+        """
+        当前用户排名 = 1 + 本周分钟数严格更高的人数（索引范围计数，无需排序）
+        """
+        result = await self.db.execute(
+            select(PomodoroWeeklyTotal.focus_minutes).where(
+                PomodoroWeeklyTotal.week_start == week_start,
+                PomodoroWeeklyTotal.user_id == user_id,
+            )
+        )
+        minutes = result.scalar_one_or_none()
+        if minutes is None:
+            return None
+
+        stmt = (
+            select(func.count())
+            .select_from(PomodoroWeeklyTotal)
+            .where(
+                *self._scope_filter(week_start, school),
+                PomodoroWeeklyTotal.focus_minutes > minutes,
+            )
+        )
+        if shard_router.enabled:
+            higher = sum(await fan_out(lambda db: _fetch_scalar(db, stmt)))
+        else:
+            higher = await _fetch_scalar(self.db, stmt)
+        return LeaderboardEntry(
+            rank=higher + 1,
+            userId=str(user_id),
+            focusMinutes=minutes,
+        )
+
+
+async def run_leaderboard_prune() -> None:
+    """
+    周期清理过期周的汇总行（由应用生命周期启动；各 worker 都会执行，DELETE 重复执行无害）
+    """
+    while True:
+        try:
+            async with open_shard_session(0) as db:
+                deleted = await LeaderboardService(db).prune()
+            if deleted:
+                logger.info("已清理 %d 行过期排行榜汇总", deleted)
+        except Exception:
+            logger.exception("清理排行榜汇总失败")
+        await asyncio.sleep(settings.leaderboard_prune_interval_seconds)
+
+
+async def _fetch_all(db: AsyncSession, stmt: Select) -> list[Row]:
+    return list((await db.execute(stmt)).all())
+
+
+async def _fetch_scalar(db: AsyncSession, stmt: Select) -> int:
+    return (await db.execute(stmt)).scalar_one()
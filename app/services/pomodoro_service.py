@@ -1,115 +1,333 @@
 """
 番茄钟服务
 """
+
+import json
+import time
 import uuid
-from datetime import datetime
+from datetime import UTC, date, datetime
 
 from fastapi import HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import (
+    Integer,
+    RowMapping,
+    and_,
+    bindparam,
+    column,
+    func,
+    select,
+    update,
+    values,
+)
+from sqlalchemy.dialects.postgresql import UUID, insert
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.orm import PomodoroSession, PomodoroSettings
+from app.core.cache_bus import cache_bus
+from app.core.config import settings
+from app.core.tracing import trace_methods
+from app.models.database import (
+    after_commit,
+    has_writes,
+    open_shard_session,
+    shard_router,
+)
+from app.models.orm import PomodoroSession, PomodoroSettings, Todo
 from app.models.schemas import (
+    PomodoroSessionBatchCreate,
+    PomodoroSessionBatchResponse,
     PomodoroSessionCreate,
     PomodoroSessionResponse,
-    PomodoroSettings as PomodoroSettingsSchema,
     PomodoroSettingsResponse,
 )
+from app.models.schemas import (
+    PomodoroSettings as PomodoroSettingsSchema,
+)
+from app.services.focus_stats_service import FocusStatsService
+from app.services.leaderboard_service import LeaderboardService
+from app.utils.cache import TTLCache
+from app.utils.db import get_or_create
+from app.utils.logfile import rotating_file_logger
+from app.utils.write_buffer import WriteBuffer
+
+# 用户ID -> 番茄钟设置；更新提交后本进程写回新值，其他 worker 收到失效通知后重新读库
+_settings_cache: TTLCache[uuid.UUID, PomodoroSettingsResponse] = TTLCache(
+    settings.settings_cache_size, settings.settings_cache_ttl_seconds
+)
+cache_bus.register(
+    "settings",
+    lambda key: _settings_cache.invalidate(uuid.UUID(key)),
+    _settings_cache.clear,
+)
+
 
+# 热点查询只构造一次（缓存键随语句对象记忆，编译结果命中引擎缓存）；启动预热也会执行
+SETTINGS_BY_USER = select(PomodoroSettings.__table__).where(
+    PomodoroSettings.user_id == bindparam("user_id")
+)
 
+
+@trace_methods
 class PomodoroService:
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, read_db: AsyncSession | None = None):
         self.db = db
+        # 只读查询所用会话（可能是副本）；未指定时与主库会话相同
+        self.read_db = read_db if read_db is not None else db
 
     async def create_session(
         self, session_data: PomodoroSessionCreate, user_id: uuid.UUID
     ) -> PomodoroSessionResponse:
         """
-        创建番茄钟会话
+        创建番茄钟会话（带 clientId 时重复提交返回已有会话）
+        """
+        row = _session_row(session_data, user_id)
+
+        if session_write_buffer.running:
+            return await self._create_session_buffered(row)
+
+        return await self._create_session_direct(row)
+
+    async def _create_session_direct(self, row: dict) -> PomodoroSessionResponse:
+        """
+        在本请求的事务内写入会话
         """
-        # 解析 completedAt
-        completed_at = None
-        if session_data.completedAt:
-            try:
-                completed_at = datetime.fromisoformat(
-                    session_data.completedAt.replace("Z", "+00:00")
+        created = await self._insert_sessions([row])
+
+        if not created:
+            # clientId 重复：客户端重试，返回首次写入的会话
+            result = await self.db.execute(
+                select(*PomodoroSession.__table__.c).where(
+                    PomodoroSession.user_id == row["user_id"],
+                    PomodoroSession.client_id == row["client_id"],
                 )
-            except ValueError:
-                pass
-        
-        new_session = PomodoroSession(
-            user_id=user_id,
-            title=session_data.title,
-            duration=session_data.duration,
-            completed_at=completed_at
+            )
+            return _to_session_response(result.mappings().one())
+
+        # 同一事务内累加统计汇总（热力图缓存在提交后失效）
+        await self._record_rollups(created)
+
+        return _to_session_response(created[0])
+
+    async def _create_session_buffered(self, row: dict) -> PomodoroSessionResponse:
+        """
+        写缓冲模式：立即确认，由后台任务批量落库
+
+        clientId 重复时返回已有会话（本进程待落库的或库中已有的），待办关联在确认前校验，
+        确认内容与落库结果一致。确认是暂定的：同一 clientId 同时提交到不同 worker 时各自确认，
+        落库只保留先到的一条；确认后待办被删除则关联置空；落库最终失败的行记入死信文件
+        """
+        user_id, client_id = row["user_id"], row["client_id"]
+        if client_id:
+            pending = _pending_sessions.get((user_id, client_id))
+            if pending is not None:
+                return _to_session_response(pending)
+            result = await self.db.execute(
+                select(*PomodoroSession.__table__.c).where(
+                    PomodoroSession.user_id == user_id,
+                    PomodoroSession.client_id == client_id,
+                )
+            )
+            existing = result.mappings().one_or_none()
+            if existing is not None:
+                return _to_session_response(existing)
+
+        if row["todo_id"]:
+            owned = await self.db.scalar(
+                select(Todo.id).where(
+                    Todo.id == row["todo_id"], Todo.user_id == user_id
+                )
+            )
+            if owned is None:
+                row["todo_id"] = None
+
+        now = datetime.now(UTC)
+        acked = {**row, "created_at": now, "updated_at": now}
+        if client_id:
+            # 查库期间同一 clientId 可能已被本进程的另一个请求入队
+            pending = _pending_sessions.setdefault((user_id, client_id), acked)
+            if pending is not acked:
+                return _to_session_response(pending)
+        if not await session_write_buffer.submit(row):
+            _pending_sessions.pop((user_id, client_id), None)
+            if not session_write_buffer.running:
+                # 查库期间写缓冲已停止（应用关闭中）：在本请求的事务内直接写入
+                return await self._create_session_direct(row)
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="服务繁忙，请稍后重试",
+            )
+
+        return _to_session_response(acked)
+
+    async def create_sessions_batch(
+        self, batch: PomodoroSessionBatchCreate, user_id: uuid.UUID
+    ) -> PomodoroSessionBatchResponse:
+        """
+        批量创建番茄钟会话（离线补传），按 clientId 去重
+        """
+        rows: dict[str, dict] = {}
+        for item in batch.sessions:
+            rows.setdefault(item.clientId, _session_row(item, user_id))
+
+        # 一条多行 INSERT ... ON CONFLICT DO NOTHING RETURNING，汇总表在同一事务内更新
+        created = await self._insert_sessions(list(rows.values()))
+        await self._record_rollups(created)
+
+        created_ids = {row["client_id"] for row in created}
+        return PomodoroSessionBatchResponse(
+            created=[_to_session_response(row) for row in created],
+            duplicates=[
+                client_id for client_id in rows if client_id not in created_ids
+            ],
         )
-        self.db.add(new_session)
-        await self.db.commit()
-        await self.db.refresh(new_session)
-        
-        return PomodoroSessionResponse(
-            id=str(new_session.id),
-            user_id=str(new_session.user_id),
-            title=new_session.title,
-            duration=new_session.duration,
-            completedAt=new_session.completed_at.isoformat() if new_session.completed_at else None,
-            created_at=new_session.created_at,
-            updated_at=new_session.updated_at
+
+    async def _insert_sessions(self, rows: list[dict]) -> list[RowMapping]:
+        """
+        多行插入会话（不提交），与已有会话冲突（同一 clientId 或同一ID）的行被跳过，
+        同一批行重复插入是幂等的（写缓冲拆批重试依赖这一点）
+        返回实际插入的行
+
+        待办关联在同一条 INSERT ... SELECT 内校验：只连接本人的待办，其余置空。
+        被连接的待办加 FOR KEY SHARE 锁，并发删除要么已提交（读不到，关联置空），
+        要么等本事务结束后再删（ON DELETE SET NULL），不会触发外键错误
+        """
+        if not rows:
+            return []
+
+        table = PomodoroSession.__table__
+        source = values(
+            *(column(name, table.c[name].type) for name in _SESSION_COLUMNS), name="v"
+        ).data([tuple(row[name] for name in _SESSION_COLUMNS) for row in rows])
+
+        todo_ids = {row["todo_id"] for row in rows if row["todo_id"]}
+        if todo_ids:
+            owned = (
+                select(Todo.id, Todo.user_id)
+                .where(Todo.id.in_(todo_ids))
+                .with_for_update(read=True, key_share=True)
+                .cte("owned")
+            )
+            todo_id = owned.c.id
+            from_clause = source.outerjoin(
+                owned,
+                and_(
+                    owned.c.id == source.c.todo_id, owned.c.user_id == source.c.user_id
+                ),
+            )
+        else:
+            todo_id = source.c.todo_id
+            from_clause = source
+
+        columns = [
+            todo_id if name == "todo_id" else source.c[name]
+            for name in _SESSION_COLUMNS
+        ]
+        stmt = (
+            insert(PomodoroSession)
+            .from_select(_SESSION_COLUMNS, select(*columns).select_from(from_clause))
+            .on_conflict_do_nothing()
+            .returning(*table.c)
         )
+        result = await self.db.execute(stmt)
+        return list(result.mappings().all())
+
+    async def _record_rollups(
+        self, created: list[RowMapping]
+    ) -> dict[tuple[uuid.UUID, date], int]:
+        """
+        累加每日汇总、周排行榜与待办专注分钟数（不提交）
+        返回每日增量
+        """
+        sessions = [
+            (row["user_id"], row["completed_at"], row["duration"]) for row in created
+        ]
+        deltas = await FocusStatsService(self.db).record_sessions(sessions)
+        await LeaderboardService(self.db).record_sessions(sessions)
+
+        todo_minutes: dict[uuid.UUID, int] = {}
+        for row in created:
+            if row["todo_id"]:
+                todo_minutes[row["todo_id"]] = todo_minutes.get(
+                    row["todo_id"], 0
+                ) + max(row["duration"], 0)
+        if todo_minutes:
+            # UPDATE todos SET focus_minutes = focus_minutes + v.minutes FROM (VALUES ...) v
+            increments = values(
+                column("id", UUID(as_uuid=True)), column("minutes", Integer), name="v"
+            ).data(list(todo_minutes.items()))
+            await self.db.execute(
+                update(Todo)
+                .where(Todo.id == increments.c.id)
+                .values(focus_minutes=Todo.focus_minutes + increments.c.minutes)
+            )
+
+        return deltas
 
     async def get_sessions(self, user_id: uuid.UUID) -> list[PomodoroSessionResponse]:
         """
         获取番茄钟会话列表（最近50条）
         """
-        result = await self.db.execute(
+        result = await self.read_db.execute(
             select(PomodoroSession)
             .where(PomodoroSession.user_id == user_id)
             .order_by(PomodoroSession.completed_at.desc())
             .limit(50)
         )
         sessions = result.scalars().all()
-        
+
         return [
             PomodoroSessionResponse(
                 id=str(session.id),
                 user_id=str(session.user_id),
                 title=session.title,
                 duration=session.duration,
-                completedAt=session.completed_at.isoformat() if session.completed_at else None,
+                completedAt=session.completed_at.isoformat()
+                if session.completed_at
+                else None,
+                todoId=str(session.todo_id) if session.todo_id else None,
                 created_at=session.created_at,
-                updated_at=session.updated_at
+                updated_at=session.updated_at,
             )
             for session in sessions
         ]
 
     async def get_settings(self, user_id: uuid.UUID) -> PomodoroSettingsResponse:
         """
-        获取番茄钟设置
+        获取番茄钟设置（每次开始计时都会读取，先走进程内缓存）
         """
-        result = await self.db.execute(
-            select(PomodoroSettings).where(PomodoroSettings.user_id == user_id)
-        )
-        settings = result.scalar_one_or_none()
-        
-        if not settings:
-            # 创建默认设置
-            settings = PomodoroSettings(
-                user_id=user_id,
-                work_time=25,
-                short_break_time=5,
-                long_break_time=15,
-                sessions_until_long_break=4
+        cached = _settings_cache.get(user_id)
+        if cached is not None:
+            return cached
+
+        since = time.monotonic()
+        row = None
+        if self.read_db is not self.db:
+            result = await self.read_db.execute(SETTINGS_BY_USER, {"user_id": user_id})
+            row = result.mappings().one_or_none()
+        if row is None:
+            # 不存在则以默认值在主库创建（单条 INSERT ... ON CONFLICT 语句）
+            row = await get_or_create(
+                self.db,
+                PomodoroSettings.__table__,
+                "user_id",
+                {
+                    "user_id": user_id,
+                    "work_time": 25,
+                    "short_break_time": 5,
+                    "long_break_time": 15,
+                    "sessions_until_long_break": 4,
+                },
             )
-            self.db.add(settings)
-            await self.db.commit()
-            await self.db.refresh(settings)
-        
-        return PomodoroSettingsResponse(
-            workTime=settings.work_time,
-            shortBreakTime=settings.short_break_time,
-            longBreakTime=settings.long_break_time,
-            sessionsUntilLongBreak=settings.sessions_until_long_break
-        )
+
+        response = _to_settings_response(row)
+        if has_writes(self.db):
+            after_commit(
+                self.db,
+                lambda: _settings_cache.set_if_unchanged(user_id, response, since),
+            )
+        else:
+            _settings_cache.set_if_unchanged(user_id, response, since)
+        return response
 
     async def update_settings(
         self, settings_data: PomodoroSettingsSchema, user_id: uuid.UUID
@@ -125,38 +343,136 @@ class PomodoroService:
             or settings_data.sessionsUntilLongBreak < 1
         ):
             raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="所有设置值必须大于0"
+                status_code=status.HTTP_400_BAD_REQUEST, detail="所有设置值必须大于0"
             )
-        
-        result = await self.db.execute(
-            select(PomodoroSettings).where(PomodoroSettings.user_id == user_id)
-        )
-        settings = result.scalar_one_or_none()
-        
-        if settings:
-            # 更新现有设置
-            settings.work_time = settings_data.workTime
-            settings.short_break_time = settings_data.shortBreakTime
-            settings.long_break_time = settings_data.longBreakTime
-            settings.sessions_until_long_break = settings_data.sessionsUntilLongBreak
-        else:
-            # 创建新设置
-            settings = PomodoroSettings(
-                user_id=user_id,
-                work_time=settings_data.workTime,
-                short_break_time=settings_data.shortBreakTime,
-                long_break_time=settings_data.longBreakTime,
-                sessions_until_long_break=settings_data.sessionsUntilLongBreak
+
+        fields = {
+            "work_time": settings_data.workTime,
+            "short_break_time": settings_data.shortBreakTime,
+            "long_break_time": settings_data.longBreakTime,
+            "sessions_until_long_break": settings_data.sessionsUntilLongBreak,
+        }
+        stmt = insert(PomodoroSettings).values(user_id=user_id, **fields)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[PomodoroSettings.user_id],
+            set_={**fields, "updated_at": func.now()},
+        ).returning(*PomodoroSettings.__table__.c)
+        row = (await self.db.execute(stmt)).mappings().one()
+        await cache_bus.publish(self.db, "settings", [str(user_id)])
+
+        # 提交后先失效再写入新值（after_commit 按登记顺序执行）
+        response = _to_settings_response(row)
+        after_commit(self.db, lambda: _settings_cache.set(user_id, response))
+        return response
+
+
+async def _flush_buffered_sessions(rows: list[dict]) -> None:
+    """
+    写缓冲落库：按用户所属分片分组，每个分片一个事务内多行插入并累加统计汇总
+    """
+    by_shard: dict[int, list[dict]] = {}
+    for row in rows:
+        by_shard.setdefault(shard_router.shard_for(row["user_id"]), []).append(row)
+
+    for shard, shard_rows in by_shard.items():
+        async with open_shard_session(shard) as db:
+            service = PomodoroService(db)
+            created = await service._insert_sessions(shard_rows)
+            await service._record_rollups(created)
+            await db.commit()
+        _forget_pending(shard_rows)
+
+
+def _dead_letter_sessions(rows: list[dict], error: Exception) -> None:
+    """落库最终失败的会话逐行写入死信文件（JSON 行），可人工修复后重放"""
+    dead_letters = rotating_file_logger(
+        "app.pomodoro_dead_letter",
+        settings.pomodoro_write_behind_dead_letter_file,
+        10 * 1024 * 1024,
+        5,
+    )
+    for row in rows:
+        dead_letters.info(
+            json.dumps(
+                {"error": f"{type(error).__name__}: {error}", "row": row}, default=str
             )
-            self.db.add(settings)
-        
-        await self.db.commit()
-        await self.db.refresh(settings)
-        
-        return PomodoroSettingsResponse(
-            workTime=settings.work_time,
-            shortBreakTime=settings.short_break_time,
-            longBreakTime=settings.long_break_time,
-            sessionsUntilLongBreak=settings.sessions_until_long_break
         )
+    _forget_pending(rows)
+
+
+def _forget_pending(rows: list[dict]) -> None:
+    for row in rows:
+        if row["client_id"]:
+            _pending_sessions.pop((row["user_id"], row["client_id"]), None)
+
+
+# 已确认、尚未落库的会话：(用户ID, clientId) -> 确认时返回的行，用于本进程内的重复提交
+_pending_sessions: dict[tuple[uuid.UUID, str], dict] = {}
+
+# 番茄钟会话写缓冲（settings.pomodoro_write_behind 开启时由应用生命周期启动）
+# 约束、外键等数据错误按行隔离，只有出错的行进死信，同批其他用户的会话照常落库
+session_write_buffer = WriteBuffer(
+    _flush_buffered_sessions,
+    flush_interval=settings.pomodoro_write_behind_flush_ms / 1000,
+    batch_size=settings.pomodoro_write_behind_batch_size,
+    max_queue=settings.pomodoro_write_behind_queue_size,
+    enqueue_timeout=settings.pomodoro_write_behind_enqueue_timeout_ms / 1000,
+    permanent_errors=(IntegrityError, DataError),
+    dead_letter=_dead_letter_sessions,
+)
+
+
+def _parse_completed_at(value: str | None) -> datetime | None:
+    """解析前端传入的 ISO 时间字符串，无法解析时视为未提供"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+# _session_row 生成的列（其余列取服务端默认值）
+_SESSION_COLUMNS = [
+    "id",
+    "user_id",
+    "client_id",
+    "todo_id",
+    "title",
+    "duration",
+    "completed_at",
+]
+
+
+def _session_row(session_data: PomodoroSessionCreate, user_id: uuid.UUID) -> dict:
+    return {
+        "id": uuid.uuid4(),
+        "user_id": user_id,
+        "client_id": session_data.clientId,
+        "todo_id": session_data.todoId,
+        "title": session_data.title,
+        "duration": session_data.duration,
+        "completed_at": _parse_completed_at(session_data.completedAt),
+    }
+
+
+def _to_session_response(row: RowMapping) -> PomodoroSessionResponse:
+    return PomodoroSessionResponse(
+        id=str(row["id"]),
+        user_id=str(row["user_id"]),
+        title=row["title"],
+        duration=row["duration"],
+        completedAt=row["completed_at"].isoformat() if row["completed_at"] else None,
+        todoId=str(row["todo_id"]) if row["todo_id"] else None,
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+    )
+
+
+def _to_settings_response(row: RowMapping) -> PomodoroSettingsResponse:
+    return PomodoroSettingsResponse(
+        workTime=row["work_time"],
+        shortBreakTime=row["short_break_time"],
+        longBreakTime=row["long_break_time"],
+        sessionsUntilLongBreak=row["sessions_until_long_break"],
+    )
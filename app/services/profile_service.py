@@ -1,154 +1,259 @@
 """
 用户资料服务
 """
+
+import hashlib
+import os
 import uuid
-from datetime import datetime
+from datetime import UTC, datetime, timedelta
+from io import BytesIO
 
 from fastapi import HTTPException, UploadFile, status
-from sqlalchemy import select
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import RowMapping, func, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.core.storage import get_storage
+from app.core.tracing import trace_methods
 from app.models.orm import Profile
-from app.models.schemas import AvatarUploadResponse, ProfileResponse, ProfileUpdate
+from app.models.schemas import (
+    AvatarUploadResponse,
+    AvatarUploadUrlRequest,
+    AvatarUploadUrlResponse,
+    ProfileResponse,
+    ProfileUpdate,
+)
+from app.services.leaderboard_service import LeaderboardService
+from app.utils.db import get_or_create
+from app.utils.images import process_avatar
+
+# 对象按内容哈希命名，内容永不变化，可长期缓存
+_IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 
+@trace_methods
 class ProfileService:
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, read_db: AsyncSession | None = None):
         self.db = db
+        # 只读查询所用会话（可能是副本）；未指定时与主库会话相同
+        self.read_db = read_db if read_db is not None else db
 
     async def get_profile(self, user_id: uuid.UUID) -> ProfileResponse:
         """
-        获取用户个人资料
+        获取用户个人资料（不存在则在主库创建默认资料，单条语句完成）
         """
-        result = await self.db.execute(
-            select(Profile).where(Profile.user_id == user_id)
-        )
-        profile = result.scalar_one_or_none()
-        
-        if not profile:
-            # 创建默认资料
-            profile = Profile(
-                user_id=user_id,
-                name="",
-                school=""
+        row = None
+        if self.read_db is not self.db:
+            result = await self.read_db.execute(
+                select(Profile.__table__).where(Profile.id == user_id)
             )
-            self.db.add(profile)
-            await self.db.commit()
-            await self.db.refresh(profile)
-        
-        return ProfileResponse(
-            id=str(profile.id),
-            user_id=str(profile.user_id),
-            name=profile.name,
-            school=profile.school,
-            avatar=profile.avatar,
-            created_at=profile.created_at,
-            updated_at=profile.updated_at
-        )
+            row = result.mappings().one_or_none()
+        if row is None:
+            row = await get_or_create(
+                self.db,
+                Profile.__table__,
+                "id",
+                {"id": user_id, "name": "", "school": ""},
+            )
+
+        return _to_profile_response(row)
 
     async def update_profile(
         self, profile_data: ProfileUpdate, user_id: uuid.UUID
     ) -> ProfileResponse:
         """
-        更新用户个人资料
+        更新用户个人资料（INSERT ... ON CONFLICT DO UPDATE ... RETURNING）
         """
-        result = await self.db.execute(
-            select(Profile).where(Profile.user_id == user_id)
-        )
-        profile = result.scalar_one_or_none()
-        
-        if not profile:
-            # 创建新资料
-            profile = Profile(
-                user_id=user_id,
-                name=profile_data.name or "",
-                school=profile_data.school or "",
-                avatar=profile_data.avatar
-            )
-            self.db.add(profile)
-        else:
-            # 更新现有资料
-            update_data = profile_data.model_dump(exclude_unset=True)
-            for field, value in update_data.items():
-                setattr(profile, field, value)
-        
-        await self.db.commit()
-        await self.db.refresh(profile)
-        
-        return ProfileResponse(
-            id=str(profile.id),
-            user_id=str(profile.user_id),
-            name=profile.name,
-            school=profile.school,
-            avatar=profile.avatar,
-            created_at=profile.created_at,
-            updated_at=profile.updated_at
+        update_data = profile_data.model_dump(exclude_unset=True)
+
+        stmt = insert(Profile).values(
+            {"id": user_id, "name": "", "school": "", **update_data}
         )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Profile.id],
+            set_={**update_data, "updated_at": func.now()},
+        ).returning(*Profile.__table__.c)
+        row = (await self.db.execute(stmt)).mappings().one()
+
+        # 学校变更时同步本周排行榜汇总行
+        if "school" in update_data:
+            await LeaderboardService(self.db).sync_school(user_id, profile_data.school)
+
+        return _to_profile_response(row)
 
     async def upload_avatar(
         self, avatar: UploadFile, user_id: uuid.UUID
     ) -> AvatarUploadResponse:
         """
-        上传用户头像到腾讯云 COS
+        上传用户头像：在进程池中转为多尺寸 WebP，按内容哈希存储
+        """
+        content_type = avatar.content_type or ""
+        _check_avatar_content_type(content_type)
+
+        # 请求体已由中间件按 Content-Length 提前限制，这里再按实际大小校验
+        size = avatar.size
+        if size is None:
+            size = avatar.file.seek(0, os.SEEK_END)
+        _check_avatar_size(size)
+
+        await avatar.seek(0)
+        data = await avatar.read()
+
+        return await self._store_avatar(data, user_id)
+
+    async def create_avatar_upload_url(
+        self, request: AvatarUploadUrlRequest, user_id: uuid.UUID
+    ) -> AvatarUploadUrlResponse:
+        """
+        生成头像直传 URL（客户端直接 PUT 到存储，不经过 API worker）
         """
+        _check_avatar_content_type(request.content_type)
+        _check_avatar_size(request.size)
+
+        extension = request.content_type.split("/")[-1]
+        key = f"{_upload_prefix(user_id)}{uuid.uuid4().hex}.{extension}"
+        expires = settings.avatar_presign_expire_seconds
+
         try:
-            from qcloud_cos import CosConfig, CosS3Client
-            
-            # 初始化 COS 客户端
-            config = CosConfig(
-                Region=settings.cos_region,
-                SecretId=settings.cos_secret_id,
-                SecretKey=settings.cos_secret_key
-            )
-            client = CosS3Client(config)
-            
-            # 读取文件内容
-            contents = await avatar.read()
-            
-            # 生成文件名
-            timestamp = int(datetime.utcnow().timestamp())
-            file_key = f"avatars/{user_id}/{timestamp}.png"
-            
-            # 上传到 COS
-            client.put_object(
-                Bucket=settings.cos_bucket,
-                Body=contents,
-                Key=file_key,
-                ContentType=avatar.content_type or "image/png"
+            upload_url = get_storage().presign_put(key, request.content_type, expires)
+        except ImportError:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="COS SDK 未安装"
             )
-            
-            # 构建公开访问 URL
-            avatar_url = f"https://{settings.cos_bucket}.cos.{settings.cos_region}.myqcloud.com/{file_key}"
-            
-            # 更新数据库中的头像 URL
-            result = await self.db.execute(
-                select(Profile).where(Profile.user_id == user_id)
+
+        return AvatarUploadUrlResponse(
+            upload_url=upload_url,
+            key=key,
+            headers={"Content-Type": request.content_type},
+            expires_at=datetime.now(UTC) + timedelta(seconds=expires),
+        )
+
+    async def confirm_avatar_upload(
+        self, key: str, user_id: uuid.UUID
+    ) -> AvatarUploadResponse:
+        """
+        确认直传完成：校验对象后生成各尺寸头像并更新资料，随后删除原始上传
+        """
+        if not key.startswith(_upload_prefix(user_id)) or ".." in key:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN, detail="无权使用该上传对象"
             )
-            profile = result.scalar_one_or_none()
-            
-            if profile:
-                profile.avatar = avatar_url
-            else:
-                profile = Profile(
-                    user_id=user_id,
-                    name="",
-                    school="",
-                    avatar=avatar_url
+
+        storage = get_storage()
+        try:
+            info = await storage.head(key)
+            if info is None:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, detail="上传对象不存在"
                 )
-                self.db.add(profile)
-            
-            await self.db.commit()
-            
-            return AvatarUploadResponse(url=avatar_url)
-            
+            _check_avatar_size(info.size)
+            data = await storage.read(key, settings.avatar_max_bytes)
+        except ImportError:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="COS SDK 未安装"
+            )
+        _check_avatar_size(len(data))
+
+        response = await self._store_avatar(data, user_id)
+        await storage.delete(key)
+        return response
+
+    async def _store_avatar(
+        self, data: bytes, user_id: uuid.UUID
+    ) -> AvatarUploadResponse:
+        """
+        处理并存储头像各尺寸，更新资料中的头像 URL
+        """
+        # 按原图内容哈希命名：同一张图重复上传直接复用已有对象
+        digest = (await run_in_threadpool(hashlib.sha256, data)).hexdigest()
+        keys = {size: f"avatars/{digest}/{size}.webp" for size in settings.avatar_sizes}
+
+        storage = get_storage()
+        try:
+            if not await storage.exists(keys[max(keys)]):
+                variants = await process_avatar(data)
+                # 最大尺寸最后上传，作为整组已完成的标记
+                for size in sorted(variants):
+                    await storage.upload_fileobj(
+                        BytesIO(variants[size]),
+                        keys[size],
+                        "image/webp",
+                        len(variants[size]),
+                        cache_control=_IMMUTABLE_CACHE_CONTROL,
+                    )
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="无法识别的图片"
+            )
         except ImportError:
             raise HTTPException(
                 status_code=status.HTTP_501_NOT_IMPLEMENTED,
-                detail="COS SDK 未安装"
+                detail="COS SDK 或图片处理库未安装",
             )
         except Exception as e:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"头像上传失败: {str(e)}"
+                detail=f"头像上传失败: {str(e)}",
             )
+
+        variant_urls = {
+            str(size): storage.public_url(key) for size, key in keys.items()
+        }
+        avatar_url = variant_urls[str(max(keys))]
+
+        # 更新数据库中的头像 URL（资料不存在时一并创建）
+        stmt = insert(Profile).values(
+            id=user_id,
+            name="",
+            school="",
+            avatar=avatar_url,
+            avatar_variants=variant_urls,
+        )
+        await self.db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[Profile.id],
+                set_={
+                    "avatar": avatar_url,
+                    "avatar_variants": variant_urls,
+                    "updated_at": func.now(),
+                },
+            )
+        )
+
+        return AvatarUploadResponse(url=avatar_url, variants=variant_urls)
+
+
+def _upload_prefix(user_id: uuid.UUID) -> str:
+    # 直传的原始文件暂存在用户自己的前缀下，确认后删除
+    return f"uploads/avatars/{user_id}/"
+
+
+def _check_avatar_content_type(content_type: str) -> None:
+    if content_type not in settings.avatar_content_types:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="仅支持 PNG / JPEG / WebP / GIF 图片",
+        )
+
+
+def _check_avatar_size(size: int) -> None:
+    if size > settings.avatar_max_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="头像文件过大"
+        )
+
+
+def _to_profile_response(row: RowMapping) -> ProfileResponse:
+    # profiles 表以用户ID为主键
+    return ProfileResponse(
+        id=str(row["id"]),
+        user_id=str(row["id"]),
+        name=row["name"],
+        school=row["school"],
+        avatar=row["avatar"],
+        avatar_variants=row["avatar_variants"],
+        created_at=row["created_at"],
+        updated_at=row["updated_at"],
+    )
@@ -1,16 +1,32 @@
 """
 待办事项服务
 """
+
 import uuid
+from datetime import datetime
 
 from fastapi import HTTPException, status
-from sqlalchemy import select
+from sqlalchemy import bindparam, delete, func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.orm import Todo
-from app.models.schemas import TodoCreate, TodoResponse, TodoUpdate
+from app.core.tracing import trace_methods
+from app.models.orm import PomodoroSession, Todo
+from app.models.schemas import (
+    TodoCreate,
+    TodoFocusReportItem,
+    TodoResponse,
+    TodoUpdate,
+)
+
+# 热点查询只构造一次（缓存键随语句对象记忆，编译结果命中引擎缓存）；启动预热也会执行
+TODOS_BY_USER = (
+    select(Todo)
+    .where(Todo.user_id == bindparam("user_id"))
+    .order_by(Todo.created_at.desc())
+)
 
 
+@trace_methods
 class TodoService:
     def __init__(self, db: AsyncSession):
         self.db = db
@@ -19,31 +35,14 @@ class TodoService:
         """
         获取用户的所有待办
         """
-        result = await self.db.execute(
-            select(Todo)
-            .where(Todo.user_id == user_id)
-            .order_by(Todo.created_at.desc())
-        )
+        result = await self.db.execute(TODOS_BY_USER, {"user_id": user_id})
         todos = result.scalars().all()
-        
-        return [
-            TodoResponse(
-                id=str(todo.id),
-                user_id=str(todo.user_id),
-                title=todo.title,
-                description=todo.description,
-                is_completed=todo.is_completed,
-                start_at=todo.start_at,
-                end_at=todo.end_at,
-                all_day=todo.all_day,
-                color=todo.color,
-                created_at=todo.created_at,
-                updated_at=todo.updated_at
-            )
-            for todo in todos
-        ]
 
-    async def create_todo(self, todo_data: TodoCreate, user_id: uuid.UUID) -> TodoResponse:
+        return [to_todo_response(todo) for todo in todos]
+
+    async def create_todo(
+        self, todo_data: TodoCreate, user_id: uuid.UUID
+    ) -> TodoResponse:
         """
         创建待办
         """
@@ -54,85 +53,109 @@ class TodoService:
             start_at=todo_data.start_at,
             end_at=todo_data.end_at,
             all_day=todo_data.all_day,
-            color=todo_data.color
+            color=todo_data.color,
         )
         self.db.add(new_todo)
-        await self.db.commit()
+        await self.db.flush()
         await self.db.refresh(new_todo)
-        
-        return TodoResponse(
-            id=str(new_todo.id),
-            user_id=str(new_todo.user_id),
-            title=new_todo.title,
-            description=new_todo.description,
-            is_completed=new_todo.is_completed,
-            start_at=new_todo.start_at,
-            end_at=new_todo.end_at,
-            all_day=new_todo.all_day,
-            color=new_todo.color,
-            created_at=new_todo.created_at,
-            updated_at=new_todo.updated_at
-        )
+
+        return to_todo_response(new_todo)
 
     async def update_todo(
         self, todo_id: str, todo_data: TodoUpdate, user_id: uuid.UUID
     ) -> TodoResponse:
         """
-        更新待办
+        更新待办（单条 UPDATE ... RETURNING，不存在或不属于该用户时 404）
         """
-        result = await self.db.execute(
-            select(Todo).where(
-                Todo.id == uuid.UUID(todo_id),
-                Todo.user_id == user_id
-            )
-        )
+        # 更新字段（只更新传入的非 None 值）
+        update_data = todo_data.model_dump(exclude_unset=True)
+        conditions = (Todo.id == uuid.UUID(todo_id), Todo.user_id == user_id)
+        if update_data:
+            stmt = update(Todo).where(*conditions).values(**update_data).returning(Todo)
+        else:
+            stmt = select(Todo).where(*conditions)
+        result = await self.db.execute(stmt)
         todo = result.scalar_one_or_none()
-        
+
         if not todo:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="待办不存在"
+                status_code=status.HTTP_404_NOT_FOUND, detail="待办不存在"
             )
-        
-        # 更新字段（只更新传入的非 None 值）
-        update_data = todo_data.model_dump(exclude_unset=True)
-        for field, value in update_data.items():
-            setattr(todo, field, value)
-        
-        await self.db.commit()
-        await self.db.refresh(todo)
-        
-        return TodoResponse(
-            id=str(todo.id),
-            user_id=str(todo.user_id),
-            title=todo.title,
-            description=todo.description,
-            is_completed=todo.is_completed,
-            start_at=todo.start_at,
-            end_at=todo.end_at,
-            all_day=todo.all_day,
-            color=todo.color,
-            created_at=todo.created_at,
-            updated_at=todo.updated_at
-        )
+
+        return to_todo_response(todo)
 
     async def delete_todo(self, todo_id: str, user_id: uuid.UUID) -> None:
         """
-        删除待办
+        删除待办（单条 DELETE，不存在或不属于该用户时 404）
         """
         result = await self.db.execute(
-            select(Todo).where(
-                Todo.id == uuid.UUID(todo_id),
-                Todo.user_id == user_id
-            )
+            delete(Todo).where(Todo.id == uuid.UUID(todo_id), Todo.user_id == user_id)
         )
-        todo = result.scalar_one_or_none()
-        
-        if not todo:
+
+        if not result.rowcount:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="待办不存在"
+                status_code=status.HTTP_404_NOT_FOUND, detail="待办不存在"
             )
-        
-        await self.db.delete(todo)
-        await self.db.commit()
+
+    async def get_focus_report(
+        self,
+        user_id: uuid.UUID,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        limit: int = 50,
+        offset: int = 0,
+    ) -> list[TodoFocusReportItem]:
+        """
+        待办专注时间报表：时间窗口内按待办汇总番茄钟时长（每页一条分组连接查询）
+        """
+        conditions = [
+            PomodoroSession.user_id == user_id,
+            PomodoroSession.todo_id.is_not(None),
+        ]
+        if start is not None:
+            conditions.append(PomodoroSession.completed_at >= start)
+        if end is not None:
+            conditions.append(PomodoroSession.completed_at < end)
+
+        focus_minutes = func.sum(PomodoroSession.duration).label("focus_minutes")
+        result = await self.db.execute(
+            select(
+                Todo.id,
+                Todo.title,
+                focus_minutes,
+                func.count().label("session_count"),
+            )
+            .join(Todo, Todo.id == PomodoroSession.todo_id)
+            .where(*conditions)
+            .group_by(Todo.id, Todo.title)
+            .order_by(focus_minutes.desc(), Todo.id)
+            .limit(limit)
+            .offset(offset)
+        )
+
+        return [
+            TodoFocusReportItem(
+                todo_id=str(todo_id),
+                title=title,
+                focus_minutes=minutes,
+                session_count=count,
+            )
+            for todo_id, title, minutes, count in result.all()
+        ]
+
+
+def to_todo_response(todo: Todo) -> TodoResponse:
+    return TodoResponse(
+        id=str(todo.id),
+        user_id=str(todo.user_id),
+        title=todo.title,
+        description=todo.description,
+        is_completed=todo.is_completed,
+        start_at=todo.start_at,
+        end_at=todo.end_at,
+        all_day=todo.all_day,
+        color=todo.color,
+        focus_minutes=todo.focus_minutes,
+        created_at=todo.created_at,
+        updated_at=todo.updated_at,
+    )
@@ -0,0 +1,84 @@
+"""
+进程内缓存工具
+"""
+
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Generic, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    带过期时间的 LRU 缓存
+
+    仅在单个 worker 的事件循环内使用（非线程安全）；
+    读取只刷新 LRU 顺序，不延长过期时间，保证跨 worker 的数据最多陈旧 ttl 秒。
+
+    invalidate() 删除条目并记下失效时间：读库重建缓存的一方先取 time.monotonic()，
+    用 set_if_unchanged() 写回，读取期间被失效过的键不会被旧数据覆盖。
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        # 键 -> 最近一次失效的 time.monotonic()（按时间先后排列，超过 ttl 或 maxsize 即丢弃）
+        self._invalidated: OrderedDict[K, float] = OrderedDict()
+        self._cleared_at = float("-inf")
+
+    def get(self, key: K) -> V | None:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def set_if_unchanged(self, key: K, value: V, since: float) -> bool:
+        """
+        仅当 since（开始读库时的 time.monotonic()）之后该键未被失效时写入
+        """
+        invalidated_at = max(
+            self._invalidated.get(key, self._cleared_at), self._cleared_at
+        )
+        if invalidated_at >= since:
+            return False
+        self.set(key, value)
+        return True
+
+    def invalidate(self, key: K) -> None:
+        self._data.pop(key, None)
+        now = time.monotonic()
+        self._invalidated[key] = now
+        self._invalidated.move_to_end(key)
+        while self._invalidated:
+            oldest_key, oldest = next(iter(self._invalidated.items()))
+            if len(self._invalidated) <= self.maxsize and oldest > now - self.ttl:
+                break
+            del self._invalidated[oldest_key]
+
+    def pop(self, key: K) -> V | None:
+        entry = self._data.pop(key, None)
+        return entry[1] if entry else None
+
+    def clear(self) -> None:
+        # 相当于所有键同时失效
+        self._data.clear()
+        self._invalidated.clear()
+        self._cleared_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._data)
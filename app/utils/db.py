@@ -0,0 +1,64 @@
+"""
+数据库语句工具
+"""
+
+from functools import lru_cache
+from typing import Any
+
+from sqlalchemy import RowMapping, Select, Table, bindparam, literal, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.database import mark_writes
+
+
+async def get_or_create(
+    db: AsyncSession, table: Table, key: str, values: dict[str, Any]
+) -> RowMapping:
+    """
+    单语句 get-or-create（不提交）
+
+    WITH ins AS (INSERT ... ON CONFLICT (key) DO NOTHING RETURNING *)
+    SELECT * FROM ins UNION ALL SELECT * FROM table WHERE key = :key LIMIT 1
+
+    行已存在时不产生写入；两个并发的首次请求不会撞唯一约束。
+    极少数情况下并发插入尚未对本语句快照可见，此时补一次普通查询。
+    实际插入了行时标记会话有写入，由请求级会话提交。
+    """
+    statement, fallback = _get_or_create_statements(table, key, tuple(sorted(values)))
+    row = (await db.execute(statement, values)).mappings().first()
+    if row is not None and row["_created"]:
+        mark_writes(db)
+    if row is None:
+        result = await db.execute(fallback, {key: values[key]})
+        row = result.mappings().one()
+    return row
+
+
+@lru_cache(maxsize=64)
+def _get_or_create_statements(
+    table: Table, key: str, columns: tuple[str, ...]
+) -> tuple[Select, Select]:
+    """
+    按 (表, 键, 列) 构造一次语句，取值全部走绑定参数，
+    每次调用不再重建 CTE，编译结果命中引擎缓存
+    """
+    key_column = table.c[key]
+    inserted = (
+        insert(table)
+        .values({name: bindparam(name, type_=table.c[name].type) for name in columns})
+        .on_conflict_do_nothing(index_elements=[key_column])
+        .returning(*table.c)
+        .cte("inserted")
+    )
+    existing = select(table).where(key_column == bindparam(key))
+    statement = (
+        select(inserted, literal(True).label("_created"))
+        .union_all(
+            select(table, literal(False).label("_created")).where(
+                key_column == bindparam(key)
+            )
+        )
+        .limit(1)
+    )
+    return statement, existing
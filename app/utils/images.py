@@ -0,0 +1,75 @@
+"""
+头像图片处理：解码、去元数据、裁剪缩放为多尺寸 WebP（在进程池中执行）
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from app.core.config import settings
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def render_avatar_variants(
+    data: bytes, sizes: tuple[int, ...], quality: int, max_pixels: int
+) -> dict[int, bytes]:
+    """
+    把上传的图片转为多个尺寸的正方形 WebP
+
+    只保留像素数据（EXIF / ICC 等元数据全部丢弃），按 EXIF 方向摆正后居中裁剪。
+    在子进程中运行，异常统一转为 ValueError 以便跨进程传回。
+    """
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        with Image.open(BytesIO(data)) as image:
+            largest = max(sizes)
+            # JPEG 可在解码阶段直接按比例缩小，省掉大部分解码开销
+            image.draft("RGB", (largest * 2, largest * 2))
+            image = ImageOps.exif_transpose(image)
+            image = image.convert(
+                "RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB"
+            )
+            square = ImageOps.fit(image, (largest, largest), Image.Resampling.LANCZOS)
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError(f"invalid image: {e}") from None
+
+    variants: dict[int, bytes] = {}
+    for size in sorted(sizes, reverse=True):
+        if square.width != size:
+            square = square.resize((size, size), Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        square.save(buffer, format="WEBP", quality=quality, method=4)
+        variants[size] = buffer.getvalue()
+    return variants
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.avatar_process_workers)
+    return _pool
+
+
+async def process_avatar(data: bytes) -> dict[int, bytes]:
+    """
+    在进程池中生成头像各尺寸，不占用事件循环和 GIL
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_pool(),
+        render_avatar_variants,
+        data,
+        tuple(settings.avatar_sizes),
+        settings.avatar_webp_quality,
+        settings.avatar_max_pixels,
+    )
+
+
+def shutdown_image_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
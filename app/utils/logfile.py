@@ -0,0 +1,35 @@
+"""
+本地滚动日志文件（慢查询、链路追踪等按行写入的诊断输出）
+"""
+
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+
+
+def rotating_file_logger(
+    name: str, path: str, max_bytes: int, backups: int
+) -> logging.Logger:
+    """
+    返回只写入指定文件的日志器（不向上传播，每行原样输出消息）
+
+    调用方（通常在事件循环上）只把记录放入队列，写文件与滚动由后台线程（QueueListener）完成，
+    进程退出时写完队列中剩余的记录。首次调用时创建目录与文件；同名日志器重复调用不会重复添加处理器
+    """
+    file_logger = logging.getLogger(name)
+    if not file_logger.handlers:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        records: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+        listener = QueueListener(records, handler)
+        listener.start()
+        atexit.register(listener.stop)
+        file_logger.addHandler(QueueHandler(records))
+        file_logger.setLevel(logging.INFO)
+        file_logger.propagate = False
+    return file_logger
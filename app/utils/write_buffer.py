@@ -0,0 +1,154 @@
+"""
+写缓冲（write-behind）：把零散的写入攒成批量，由后台任务统一落库
+"""
+
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+# 停止信号
+_STOP = object()
+
+
+class WriteBuffer:
+    """
+    有界写缓冲
+
+    - submit(): 入队，队列满时最多等待 enqueue_timeout 秒（背压），仍满或未在运行则返回 False
+    - 后台任务每攒够 batch_size 行或距首行 flush_interval 秒即调用一次 flush(rows)
+    - stop(): 停止接收并把队列中剩余的行全部写完
+
+    flush 抛出 permanent_errors（如外键、约束错误）时整批重试无用：二分拆批，
+    只把单独仍失败的行交给 dead_letter；其他异常按批重试 max_retries 次，仍失败则整批交给 dead_letter。
+    拆批后已落库的部分可能被再次传入，flush 须幂等。
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[list[Any]], Awaitable[None]],
+        flush_interval: float,
+        batch_size: int,
+        max_queue: int,
+        enqueue_timeout: float,
+        max_retries: int = 3,
+        permanent_errors: tuple[type[Exception], ...] = (),
+        dead_letter: Callable[[list[Any], Exception], None] | None = None,
+    ):
+        self._flush = flush
+        self.permanent_errors = permanent_errors
+        self._dead_letter = dead_letter
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.enqueue_timeout = enqueue_timeout
+        self.max_retries = max_retries
+        self._max_queue = max_queue
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._accepting = False
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    def start(self) -> None:
+        if self._task is not None:
+            return
+        # 队列需在事件循环内创建
+        self._queue = asyncio.Queue(maxsize=self._max_queue)
+        self._task = asyncio.create_task(self._run())
+        self._accepting = True
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._accepting = False
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        self._queue = None
+
+    async def submit(self, item: Any) -> bool:
+        # 未启动或已停止（stop() 之后队列不再被消费）
+        if not self._accepting:
+            return False
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(self._queue.put(item), self.enqueue_timeout)
+            return True
+        except TimeoutError:
+            return False
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self._queue.get(), timeout)
+                    except TimeoutError:
+                        break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._flush_with_retry(batch)
+
+    async def _flush_with_retry(self, batch: list[Any]) -> None:
+        error: Exception | None = None
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await self._flush(batch)
+                return
+            except self.permanent_errors as exc:
+                if len(batch) == 1:
+                    self._drop(batch, exc)
+                    return
+                middle = len(batch) // 2
+                logger.warning(
+                    "写缓冲落库失败（%s），拆分 %d 行重试",
+                    type(exc).__name__,
+                    len(batch),
+                )
+                await self._flush_with_retry(batch[:middle])
+                await self._flush_with_retry(batch[middle:])
+                return
+            except Exception as exc:
+                error = exc
+                logger.exception(
+                    "写缓冲落库失败（第 %d/%d 次，%d 行）",
+                    attempt,
+                    self.max_retries,
+                    len(batch),
+                )
+                await asyncio.sleep(0.1 * attempt)
+        self._drop(batch, error)
+
+    def _drop(self, batch: list[Any], error: Exception) -> None:
+        logger.error(
+            "写缓冲丢弃 %d 行（%s: %s）", len(batch), type(error).__name__, error
+        )
+        if self._dead_letter is not None:
+            try:
+                self._dead_letter(batch, error)
+            except Exception:
+                logger.exception("写缓冲死信记录失败")
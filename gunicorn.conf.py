@@ -0,0 +1,23 @@
+"""
+Gunicorn 配置（在工作目录下自动加载，命令行参数优先）
+
+设置 PROMETHEUS_MULTIPROC_DIR 时启用 Prometheus 多进程模式：
+启动前清空共享目录，worker 退出时清理其存活类指标
+"""
+
+import os
+import shutil
+
+
+def on_starting(server):
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -16,19 +16,17 @@ CREATE TABLE IF NOT EXISTS users (
 
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
 
--- 用户资料表
+-- 用户资料表（主键即用户ID）
 CREATE TABLE IF NOT EXISTS profiles (
-    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-    user_id UUID UNIQUE NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    id UUID PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
     name VARCHAR(100),
     school VARCHAR(200),
     avatar TEXT,
+    avatar_variants JSONB,               -- 各尺寸头像 URL {"64": ..., "128": ..., "256": ...}
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
-CREATE INDEX IF NOT EXISTS idx_profiles_user_id ON profiles(user_id);
-
 -- 待办事项表（含日历功能）
 CREATE TABLE IF NOT EXISTS todos (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -40,11 +38,12 @@ CREATE TABLE IF NOT EXISTS todos (
     end_at TIMESTAMP WITH TIME ZONE,    -- 日历结束时间
     all_day BOOLEAN DEFAULT FALSE,       -- 是否全天事件
     color VARCHAR(20),                   -- 事件颜色
+    focus_minutes INTEGER NOT NULL DEFAULT 0,  -- 关联番茄钟累计专注分钟数
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
-CREATE INDEX IF NOT EXISTS idx_todos_user_id ON todos(user_id);
+CREATE INDEX IF NOT EXISTS idx_todos_user_created ON todos(user_id, created_at);
 CREATE INDEX IF NOT EXISTS idx_todos_start_at ON todos(start_at);
 CREATE INDEX IF NOT EXISTS idx_todos_is_completed ON todos(is_completed);
 
@@ -52,15 +51,42 @@ CREATE INDEX IF NOT EXISTS idx_todos_is_completed ON todos(is_completed);
 CREATE TABLE IF NOT EXISTS pomodoro_sessions (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    title VARCHAR(200),
+    client_id VARCHAR(64),               -- 客户端生成的会话ID（离线补传去重）
+    todo_id UUID REFERENCES todos(id) ON DELETE SET NULL,  -- 关联的待办
+    title VARCHAR(500),
     duration INTEGER NOT NULL,
     completed_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    CONSTRAINT uq_pomodoro_sessions_user_client UNIQUE (user_id, client_id)
 );
 
-CREATE INDEX IF NOT EXISTS idx_pomodoro_sessions_user_id ON pomodoro_sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_pomodoro_sessions_user_completed ON pomodoro_sessions(user_id, completed_at);
 CREATE INDEX IF NOT EXISTS idx_pomodoro_sessions_completed_at ON pomodoro_sessions(completed_at);
+CREATE INDEX IF NOT EXISTS idx_pomodoro_sessions_todo_id ON pomodoro_sessions(todo_id);
+
+-- 番茄钟每日汇总表（热力图等统计，避免扫描会话表）
+CREATE TABLE IF NOT EXISTS pomodoro_daily_stats (
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    day DATE NOT NULL,                   -- UTC 自然日
+    focus_minutes INTEGER NOT NULL DEFAULT 0,
+    session_count INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (user_id, day)
+);
+
+-- 番茄钟周排行榜汇总表（按周分区键，新的一周自然从空开始）
+CREATE TABLE IF NOT EXISTS pomodoro_weekly_totals (
+    week_start DATE NOT NULL,            -- ISO 周一（UTC）
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    school VARCHAR(200),                 -- 冗余自 profiles.school，供学校榜过滤
+    focus_minutes INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (week_start, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_weekly_totals_rank ON pomodoro_weekly_totals(week_start, focus_minutes);
+CREATE INDEX IF NOT EXISTS idx_weekly_totals_school_rank ON pomodoro_weekly_totals(week_start, school, focus_minutes);
 
 -- 番茄钟设置表
 CREATE TABLE IF NOT EXISTS pomodoro_settings (
@@ -80,16 +106,37 @@ CREATE INDEX IF NOT EXISTS idx_pomodoro_settings_user_id ON pomodoro_settings(us
 CREATE TABLE IF NOT EXISTS refresh_tokens (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-    token VARCHAR(500) UNIQUE NOT NULL,
+    token_hash VARCHAR(255) UNIQUE NOT NULL,  -- 令牌的 bcrypt 哈希
+    lookup VARCHAR(16),                  -- 令牌查找键（SHA-256 前 16 位），定位后再做 bcrypt 校验
     expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
-    is_revoked BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
-CREATE INDEX IF NOT EXISTS idx_refresh_tokens_token ON refresh_tokens(token);
 CREATE INDEX IF NOT EXISTS idx_refresh_tokens_user_id ON refresh_tokens(user_id);
+CREATE INDEX IF NOT EXISTS ix_refresh_tokens_lookup ON refresh_tokens(lookup);
 CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires_at ON refresh_tokens(expires_at);
 
+-- 密码重置令牌表
+CREATE TABLE IF NOT EXISTS password_reset_tokens (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    token_hash VARCHAR(255) UNIQUE NOT NULL,  -- 令牌的 bcrypt 哈希
+    lookup VARCHAR(16),                  -- 令牌查找键，同 refresh_tokens.lookup
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    used BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_password_reset_tokens_user_id ON password_reset_tokens(user_id);
+CREATE INDEX IF NOT EXISTS ix_password_reset_tokens_lookup ON password_reset_tokens(lookup);
+
+-- 用户分片迁移记录表（仅 0 号分片使用，优先于一致性哈希；不引用 users，用户可能在其他分片）
+CREATE TABLE IF NOT EXISTS user_shard_overrides (
+    user_id UUID PRIMARY KEY,
+    shard INTEGER NOT NULL,
+    moved_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
 -- 更新时间触发器函数
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
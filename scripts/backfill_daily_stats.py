@@ -0,0 +1,99 @@
+"""
+每日汇总回填：从番茄钟会话表重建 pomodoro_daily_stats
+
+用法（在项目根目录执行，读取与应用相同的 .env 配置）：
+    python -m scripts.backfill_daily_stats                  # 各分片上所有有会话的用户
+    python -m scripts.backfill_daily_stats --user <用户ID>   # 单个用户
+    python -m scripts.backfill_daily_stats --batch 200      # 每批（每个事务）的用户数
+
+汇总表上线之前的历史会话需要回填一次；汇总与会话不一致（数据修复）时也可重跑，结果相同。
+按用户整体重写有会话的日期，提交后各 worker 的热力图缓存随之失效。
+执行期间同一用户新写入的会话可能未计入，请在低峰期执行，或事后对该用户重跑。
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from collections.abc import AsyncIterator
+
+from sqlalchemy import select
+
+from app.models.database import (
+    close_db,
+    open_shard_session,
+    refresh_shard_overrides,
+    shard_router,
+)
+from app.models.orm import PomodoroSession
+from app.services.focus_stats_service import FocusStatsService
+
+
+async def user_batches(shard: int, batch: int) -> AsyncIterator[list[uuid.UUID]]:
+    """按用户ID顺序分批列出分片上有会话的用户"""
+    after: uuid.UUID | None = None
+    while True:
+        stmt = (
+            select(PomodoroSession.user_id)
+            .distinct()
+            .order_by(PomodoroSession.user_id)
+            .limit(batch)
+        )
+        if after is not None:
+            stmt = stmt.where(PomodoroSession.user_id > after)
+        async with open_shard_session(shard) as db:
+            user_ids = list(await db.scalars(stmt))
+        if not user_ids:
+            return
+        yield user_ids
+        after = user_ids[-1]
+
+
+async def rebuild(shard: int, user_ids: list[uuid.UUID]) -> None:
+    """在一个事务里重建一批用户的每日汇总"""
+    async with open_shard_session(shard) as db:
+        service = FocusStatsService(db)
+        for user_id in user_ids:
+            await service.rebuild_daily_stats(user_id)
+        await db.commit()
+
+
+async def backfill_shard(shard: int, batch: int) -> int:
+    """回填一个分片，返回处理的用户数"""
+    done = 0
+    started = time.perf_counter()
+    async for user_ids in user_batches(shard, batch):
+        await rebuild(shard, user_ids)
+        done += len(user_ids)
+        elapsed = time.perf_counter() - started
+        print(f"分片 {shard}: {done} 个用户，{done / elapsed:,.0f} 用户/秒")
+    return done
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="从会话表重建每日汇总")
+    parser.add_argument("--user", type=uuid.UUID, default=None, help="只重建该用户")
+    parser.add_argument(
+        "--batch", type=int, default=500, help="每批（每个事务）的用户数"
+    )
+    args = parser.parse_args()
+    if args.batch < 1:
+        raise SystemExit("--batch 须为正整数")
+
+    try:
+        if args.user is not None:
+            if shard_router.enabled:
+                await refresh_shard_overrides()
+            await rebuild(shard_router.shard_for(args.user), [args.user])
+            print(f"已重建 {args.user}")
+            return
+        total = 0
+        for shard in range(len(shard_router.engines)):
+            total += await backfill_shard(shard, args.batch)
+        print(f"共重建 {total} 个用户")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,377 @@
+"""
+合成数据生成器（规模测试用）
+
+按 app/models/orm.py 的表结构生成用户、资料、番茄钟设置、待办、番茄钟会话、刷新令牌，
+以及与会话一致的汇总表（pomodoro_daily_stats / pomodoro_weekly_totals、todos.focus_minutes），
+分批通过 COPY 写入各自所在的分片。每个用户的数据只由 (--seed, 用户序号, --until) 决定，
+同样的参数总是生成同样的数据，与批大小无关。
+
+    python -m scripts.generate_dataset --scale 0.01            # 1 万用户
+    python -m scripts.generate_dataset --users 1000000 --seed 7 --until 2025-06-30
+    python -m scripts.generate_dataset --scale 0.1 --todos pareto:1.1,8 --sessions lognormal:3,1.5
+
+分布写法（每个用户的行数）：
+    const:N  uniform:A,B  lognormal:MU,SIGMA  pareto:ALPHA,XM（XM × (Pareto 随机数 − 1)，长尾）
+
+所有用户的密码都是 --password（只计算一次 bcrypt，盐由 --seed 派生），可直接用于压测登录。
+请写入空库：邮箱按 seed 与序号生成，重复执行同一 seed 会违反唯一约束。
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import time
+import uuid
+from collections import defaultdict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import UTC, date, datetime, timedelta
+from typing import Any
+
+import bcrypt
+from sqlalchemy import text
+
+from app.models.database import close_db, shard_router
+from app.services.focus_stats_service import session_day
+from app.services.leaderboard_service import week_start_of
+
+# (表名, 列) 按外键依赖排序
+TABLES: list[tuple[str, tuple[str, ...]]] = [
+    (
+        "users",
+        (
+            "id",
+            "email",
+            "password_hash",
+            "is_verified",
+            "is_active",
+            "created_at",
+            "updated_at",
+        ),
+    ),
+    ("profiles", ("id", "name", "school", "created_at", "updated_at")),
+    (
+        "pomodoro_settings",
+        (
+            "id",
+            "user_id",
+            "work_time",
+            "short_break_time",
+            "long_break_time",
+            "sessions_until_long_break",
+            "created_at",
+            "updated_at",
+        ),
+    ),
+    (
+        "todos",
+        (
+            "id",
+            "user_id",
+            "title",
+            "description",
+            "is_completed",
+            "start_at",
+            "end_at",
+            "all_day",
+            "color",
+            "focus_minutes",
+            "created_at",
+            "updated_at",
+        ),
+    ),
+    (
+        "pomodoro_sessions",
+        (
+            "id",
+            "user_id",
+            "client_id",
+            "todo_id",
+            "title",
+            "duration",
+            "completed_at",
+            "created_at",
+            "updated_at",
+        ),
+    ),
+    (
+        "pomodoro_daily_stats",
+        ("user_id", "day", "focus_minutes", "session_count", "updated_at"),
+    ),
+    (
+        "pomodoro_weekly_totals",
+        ("week_start", "user_id", "school", "focus_minutes", "updated_at"),
+    ),
+    (
+        "refresh_tokens",
+        ("id", "user_id", "token_hash", "lookup", "expires_at", "created_at"),
+    ),
+]
+
+_SCHOOLS = [f"School {i:03d}" for i in range(200)]
+_COLORS = ["#ef4444", "#f59e0b", "#10b981", "#3b82f6", "#8b5cf6", None]
+_DURATIONS = [25, 25, 25, 25, 50, 15, 45]
+# bcrypt 的 base64 字母表
+_BCRYPT_ALPHABET = "./ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
+
+
+def parse_distribution(spec: str) -> Callable[[random.Random], int]:
+    """解析分布写法，返回 rng -> 非负整数 的采样函数"""
+    kind, _, raw = spec.partition(":")
+    params = [float(value) for value in raw.split(",") if value]
+    if kind == "const" and len(params) == 1:
+        return lambda rng: int(params[0])
+    if kind == "uniform" and len(params) == 2:
+        low, high = int(params[0]), int(params[1])
+        return lambda rng: rng.randint(low, high)
+    if kind == "lognormal" and len(params) == 2:
+        return lambda rng: int(rng.lognormvariate(params[0], params[1]))
+    if kind == "pareto" and len(params) == 2:
+        return lambda rng: int(params[1] * (rng.paretovariate(params[0]) - 1))
+    raise argparse.ArgumentTypeError(f"无法解析的分布: {spec}")
+
+
+@dataclass
+class Batch:
+    """一批待写入的行：分片 -> 表名 -> 行"""
+
+    rows: dict[int, dict[str, list[tuple[Any, ...]]]] = field(
+        default_factory=lambda: defaultdict(lambda: defaultdict(list))
+    )
+    count: int = 0
+
+
+def _uuid(rng: random.Random) -> uuid.UUID:
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def _bcrypt_chars(rng: random.Random, length: int, last_step: int) -> str:
+    # 盐 22 位（last_step=16）、摘要 31 位（last_step=4），末位字符的低位必须为 0
+    head = "".join(rng.choice(_BCRYPT_ALPHABET) for _ in range(length - 1))
+    return head + _BCRYPT_ALPHABET[rng.randrange(0, 64, last_step)]
+
+
+def _token_hash(rng: random.Random) -> str:
+    """
+    格式合法、互不相同的 bcrypt 哈希（cost 4，没有对应的明文）：校验时正常返回 False，
+    不会像非 bcrypt 字符串那样抛错；token_hash 有唯一约束，不能所有行共用一个预计算哈希
+    """
+    return f"$2b$04${_bcrypt_chars(rng, 22, 16)}{_bcrypt_chars(rng, 31, 4)}"
+
+
+def password_hash_for_seed(password: str, seed: int) -> str:
+    """
+    盐由 seed 派生的 bcrypt 哈希（cost 12，与 passlib 默认一致）：同样的 seed 与密码总是得到
+    同一哈希，应用照常校验；get_password_hash() 的随机盐会让每次生成的 users 表都不同
+    """
+    salt = f"$2b$12${_bcrypt_chars(random.Random(f'{seed}:password'), 22, 16)}"
+    return bcrypt.hashpw(password.encode(), salt.encode()).decode()
+
+
+def generate_user(
+    index: int, args: argparse.Namespace, password_hash: str, until: datetime
+) -> dict[str, list[tuple[Any, ...]]]:
+    """生成一个用户的全部行（表名 -> 行），只依赖 seed 与序号"""
+    rng = random.Random(f"{args.seed}:{index}")
+    user_id = _uuid(rng)
+    joined = until - timedelta(days=rng.uniform(1, args.days))
+    school = rng.choice(_SCHOOLS) if rng.random() < 0.7 else None
+    rows: dict[str, list[tuple[Any, ...]]] = defaultdict(list)
+
+    rows["users"].append(
+        (
+            user_id,
+            f"user-{args.seed}-{index}@synthetic.example",
+            password_hash,
+            rng.random() < 0.8,
+            rng.random() < 0.99,
+            joined,
+            joined,
+        )
+    )
+    rows["profiles"].append((user_id, f"User {index}", school, joined, joined))
+    if rng.random() < 0.4:
+        rows["pomodoro_settings"].append(
+            (
+                _uuid(rng),
+                user_id,
+                rng.choice([25, 30, 45, 50]),
+                5,
+                rng.choice([15, 20]),
+                4,
+                joined,
+                joined,
+            )
+        )
+
+    # 会话先于待办生成：待办的 focus_minutes 是关联会话时长之和
+    active_seconds = max((until - joined).total_seconds(), 1.0)
+    todo_ids = [_uuid(rng) for _ in range(min(args.todos_dist(rng), args.max_per_user))]
+    focus = [0] * len(todo_ids)
+    daily: dict[date, list[int]] = defaultdict(lambda: [0, 0])
+    weekly: dict[date, int] = defaultdict(int)
+    for _ in range(min(args.sessions_dist(rng), args.max_per_user)):
+        completed = joined + timedelta(seconds=rng.uniform(0, active_seconds))
+        duration = rng.choice(_DURATIONS)
+        todo_id = None
+        if todo_ids and rng.random() < 0.5:
+            slot = rng.randrange(len(todo_ids))
+            todo_id = todo_ids[slot]
+            focus[slot] += duration
+        rows["pomodoro_sessions"].append(
+            (
+                _uuid(rng),
+                user_id,
+                f"c{rng.getrandbits(48):012x}",
+                todo_id,
+                "Focus",
+                duration,
+                completed,
+                completed,
+                completed,
+            )
+        )
+        day = session_day(completed)
+        daily[day][0] += duration
+        daily[day][1] += 1
+        weekly[week_start_of(day)] += duration
+
+    for slot, todo_id in enumerate(todo_ids):
+        created = joined + timedelta(seconds=rng.uniform(0, active_seconds))
+        scheduled = rng.random() < 0.3
+        start_at = (
+            created + timedelta(hours=rng.randint(1, 24 * 14)) if scheduled else None
+        )
+        rows["todos"].append(
+            (
+                todo_id,
+                user_id,
+                f"Todo {slot}",
+                "Synthetic todo" if rng.random() < 0.3 else None,
+                rng.random() < 0.6,
+                start_at,
+                start_at + timedelta(hours=1) if start_at else None,
+                False,
+                rng.choice(_COLORS),
+                focus[slot],
+                created,
+                created,
+            )
+        )
+    rows["pomodoro_daily_stats"].extend(
+        (user_id, day, minutes, count, until) for day, (minutes, count) in daily.items()
+    )
+    rows["pomodoro_weekly_totals"].extend(
+        (week, user_id, school, minutes, until) for week, minutes in weekly.items()
+    )
+
+    for _ in range(min(args.tokens_dist(rng), args.max_per_user)):
+        issued = until - timedelta(days=rng.uniform(0, 7))
+        # lookup 随机：刷新时按 lookup 过滤，这些行不会进入 bcrypt 校验
+        rows["refresh_tokens"].append(
+            (
+                _uuid(rng),
+                user_id,
+                _token_hash(rng),
+                f"{rng.getrandbits(64):016x}",
+                issued + timedelta(days=7),
+                issued,
+            )
+        )
+    return rows
+
+
+async def copy_batch(batch: Batch) -> None:
+    """每个分片一个事务，按外键顺序 COPY 各表"""
+    for shard, tables in batch.rows.items():
+        async with shard_router.engines[shard].connect() as conn:
+            raw = await conn.get_raw_connection()
+            driver = raw.driver_connection
+            async with driver.transaction():
+                for table, columns in TABLES:
+                    if tables.get(table):
+                        await driver.copy_records_to_table(
+                            table, records=tables[table], columns=list(columns)
+                        )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="合成数据生成器")
+    parser.add_argument("--users", type=int, default=1_000_000, help="基准用户数")
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="规模系数（用户数 × scale）"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--until",
+        type=date.fromisoformat,
+        default=None,
+        help="数据截止日期（UTC，默认今天；固定它才能逐字节复现）",
+    )
+    parser.add_argument(
+        "--days", type=int, default=365, help="注册时间分布在截止日前多少天内"
+    )
+    parser.add_argument(
+        "--todos",
+        dest="todos_dist",
+        type=parse_distribution,
+        default=parse_distribution("lognormal:2.3,1.1"),
+    )
+    parser.add_argument(
+        "--sessions",
+        dest="sessions_dist",
+        type=parse_distribution,
+        default=parse_distribution("pareto:1.3,40"),
+    )
+    parser.add_argument(
+        "--refresh-tokens",
+        dest="tokens_dist",
+        type=parse_distribution,
+        default=parse_distribution("uniform:0,3"),
+    )
+    parser.add_argument(
+        "--max-per-user", type=int, default=20_000, help="每用户每表行数上限"
+    )
+    parser.add_argument("--batch-size", type=int, default=5_000, help="每批用户数")
+    parser.add_argument("--password", default="synthetic-password")
+    parser.add_argument(
+        "--no-analyze", action="store_true", help="写入后不执行 ANALYZE"
+    )
+    args = parser.parse_args()
+
+    total = math.ceil(args.users * args.scale)
+    until_day = args.until or datetime.now(UTC).date()
+    until = datetime.combine(until_day, datetime.min.time(), tzinfo=UTC)
+    password_hash = password_hash_for_seed(args.password, args.seed)
+
+    started = time.perf_counter()
+    rows_written = 0
+    try:
+        for first in range(0, total, args.batch_size):
+            batch = Batch()
+            for index in range(first, min(first + args.batch_size, total)):
+                user_rows = generate_user(index, args, password_hash, until)
+                shard = shard_router.shard_for(user_rows["users"][0][0])
+                for table, rows in user_rows.items():
+                    batch.rows[shard][table].extend(rows)
+                    batch.count += len(rows)
+            await copy_batch(batch)
+            rows_written += batch.count
+            done = min(first + args.batch_size, total)
+            elapsed = time.perf_counter() - started
+            print(
+                f"{done}/{total} 用户，{rows_written} 行，{rows_written / elapsed:,.0f} 行/秒"
+            )
+
+        if not args.no_analyze:
+            for target in shard_router.engines:
+                async with target.connect() as conn:
+                    await conn.execute(text("ANALYZE"))
+                    await conn.commit()
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,390 @@
+"""
+HTTP 压测
+
+默认在本进程内通过 ASGI 直接驱动 app（执行完整的生命周期与中间件，连接 .env 中配置的 Postgres），
+也可用 --base-url 压测已启动的服务（需与本工具连接同一个数据库，用于准备数据）。
+每个场景以 --concurrency 个并发循环请求 --duration 秒，结果写入 JSON，便于比较两次提交：
+
+    docker compose up -d postgres
+    python -m scripts.load_test --out bench/load-$(git rev-parse --short HEAD).json
+    python -m scripts.load_test --scenarios todo_list_10k,todo_toggle --duration 30
+    python -m scripts.load_test compare bench/load-old.json bench/load-new.json
+
+场景：
+    login_storm      POST /token（bcrypt 校验 + 写刷新令牌）
+    refresh_storm    POST /refresh
+    todo_list_10k    GET /todos，单个用户 1 万条待办
+    focus_report_week  GET /todos/focus-report，本周时间窗口（每个用户预置本周关联待办的番茄钟会话）
+    todo_toggle      PUT /todos/{id} 切换完成状态
+    pomodoro_burst   POST /pomodoro/sessions
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import subprocess
+import sys
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import httpx
+from sqlalchemy import insert
+
+from app.models.database import close_db, open_shard_session, shard_router
+from app.models.orm import PomodoroSession, Todo
+
+_PASSWORD = "load-test-password"
+_HEAVY_TODOS = 10_000
+_WEEK_TODOS = 40
+_WEEK_SESSIONS = 120
+
+
+@dataclass
+class Context:
+    """准备好的压测数据"""
+
+    users: list[dict[str, Any]] = field(
+        default_factory=list
+    )  # email / id / access / refresh / todos
+    heavy: dict[str, Any] = field(default_factory=dict)
+
+    def user(self, n: int) -> dict[str, Any]:
+        return self.users[n % len(self.users)]
+
+
+def _auth(user: dict[str, Any]) -> dict[str, str]:
+    return {"Authorization": f"Bearer {user['access']}"}
+
+
+async def _register(client: httpx.AsyncClient, email: str) -> dict[str, Any]:
+    response = await client.post(
+        "/register", json={"email": email, "password": _PASSWORD}
+    )
+    response.raise_for_status()
+    user = {"email": email, "id": uuid.UUID(response.json()["id"])}
+    response = await client.post("/token", json={"email": email, "password": _PASSWORD})
+    response.raise_for_status()
+    tokens = response.json()
+    user.update(access=tokens["access_token"], refresh=tokens["refresh_token"])
+    return user
+
+
+async def _seed_todos(
+    user_id: uuid.UUID, count: int, week_start: datetime
+) -> list[str]:
+    # 直接批量写库：1 万条逐个走 API 太慢
+    rows = [
+        {
+            "user_id": user_id,
+            "title": f"load test todo {i}",
+            "start_at": week_start + timedelta(hours=(i * 7) % (7 * 24)),
+            "end_at": week_start + timedelta(hours=(i * 7) % (7 * 24) + 1),
+        }
+        for i in range(count)
+    ]
+    ids: list[str] = []
+    async with open_shard_session(shard_router.shard_for(user_id)) as db:
+        for start in range(0, count, 1000):
+            result = await db.execute(
+                insert(Todo).returning(Todo.id), rows[start : start + 1000]
+            )
+            ids.extend(str(todo_id) for todo_id in result.scalars())
+        await db.commit()
+    return ids
+
+
+async def _seed_sessions(
+    user_id: uuid.UUID, todo_ids: list[str], count: int, week_start: datetime
+) -> None:
+    # 本周内、轮流关联各待办的会话（只供报表查询，不累加统计汇总）
+    rows = [
+        {
+            "user_id": user_id,
+            "todo_id": uuid.UUID(todo_ids[i % len(todo_ids)]),
+            "title": f"load test session {i}",
+            "duration": 25,
+            "completed_at": week_start + timedelta(minutes=(i * 83) % (7 * 24 * 60)),
+        }
+        for i in range(count)
+    ]
+    async with open_shard_session(shard_router.shard_for(user_id)) as db:
+        await db.execute(insert(PomodoroSession), rows)
+        await db.commit()
+
+
+async def prepare(
+    client: httpx.AsyncClient, users: int, week_start: datetime
+) -> Context:
+    run = uuid.uuid4().hex[:8]
+    ctx = Context()
+    ctx.users = list(
+        await asyncio.gather(
+            *(_register(client, f"load-{run}-{i}@example.com") for i in range(users))
+        )
+    )
+    for user in ctx.users:
+        user["todos"] = await _seed_todos(user["id"], _WEEK_TODOS, week_start)
+        await _seed_sessions(user["id"], user["todos"], _WEEK_SESSIONS, week_start)
+    ctx.heavy = await _register(client, f"load-{run}-heavy@example.com")
+    ctx.heavy["todos"] = await _seed_todos(ctx.heavy["id"], _HEAVY_TODOS, week_start)
+    return ctx
+
+
+Scenario = Callable[[httpx.AsyncClient, Context, int], Awaitable[httpx.Response]]
+
+
+def _week_start() -> datetime:
+    now = datetime.now(UTC)
+    return (now - timedelta(days=now.weekday())).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+async def login_storm(
+    client: httpx.AsyncClient, ctx: Context, n: int
+) -> httpx.Response:
+    return await client.post(
+        "/token", json={"email": ctx.user(n)["email"], "password": _PASSWORD}
+    )
+
+
+async def refresh_storm(
+    client: httpx.AsyncClient, ctx: Context, n: int
+) -> httpx.Response:
+    return await client.post("/refresh", json={"refresh_token": ctx.user(n)["refresh"]})
+
+
+async def todo_list_10k(
+    client: httpx.AsyncClient, ctx: Context, n: int
+) -> httpx.Response:
+    return await client.get("/todos", headers=_auth(ctx.heavy))
+
+
+async def focus_report_week(
+    client: httpx.AsyncClient, ctx: Context, n: int
+) -> httpx.Response:
+    start = _week_start()
+    params = {
+        "start": start.isoformat(),
+        "end": (start + timedelta(days=7)).isoformat(),
+    }
+    return await client.get(
+        "/todos/focus-report", params=params, headers=_auth(ctx.user(n))
+    )
+
+
+async def todo_toggle(
+    client: httpx.AsyncClient, ctx: Context, n: int
+) -> httpx.Response:
+    user = ctx.user(n)
+    todo_id = user["todos"][(n // len(ctx.users)) % len(user["todos"])]
+    return await client.put(
+        f"/todos/{todo_id}", json={"is_completed": n % 2 == 0}, headers=_auth(user)
+    )
+
+
+async def pomodoro_burst(
+    client: httpx.AsyncClient, ctx: Context, n: int
+) -> httpx.Response:
+    body = {
+        "title": "load test",
+        "duration": 25,
+        "completedAt": datetime.now(UTC).isoformat(),
+        "clientId": uuid.uuid4().hex,
+    }
+    return await client.post(
+        "/pomodoro/sessions", json=body, headers=_auth(ctx.user(n))
+    )
+
+
+SCENARIOS: dict[str, Scenario] = {
+    "login_storm": login_storm,
+    "refresh_storm": refresh_storm,
+    "todo_list_10k": todo_list_10k,
+    "focus_report_week": focus_report_week,
+    "todo_toggle": todo_toggle,
+    "pomodoro_burst": pomodoro_burst,
+}
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """最近秩百分位"""
+    if not sorted_values:
+        return 0.0
+    rank = (
+        min(len(sorted_values), max(1, math.ceil(pct / 100 * len(sorted_values)))) - 1
+    )
+    return sorted_values[rank]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict[str, float]:
+    ordered = sorted(latencies)
+    ms = 1000
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * ms, 2),
+        "p95_ms": round(percentile(ordered, 95) * ms, 2),
+        "p99_ms": round(percentile(ordered, 99) * ms, 2),
+        "max_ms": round((ordered[-1] if ordered else 0.0) * ms, 2),
+    }
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    ctx: Context,
+    scenario: Scenario,
+    concurrency: int,
+    duration: float,
+) -> dict[str, float]:
+    latencies: list[float] = []
+    errors = 0
+    counter = 0
+    start = time.perf_counter()
+    deadline = start + duration
+
+    async def worker() -> None:
+        nonlocal errors, counter
+        while time.perf_counter() < deadline:
+            n = counter
+            counter += 1
+            begin = time.perf_counter()
+            try:
+                response = await scenario(client, ctx, n)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - begin)
+            errors += failed
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    names = args.scenarios.split(",") if args.scenarios else list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"未知场景: {', '.join(sorted(unknown))}")
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout)
+        lifespan = None
+    else:
+        from app.main import app
+
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://load-test",
+            timeout=args.timeout,
+        )
+        lifespan = app.router.lifespan_context(app)
+
+    results: dict[str, Any] = {}
+    async with client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            ctx = await prepare(client, args.users, _week_start())
+            for name in names:
+                # 预热一轮，不计入结果
+                await run_scenario(
+                    client, ctx, SCENARIOS[name], args.concurrency, args.warmup
+                )
+                results[name] = await run_scenario(
+                    client, ctx, SCENARIOS[name], args.concurrency, args.duration
+                )
+                print(f"{name:<16} {json.dumps(results[name], ensure_ascii=False)}")
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+            else:
+                await close_db()
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(UTC).isoformat(),
+        "mode": args.base_url or "asgi",
+        "python": sys.version.split()[0],
+        "settings": {
+            "users": args.users,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+        },
+        "scenarios": results,
+    }
+
+
+def compare(old_path: str, new_path: str) -> None:
+    old = json.loads(Path(old_path).read_text())
+    new = json.loads(Path(new_path).read_text())
+    print(f"{old.get('commit')} -> {new.get('commit')}")
+    for name, after in new["scenarios"].items():
+        before = old["scenarios"].get(name)
+        if before is None:
+            continue
+        cells = []
+        for metric in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            change = (
+                (after[metric] - before[metric]) / before[metric] * 100
+                if before[metric]
+                else 0.0
+            )
+            cells.append(
+                f"{metric} {before[metric]} -> {after[metric]} ({change:+.1f}%)"
+            )
+        print(f"{name:<16} " + "  ".join(cells))
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(description="比较两次压测结果")
+        parser.add_argument("old")
+        parser.add_argument("new")
+        args = parser.parse_args(sys.argv[2:])
+        compare(args.old, args.new)
+        return
+
+    parser = argparse.ArgumentParser(description="HTTP 压测")
+    parser.add_argument("--scenarios", default="", help="逗号分隔，默认全部")
+    parser.add_argument(
+        "--base-url", default=None, help="压测已启动的服务（默认本进程内 ASGI）"
+    )
+    parser.add_argument("--users", type=int, default=20, help="准备的用户数")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--duration", type=float, default=15.0, help="每个场景的计时秒数"
+    )
+    parser.add_argument("--warmup", type=float, default=2.0, help="每个场景的预热秒数")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--out", default="bench/load.json", help="结果 JSON 路径")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"结果已写入 {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+"""
+用户分片迁移工具
+
+用法（在项目根目录执行，读取与应用相同的 .env 配置）：
+    python -m scripts.rebalance_shards plan              # 列出所在分片与路由不一致的用户
+    python -m scripts.rebalance_shards pin               # 追加分片前：把将被改路由的用户固定在当前分片
+    python -m scripts.rebalance_shards move <用户ID> [--to N]  # 迁移单个用户（默认迁到哈希环上的分片）
+    python -m scripts.rebalance_shards rebalance [--limit N] [--batch N]  # 把所有被固定的用户迁到哈希环上的分片
+
+追加分片的步骤：
+    1. 只在本工具的环境中把新库加到 DATABASE_SHARD_URLS，执行 pin
+    2. 应用配置加上新库并重新部署（被固定的用户仍按迁移记录路由，不受影响）
+    3. 执行 rebalance，按批迁移
+
+迁移过程（按批）：逐个复制到目标分片 -> 一次写入整批的迁移记录 -> 等待各 worker 刷新迁移记录
+（每批只等一次）-> 逐个再复制一次补齐等待期间写入旧分片的新行，并删除旧分片上的数据。
+等待期间对已有行的修改可能丢失，请在低峰期执行。
+"""
+
+import argparse
+import asyncio
+import uuid
+from collections.abc import Iterator, Sequence
+from typing import TypeVar
+
+from sqlalchemy import Table, delete, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.core.config import settings
+from app.models.database import (
+    close_db,
+    open_shard_session,
+    refresh_shard_overrides,
+    shard_router,
+)
+from app.models.orm import (
+    PasswordResetToken,
+    PomodoroDailyStat,
+    PomodoroSession,
+    PomodoroSettings,
+    PomodoroWeeklyTotal,
+    Profile,
+    RefreshToken,
+    Todo,
+    User,
+    UserShardOverride,
+)
+
+T = TypeVar("T")
+
+# asyncpg 单条语句最多 32767 个绑定参数：多行 INSERT 按列数分块
+MAX_BIND_PARAMS = 32767
+
+# 按外键依赖排序的用户数据表及其用户ID列
+USER_TABLES: list[tuple[Table, str]] = [
+    (User.__table__, "id"),
+    (Profile.__table__, "id"),
+    (PomodoroSettings.__table__, "user_id"),
+    (Todo.__table__, "user_id"),
+    (PomodoroSession.__table__, "user_id"),
+    (PomodoroDailyStat.__table__, "user_id"),
+    (PomodoroWeeklyTotal.__table__, "user_id"),
+    (RefreshToken.__table__, "user_id"),
+    (PasswordResetToken.__table__, "user_id"),
+]
+
+
+def chunked(rows: Sequence[T], width: int) -> Iterator[Sequence[T]]:
+    """按每行 width 个参数切分，每块的参数总数不超过 MAX_BIND_PARAMS"""
+    size = max(1, MAX_BIND_PARAMS // width)
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+async def locate_users() -> dict[uuid.UUID, int]:
+    """扫描各分片的 users 表：用户ID -> 当前所在分片"""
+    located: dict[uuid.UUID, int] = {}
+    for shard in range(len(shard_router.engines)):
+        async with open_shard_session(shard) as db:
+            result = await db.stream_scalars(select(User.id))
+            async for user_id in result:
+                located[user_id] = shard
+    return located
+
+
+async def locate_user(user_id: uuid.UUID) -> int | None:
+    """用户当前所在分片（不存在时为 None）"""
+    for shard in range(len(shard_router.engines)):
+        async with open_shard_session(shard) as db:
+            if await db.scalar(select(User.id).where(User.id == user_id)) is not None:
+                return shard
+    return None
+
+
+async def plan() -> list[tuple[uuid.UUID, int, int]]:
+    """返回 (用户ID, 当前分片, 应在分片) 列表"""
+    await refresh_shard_overrides()
+    return [
+        (user_id, current, shard_router.shard_for(user_id))
+        for user_id, current in (await locate_users()).items()
+        if shard_router.shard_for(user_id) != current
+    ]
+
+
+async def set_overrides(targets: dict[uuid.UUID, int]) -> None:
+    """在一个事务里写迁移记录（用户ID -> 分片）；目标就是哈希环上的分片时删除记录"""
+    unpinned = [
+        u for u, shard in targets.items() if shard == shard_router.ring_shard(u)
+    ]
+    pinned = [
+        {"user_id": u, "shard": shard}
+        for u, shard in targets.items()
+        if shard != shard_router.ring_shard(u)
+    ]
+    async with open_shard_session(0) as db:
+        for chunk in chunked(unpinned, 1):
+            await db.execute(
+                delete(UserShardOverride).where(UserShardOverride.user_id.in_(chunk))
+            )
+        for chunk in chunked(pinned, 2):
+            stmt = insert(UserShardOverride).values(list(chunk))
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[UserShardOverride.user_id],
+                set_={"shard": stmt.excluded.shard},
+            )
+            await db.execute(stmt)
+        await db.commit()
+
+
+async def pin() -> int:
+    """把所在分片与哈希环不一致的用户固定在当前分片，返回固定人数"""
+    targets = {user_id: current for user_id, current, _ in await plan()}
+    await set_overrides(targets)
+    return len(targets)
+
+
+async def copy_user(user_id: uuid.UUID, source: int, target: int) -> int:
+    """把用户数据从源分片复制到目标分片（已存在的行跳过），返回复制行数"""
+    copied = 0
+    async with open_shard_session(source) as src, open_shard_session(target) as dst:
+        for table, column in USER_TABLES:
+            result = await src.execute(select(table).where(table.c[column] == user_id))
+            rows = [dict(row) for row in result.mappings()]
+            for chunk in chunked(rows, len(table.columns)):
+                await dst.execute(
+                    insert(table).values(list(chunk)).on_conflict_do_nothing()
+                )
+            copied += len(rows)
+        await dst.commit()
+    return copied
+
+
+async def move_users(
+    moves: Sequence[tuple[uuid.UUID, int, int]], wait: bool = True
+) -> None:
+    """
+    迁移一批用户：moves 为 (用户ID, 源分片, 目标分片)。
+    整批的迁移记录一次写入，只等待一次 worker 刷新
+    """
+    copied = {
+        user_id: await copy_user(user_id, source, target)
+        for user_id, source, target in moves
+    }
+    await set_overrides({user_id: target for user_id, _, target in moves})
+    if wait:
+        # 等所有 worker 至少刷新一次迁移记录
+        await asyncio.sleep(settings.shard_override_refresh_seconds * 2)
+
+    for user_id, source, target in moves:
+        copied[user_id] += await copy_user(user_id, source, target)
+        # 删除 users 行，其余表随外键级联删除
+        async with open_shard_session(source) as db:
+            await db.execute(delete(User).where(User.id == user_id))
+            await db.commit()
+        print(f"{user_id}: 分片 {source} -> {target}，复制 {copied[user_id]} 行")
+
+
+async def move_user(
+    user_id: uuid.UUID, source: int, target: int | None = None, wait: bool = True
+) -> None:
+    """迁移单个用户；source 为其当前所在分片"""
+    if target is None:
+        target = shard_router.ring_shard(user_id)
+    if source == target:
+        await set_overrides({user_id: target})
+        print(f"{user_id} 已在分片 {target}")
+        return
+    await move_users([(user_id, source, target)], wait)
+
+
+async def rebalance(limit: int | None, batch: int, wait: bool) -> None:
+    await refresh_shard_overrides()
+    moves = [
+        (user_id, current, shard_router.ring_shard(user_id))
+        for user_id, current in (await locate_users()).items()
+        if shard_router.ring_shard(user_id) != current
+    ]
+    if limit is not None:
+        moves = moves[:limit]
+    for start in range(0, len(moves), batch):
+        await move_users(moves[start : start + batch], wait)
+    print(f"共迁移 {len(moves)} 个用户")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="用户分片迁移工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("plan")
+    sub.add_parser("pin")
+    move = sub.add_parser("move")
+    move.add_argument("user_id", type=uuid.UUID)
+    move.add_argument("--to", type=int, default=None)
+    move.add_argument(
+        "--no-wait", action="store_true", help="不等待 worker 刷新（仅限停机迁移）"
+    )
+    balance = sub.add_parser("rebalance")
+    balance.add_argument("--limit", type=int, default=None)
+    balance.add_argument(
+        "--batch",
+        type=int,
+        default=500,
+        help="每批迁移的用户数（每批等待一次 worker 刷新）",
+    )
+    balance.add_argument(
+        "--no-wait", action="store_true", help="不等待 worker 刷新（仅限停机迁移）"
+    )
+    args = parser.parse_args()
+
+    if not shard_router.enabled:
+        raise SystemExit("未配置 DATABASE_SHARD_URLS")
+    if (
+        args.command == "move"
+        and args.to is not None
+        and not 0 <= args.to < len(shard_router.engines)
+    ):
+        raise SystemExit(f"分片序号超出范围: {args.to}")
+    if args.command == "rebalance" and args.batch < 1:
+        raise SystemExit("--batch 须为正整数")
+
+    try:
+        if args.command == "plan":
+            for user_id, current, target in await plan():
+                print(f"{user_id}\t{current}\t->\t{target}")
+        elif args.command == "pin":
+            print(f"已固定 {await pin()} 个用户")
+        elif args.command == "move":
+            await refresh_shard_overrides()
+            source = await locate_user(args.user_id)
+            if source is None:
+                raise SystemExit(f"用户不存在: {args.user_id}")
+            await move_user(args.user_id, source, args.to, wait=not args.no_wait)
+        elif args.command == "rebalance":
+            await rebalance(args.limit, args.batch, wait=not args.no_wait)
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,48 @@
+"""
+测试公共配置
+
+集成测试（@pytest.mark.integration）连接 TEST_DATABASE_URL 指向的专用 Postgres 测试库，
+未设置时跳过；其余测试不连接数据库。
+"""
+
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 须在导入 app 之前设置：配置在导入时读取。
+# 在临时目录中运行，不读取工作目录下的 .env（部署配置），日志等相对路径也写到这里
+os.chdir(tempfile.mkdtemp(prefix="timehacker-tests-"))
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+_TEST_DATABASE_URL = os.environ.get("TEST_DATABASE_URL")
+if _TEST_DATABASE_URL:
+    os.environ["DATABASE_URL"] = _TEST_DATABASE_URL
+
+# 导入 app.main 时 load_dotenv() 会把仓库根目录的 .env 写进环境变量，子进程用导入前的快照
+_SUBPROCESS_ENV = {**os.environ, "PYTHONPATH": str(ROOT)}
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    # pytest.ini 的 [tool:pytest] 段不会被读取，标记在这里登记
+    config.addinivalue_line("markers", "integration: 需要 Postgres 测试库的集成测试")
+    config.addinivalue_line("markers", "slow: 运行较慢的测试")
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: list[pytest.Item]
+) -> None:
+    if _TEST_DATABASE_URL:
+        return
+    skip = pytest.mark.skip(reason="未设置 TEST_DATABASE_URL")
+    for item in items:
+        if "integration" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def subprocess_env() -> dict[str, str]:
+    """启动 app 子进程用的环境变量（导入 app 之前的快照，带项目根目录）"""
+    return dict(_SUBPROCESS_ENV)
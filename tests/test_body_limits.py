@@ -0,0 +1,69 @@
+"""
+请求体大小限制中间件
+"""
+
+from collections.abc import AsyncIterator
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+from app.core.middleware import BodySizeLimitMiddleware
+
+pytestmark = pytest.mark.asyncio
+
+_LIMIT = 1024
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/raw")
+    async def raw(request: Request) -> dict[str, int]:
+        return {"size": len(await request.body())}
+
+    @app.post("/json")
+    async def parsed(payload: dict[str, str]) -> dict[str, int]:
+        return {"size": len(payload)}
+
+    app.add_middleware(
+        BodySizeLimitMiddleware, limits={"/raw": _LIMIT, "/json": _LIMIT}
+    )
+    return app
+
+
+async def _chunked(body: bytes, size: int = 256) -> AsyncIterator[bytes]:
+    # 生成器请求体不带 Content-Length，按分块传输发送
+    for start in range(0, len(body), size):
+        yield body[start : start + size]
+
+
+async def _post(path: str, **kwargs: object) -> httpx.Response:
+    transport = httpx.ASGITransport(app=_app())
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.post(path, **kwargs)
+
+
+async def test_content_length_over_limit_is_rejected_before_reading() -> None:
+    response = await _post("/raw", content=b"x" * (_LIMIT + 1))
+    assert response.status_code == 413
+
+
+async def test_chunked_body_over_limit_returns_413() -> None:
+    response = await _post("/raw", content=_chunked(b"x" * (_LIMIT * 4)))
+    assert response.status_code == 413
+    assert response.json() == {"detail": "请求体过大"}
+
+
+async def test_chunked_body_parsed_by_fastapi_returns_413_not_400() -> None:
+    body = b'{"key": "' + b"x" * (_LIMIT * 4) + b'"}'
+    response = await _post(
+        "/json", content=_chunked(body), headers={"Content-Type": "application/json"}
+    )
+    assert response.status_code == 413
+
+
+async def test_chunked_body_within_limit_passes() -> None:
+    response = await _post("/raw", content=_chunked(b"x" * (_LIMIT // 2)))
+    assert response.status_code == 200
+    assert response.json() == {"size": _LIMIT // 2}
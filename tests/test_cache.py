@@ -0,0 +1,155 @@
+"""
+进程内缓存：TTLCache（过期、LRU、set_if_unchanged 防止旧数据覆盖失效）与热力图缓存
+"""
+
+import uuid
+from array import array
+
+import pytest
+
+from app.core.cache_bus import cache_bus
+from app.services.focus_stats_service import (
+    HEATMAP_DAYS,
+    HeatmapCache,
+    heatmap_cache,
+)
+from app.utils import cache
+from app.utils.cache import TTLCache
+
+
+class Clock:
+    """可手动拨动的 time.monotonic()"""
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def tick(self, seconds: float = 0.001) -> float:
+        self.now += seconds
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def _days(minutes: int) -> array:
+    return array("H", [minutes] * HEATMAP_DAYS)
+
+
+def test_get_returns_value_until_ttl(clock: Clock) -> None:
+    ttl_cache: TTLCache[str, int] = TTLCache(10, ttl=5)
+    ttl_cache.set("a", 1)
+    clock.tick(4.9)
+    assert ttl_cache.get("a") == 1
+    # 读取不延长过期时间
+    clock.tick(0.1)
+    assert ttl_cache.get("a") is None
+    assert len(ttl_cache) == 0
+
+
+def test_evicts_least_recently_used(clock: Clock) -> None:
+    ttl_cache: TTLCache[str, int] = TTLCache(2, ttl=60)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    ttl_cache.get("a")
+    ttl_cache.set("c", 3)
+    assert ttl_cache.get("a") == 1
+    assert ttl_cache.get("b") is None
+    assert ttl_cache.get("c") == 3
+
+
+def test_set_if_unchanged_rejects_read_raced_by_invalidation(clock: Clock) -> None:
+    ttl_cache: TTLCache[str, str] = TTLCache(10, ttl=60)
+    # 读者开始读库 -> 写入方提交并失效 -> 读者带着提交前的旧数据写回
+    since = clock.monotonic()
+    clock.tick()
+    ttl_cache.invalidate("k")
+    clock.tick()
+    assert not ttl_cache.set_if_unchanged("k", "stale", since)
+    assert ttl_cache.get("k") is None
+
+    # 失效之后开始的读取可以写回
+    since = clock.tick()
+    assert ttl_cache.set_if_unchanged("k", "fresh", since)
+    assert ttl_cache.get("k") == "fresh"
+
+
+def test_set_if_unchanged_rejects_invalidation_at_same_instant(clock: Clock) -> None:
+    ttl_cache: TTLCache[str, str] = TTLCache(10, ttl=60)
+    since = clock.monotonic()
+    ttl_cache.invalidate("k")
+    assert not ttl_cache.set_if_unchanged("k", "stale", since)
+
+
+def test_set_if_unchanged_ignores_other_keys(clock: Clock) -> None:
+    ttl_cache: TTLCache[str, str] = TTLCache(10, ttl=60)
+    since = clock.monotonic()
+    clock.tick()
+    ttl_cache.invalidate("other")
+    assert ttl_cache.set_if_unchanged("k", "value", since)
+
+
+def test_clear_rejects_reads_started_before(clock: Clock) -> None:
+    ttl_cache: TTLCache[str, str] = TTLCache(10, ttl=60)
+    ttl_cache.set("a", "cached")
+    since = clock.monotonic()
+    clock.tick()
+    ttl_cache.clear()
+    assert ttl_cache.get("a") is None
+    assert not ttl_cache.set_if_unchanged("b", "stale", since)
+    assert ttl_cache.set_if_unchanged("b", "fresh", clock.tick())
+
+
+def test_invalidation_records_are_bounded(clock: Clock) -> None:
+    ttl_cache: TTLCache[int, int] = TTLCache(3, ttl=60)
+    for key in range(10):
+        clock.tick()
+        ttl_cache.invalidate(key)
+    assert len(ttl_cache._invalidated) == 3
+    # 超过 ttl 的失效记录被丢弃（此前开始的读取早已超过缓存的陈旧上限）
+    clock.tick(61)
+    ttl_cache.invalidate("new")
+    assert list(ttl_cache._invalidated) == ["new"]
+
+
+def test_heatmap_cache_put_and_invalidate(clock: Clock) -> None:
+    heatmap = HeatmapCache(100, ttl=300)
+    user_id = uuid.uuid4()
+    heatmap.put(user_id, 2024, _days(25), clock.monotonic())
+    heatmap.put(user_id, 2025, _days(50), clock.monotonic())
+    clock.tick()
+
+    heatmap.invalidate(f"{user_id}:2024")
+    assert heatmap.get(user_id, 2024) is None
+    assert heatmap.get(user_id, 2025) == _days(50)
+
+
+def test_heatmap_cache_skips_stale_rebuild(clock: Clock) -> None:
+    heatmap = HeatmapCache(100, ttl=300)
+    user_id = uuid.uuid4()
+    # 重建读库期间新会话提交、整年失效：旧结果不写回
+    since = clock.monotonic()
+    clock.tick()
+    heatmap.invalidate(f"{user_id}:2024")
+    heatmap.put(user_id, 2024, _days(25), since)
+    assert heatmap.get(user_id, 2024) is None
+
+
+def test_heatmap_invalidated_by_cache_bus_notification(clock: Clock) -> None:
+    user_id = uuid.uuid4()
+    try:
+        heatmap_cache.put(user_id, 2024, _days(25), clock.monotonic())
+        clock.tick()
+        # 其他 worker 发出的通知：'来源:缓存名:键 键 ...'
+        cache_bus._on_notify(
+            None, 0, "cache_invalidation", f"other:heatmap:{user_id}:2024"
+        )
+        assert heatmap_cache.get(user_id, 2024) is None
+    finally:
+        heatmap_cache.clear()
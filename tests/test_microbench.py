@@ -0,0 +1,188 @@
+"""
+热点函数微基准与回归门禁（pytest-benchmark）
+
+默认只计时（pytest-benchmark 输出报告）。开启 MICROBENCH_COMPARE 后，每项的单次耗时中位数
+与 bench/microbench_baseline.json 比较，慢于基线超过容差即失败：
+
+    pytest tests/test_microbench.py                                  # 只计时
+    MICROBENCH_COMPARE=1 pytest tests/test_microbench.py             # 与基线比较（默认容差 20%）
+    MICROBENCH_COMPARE=1 MICROBENCH_TOLERANCE=0.3 pytest tests/test_microbench.py -k jwt
+    MICROBENCH_SAVE=1 pytest tests/test_microbench.py                # 在基准机器上生成 / 更新基线
+
+基线与机器相关：基线记录的机器信息与当前不一致时不比较；比较时基线中缺少的项视为失败。
+"""
+
+import json
+import os
+import platform
+import uuid
+from collections.abc import Callable
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from app.core.security import (
+    create_access_token,
+    create_refresh_token,
+    decode_access_token,
+    get_password_hash,
+    verify_password,
+)
+from app.models.orm import Todo
+from app.models.schemas import TodoCreate, TodoUpdate
+from app.services.pomodoro_service import _to_session_response
+from app.services.todo_service import to_todo_response
+
+# 与 timeit 一致关闭 GC；每轮至少 20ms、至少 30 轮，取中位数，压低调度与频率波动带来的噪声
+pytestmark = [
+    pytest.mark.slow,
+    pytest.mark.benchmark(min_time=0.02, max_time=2.0, min_rounds=30, disable_gc=True),
+]
+
+_BASELINE = (
+    Path(__file__).resolve().parent.parent / "bench" / "microbench_baseline.json"
+)
+_TOLERANCE = float(os.environ.get("MICROBENCH_TOLERANCE", "0.2"))
+_COMPARE = os.environ.get("MICROBENCH_COMPARE") == "1"
+_SAVE = os.environ.get("MICROBENCH_SAVE") == "1"
+
+_NOW = datetime(2025, 1, 6, 9, 0, tzinfo=UTC)
+
+
+def _todos(count: int) -> list[Todo]:
+    return [
+        Todo(
+            id=uuid.uuid4(),
+            user_id=uuid.UUID(int=1),
+            title=f"todo {i}",
+            description="benchmark todo description" if i % 3 else None,
+            is_completed=i % 2 == 0,
+            start_at=_NOW + timedelta(hours=i),
+            end_at=_NOW + timedelta(hours=i + 1),
+            all_day=False,
+            color="#ff8800",
+            focus_minutes=i % 120,
+            created_at=_NOW,
+            updated_at=_NOW,
+        )
+        for i in range(count)
+    ]
+
+
+def _session_rows(count: int) -> list[dict[str, Any]]:
+    return [
+        {
+            "id": uuid.uuid4(),
+            "user_id": uuid.UUID(int=1),
+            "title": f"session {i}",
+            "duration": 25,
+            "completed_at": _NOW + timedelta(minutes=30 * i),
+            "todo_id": uuid.UUID(int=2) if i % 2 else None,
+            "created_at": _NOW,
+            "updated_at": _NOW,
+        }
+        for i in range(count)
+    ]
+
+
+def _setup_jwt_decode() -> Callable[[], Any]:
+    token = create_access_token(uuid.UUID(int=1), "bench@example.com")
+    return lambda: decode_access_token(token)
+
+
+def _setup_bcrypt_verify() -> Callable[[], Any]:
+    hashed = get_password_hash("benchmark-password")
+    return lambda: verify_password("benchmark-password", hashed)
+
+
+def _setup_todo_responses(count: int) -> Callable[[], Any]:
+    todos = _todos(count)
+    return lambda: [to_todo_response(todo) for todo in todos]
+
+
+def _setup_session_responses(count: int) -> Callable[[], Any]:
+    rows = _session_rows(count)
+    return lambda: [_to_session_response(row) for row in rows]
+
+
+_TODO_CREATE = {
+    "title": "Write the quarterly report",
+    "description": "Include the pomodoro focus summary",
+    "start_at": "2025-01-06T09:00:00Z",
+    "end_at": "2025-01-06T10:00:00Z",
+    "all_day": False,
+    "color": "#ff8800",
+}
+_TODO_UPDATE = {"is_completed": True, "title": "Write the quarterly report (done)"}
+
+# 名称 -> 准备函数（返回被计时的无参调用）
+BENCHMARKS: dict[str, Callable[[], Callable[[], Any]]] = {
+    "jwt_create_access_token": lambda: (
+        lambda: create_access_token(uuid.UUID(int=1), "bench@example.com")
+    ),
+    "jwt_decode_access_token": _setup_jwt_decode,
+    "bcrypt_get_password_hash": lambda: lambda: get_password_hash("benchmark-password"),
+    "bcrypt_verify_password": _setup_bcrypt_verify,
+    "create_refresh_token": lambda: lambda: create_refresh_token(uuid.UUID(int=1)),
+    "todo_create_validate": lambda: lambda: TodoCreate.model_validate(_TODO_CREATE),
+    "todo_update_validate": lambda: lambda: TodoUpdate.model_validate(_TODO_UPDATE),
+    **{
+        f"todo_response_{count}": (lambda count=count: _setup_todo_responses(count))
+        for count in (100, 1_000, 10_000)
+    },
+    **{
+        f"session_response_{count}": (
+            lambda count=count: _setup_session_responses(count)
+        )
+        for count in (100, 1_000, 10_000)
+    },
+}
+
+
+def _machine() -> dict[str, str]:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "system": platform.system(),
+    }
+
+
+def _load_baseline() -> dict[str, Any]:
+    return json.loads(_BASELINE.read_text()) if _BASELINE.exists() else {}
+
+
+def _save_result(name: str, seconds: float) -> None:
+    saved = _load_baseline()
+    saved["machine"] = _machine()
+    saved["results"] = {**saved.get("results", {}), name: seconds}
+    _BASELINE.parent.mkdir(parents=True, exist_ok=True)
+    _BASELINE.write_text(json.dumps(saved, indent=2, sort_keys=True) + "\n")
+
+
+@pytest.mark.parametrize("name", list(BENCHMARKS))
+def test_microbench(benchmark: Any, name: str) -> None:
+    benchmark(BENCHMARKS[name]())
+    if benchmark.stats is None:
+        pytest.skip("计时已关闭（--benchmark-disable）")
+    seconds = benchmark.stats.stats.median
+
+    if _SAVE:
+        _save_result(name, seconds)
+        return
+    if not _COMPARE:
+        return
+
+    baseline = _load_baseline()
+    if baseline.get("machine") != _machine():
+        pytest.skip("基线来自不同的机器或 Python 版本，只计时不比较")
+    base = baseline.get("results", {}).get(name)
+    assert base is not None, f"基线中没有 {name}，先用 MICROBENCH_SAVE=1 生成"
+    change = seconds / base - 1
+    assert change <= _TOLERANCE, (
+        f"{name} 耗时中位数 {seconds * 1e6:.2f} us，基线 {base * 1e6:.2f} us，"
+        f"变慢 {change:+.1%} 超出容差 {_TOLERANCE:.0%}"
+    )
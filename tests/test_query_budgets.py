@@ -0,0 +1,107 @@
+"""
+每请求 SQL 语句预算
+
+经 ASGI 驱动整个应用（含 MetricsMiddleware），依次请求声明了 query_budget 的路由，
+用 capture_request_stats() 收集统计，再用 assert_query_budgets() 断言未超预算、无 N+1 重复语句。
+"""
+
+import uuid
+from collections.abc import AsyncIterator
+
+import httpx
+import pytest
+import pytest_asyncio
+
+from app.core.query_budget import assert_query_budgets, capture_request_stats
+from app.main import app
+from app.models.database import close_db, init_db
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.integration]
+
+_PASSWORD = "budget-test-password"
+
+
+@pytest_asyncio.fixture
+async def client() -> AsyncIterator[httpx.AsyncClient]:
+    # 引擎连接绑定在事件循环上（pytest-asyncio 每个测试一个循环）：用完即释放
+    await init_db()
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            email = f"budget-{uuid.uuid4().hex[:12]}@example.com"
+            response = await client.post(
+                "/register", json={"email": email, "password": _PASSWORD}
+            )
+            assert response.status_code == 200, response.text
+            response = await client.post(
+                "/token", json={"email": email, "password": _PASSWORD}
+            )
+            assert response.status_code == 200, response.text
+            client.headers["Authorization"] = (
+                f"Bearer {response.json()['access_token']}"
+            )
+            yield client
+    finally:
+        await close_db()
+
+
+def _ok(response: httpx.Response) -> httpx.Response:
+    request = response.request
+    assert response.is_success, f"{request.method} {request.url}: {response.text}"
+    return response
+
+
+async def test_write_routes_within_budget(client: httpx.AsyncClient) -> None:
+    with capture_request_stats() as records:
+        todo = _ok(await client.post("/todos", json={"title": "预算"})).json()
+        _ok(await client.put(f"/todos/{todo['id']}", json={"is_completed": True}))
+        _ok(
+            await client.post(
+                "/pomodoro/sessions",
+                json={
+                    "title": "预算",
+                    "duration": 25,
+                    "completedAt": "2024-03-01T08:00:00Z",
+                    "clientId": uuid.uuid4().hex,
+                    "todoId": todo["id"],
+                },
+            )
+        )
+        _ok(
+            await client.put(
+                "/pomodoro/settings",
+                json={
+                    "workTime": 50,
+                    "shortBreakTime": 10,
+                    "longBreakTime": 20,
+                    "sessionsUntilLongBreak": 3,
+                },
+            )
+        )
+        _ok(await client.put("/profile", json={"name": "预算", "school": "测试"}))
+        _ok(await client.delete(f"/todos/{todo['id']}"))
+
+    assert len(records) == 6
+    assert_query_budgets(records)
+
+
+async def test_read_routes_within_budget(client: httpx.AsyncClient) -> None:
+    for i in range(3):
+        _ok(await client.post("/todos", json={"title": f"预算 {i}"}))
+
+    with capture_request_stats() as records:
+        for path in (
+            "/todos",
+            "/pomodoro/sessions",
+            "/pomodoro/heatmap?year=2024",
+            "/pomodoro/leaderboard",
+            "/pomodoro/settings",
+            "/profile",
+            "/me/bootstrap",
+        ):
+            _ok(await client.get(path))
+
+    assert len(records) == 7
+    assert_query_budgets(records)
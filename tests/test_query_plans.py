@@ -0,0 +1,511 @@
+"""
+查询计划回归检查
+
+在一个最终回滚的事务里（整个模块共用）：
+    0. 在临时 schema 中执行 init-db/01-init.sql（docker compose 建库所用的脚本）
+    1. 对照 ORM 检查建出的表：列名与列类型须一致；ORM 声明的主键 / 唯一约束 / 索引须存在
+       （缺失即失败，多出的索引只告警）
+    2. 用合成数据生成器写入 QUERY_PLAN_USERS 个用户的数据并 ANALYZE
+    3. 以数据量最大的用户调用各服务方法（TodoService、PomodoroService、ProfileService、
+       AuthService 与 get_current_user 的用户查询），截获实际发出的每条 SQL 并 EXPLAIN，
+       大表上出现顺序扫描、需要额外排序或总成本超过上限即失败
+
+事务回滚后数据库保持原样；TEST_DATABASE_URL 须指向未分片的测试库：
+
+    pytest tests/test_query_plans.py
+    QUERY_PLAN_USERS=200000 QUERY_PLAN_COST_FACTOR=4 QUERY_PLAN_ANALYZE=1 pytest tests/test_query_plans.py
+"""
+
+import argparse
+import json
+import os
+import uuid
+import warnings
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
+from typing import Any
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from sqlalchemy import UniqueConstraint, event, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from app.core.security import TokenData, _load_user, get_password_hash
+from app.models.database import Base, close_db, shard_router
+from app.models.schemas import (
+    PasswordResetConfirm,
+    PomodoroSessionCreate,
+    PomodoroSettings,
+    ProfileUpdate,
+    RefreshTokenRequest,
+    TodoCreate,
+    TodoUpdate,
+    UserLogin,
+)
+from app.services.auth_service import AuthService
+from app.services.pomodoro_service import PomodoroService
+from app.services.profile_service import ProfileService
+from app.services.todo_service import TodoService
+from scripts.generate_dataset import TABLES, generate_user, parse_distribution
+
+# 同一模块的测试共用一个事件循环：连接与事务跨测试保持
+pytestmark = [
+    pytest.mark.asyncio(loop_scope="module"),
+    pytest.mark.integration,
+    pytest.mark.slow,
+]
+
+_USERS = int(os.environ.get("QUERY_PLAN_USERS", "20000"))
+_SEED = int(os.environ.get("QUERY_PLAN_SEED", "20050"))
+# EXPLAIN ANALYZE（实际执行，事务内回滚）
+_ANALYZE = os.environ.get("QUERY_PLAN_ANALYZE") == "1"
+# 成本上限的放大系数（数据量远大于默认时使用）
+_COST_FACTOR = float(os.environ.get("QUERY_PLAN_COST_FACTOR", "1.0"))
+
+_PASSWORD = "plan-check-password"
+
+INIT_SQL = Path(__file__).resolve().parent.parent / "init-db" / "01-init.sql"
+# 建表所用的临时 schema（随事务回滚）
+_SCHEMA = "plan_check"
+
+# 数据量随用户数增长、不允许顺序扫描的表
+LARGE_TABLES = frozenset(
+    {
+        "users",
+        "profiles",
+        "todos",
+        "pomodoro_sessions",
+        "pomodoro_settings",
+        "pomodoro_daily_stats",
+        "pomodoro_weekly_totals",
+        "refresh_tokens",
+        "password_reset_tokens",
+    }
+)
+
+_EXPLAINABLE = frozenset({"SELECT", "WITH", "INSERT", "UPDATE", "DELETE"})
+
+_INDEX_SQL = text("""
+    SELECT t.relname, i.relname, x.indisunique,
+           array_agg(a.attname::text ORDER BY k.ord) AS columns
+    FROM pg_index x
+    JOIN pg_class i ON i.oid = x.indexrelid
+    JOIN pg_class t ON t.oid = x.indrelid
+    JOIN pg_namespace n ON n.oid = t.relnamespace AND n.nspname = current_schema()
+    JOIN LATERAL unnest(x.indkey) WITH ORDINALITY AS k(attnum, ord) ON true
+    JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = k.attnum
+    WHERE t.relname = ANY(:tables)
+    GROUP BY t.relname, i.relname, x.indisunique
+""")
+
+
+_COLUMN_SQL = text("""
+    SELECT t.relname, a.attname, format_type(a.atttypid, a.atttypmod)
+    FROM pg_attribute a
+    JOIN pg_class t ON t.oid = a.attrelid
+    JOIN pg_namespace n ON n.oid = t.relnamespace AND n.nspname = current_schema()
+    WHERE t.relname = ANY(:tables) AND t.relkind = 'r' AND a.attnum > 0 AND NOT a.attisdropped
+""")
+
+
+@dataclass
+class Probe:
+    """被检查的数据：数据量最大的用户及其一条待办"""
+
+    user_id: uuid.UUID
+    email: str
+    todo_id: str
+
+
+@dataclass
+class Check:
+    """一个服务调用及其计划要求"""
+
+    name: str
+    call: Callable[[AsyncSession, Probe], Awaitable[Any]]
+    max_cost: float = 1_000.0
+    # 按用户取有序列表：计划中不允许出现排序节点（应由复合索引直接给出顺序）
+    ordered: bool = False
+    # 调用预期以该错误结束（如伪造的令牌），发出的语句照常检查
+    expected_error: type[Exception] | None = None
+
+
+CHECKS: list[Check] = [
+    Check(
+        "get_current_user",
+        lambda db, p: _load_user(
+            db, TokenData(user_id=str(p.user_id), email=p.email, exp=datetime.now(UTC))
+        ),
+    ),
+    Check(
+        "AuthService.login",
+        lambda db, p: AuthService(db).login(
+            UserLogin(email=p.email, password=_PASSWORD)
+        ),
+    ),
+    Check("AuthService.logout", lambda db, p: AuthService(db).logout(p.user_id)),
+    Check(
+        "AuthService.logout_token",
+        lambda db, p: AuthService(db).logout(p.user_id, "x" * 43),
+    ),
+    Check(
+        "AuthService.refresh",
+        lambda db, p: AuthService(db).refresh(
+            RefreshTokenRequest(refresh_token="x" * 43)
+        ),
+        expected_error=HTTPException,
+    ),
+    Check(
+        "AuthService.reset_password",
+        lambda db, p: AuthService(db).reset_password(
+            PasswordResetConfirm(token="x" * 43, new_password="new-password")
+        ),
+        expected_error=HTTPException,
+    ),
+    Check(
+        "TodoService.get_todos",
+        lambda db, p: TodoService(db).get_todos(p.user_id),
+        max_cost=5_000.0,
+        ordered=True,
+    ),
+    Check(
+        "TodoService.create_todo",
+        lambda db, p: TodoService(db).create_todo(
+            TodoCreate(title="plan check"), p.user_id
+        ),
+    ),
+    Check(
+        "TodoService.update_todo",
+        lambda db, p: TodoService(db).update_todo(
+            p.todo_id, TodoUpdate(is_completed=True), p.user_id
+        ),
+    ),
+    Check(
+        "TodoService.delete_todo",
+        lambda db, p: TodoService(db).delete_todo(p.todo_id, p.user_id),
+    ),
+    Check(
+        "TodoService.get_focus_report",
+        lambda db, p: TodoService(db).get_focus_report(
+            p.user_id, datetime.now(UTC) - timedelta(days=7), datetime.now(UTC)
+        ),
+    ),
+    Check(
+        "PomodoroService.create_session",
+        lambda db, p: PomodoroService(db).create_session(
+            PomodoroSessionCreate(
+                title="plan check",
+                duration=25,
+                completedAt=datetime.now(UTC).isoformat(),
+                clientId=uuid.uuid4().hex,
+                todoId=uuid.UUID(p.todo_id),
+            ),
+            p.user_id,
+        ),
+    ),
+    Check(
+        "PomodoroService.get_sessions",
+        lambda db, p: PomodoroService(db).get_sessions(p.user_id),
+        ordered=True,
+    ),
+    Check(
+        "PomodoroService.get_settings",
+        lambda db, p: PomodoroService(db).get_settings(p.user_id),
+    ),
+    Check(
+        "PomodoroService.update_settings",
+        lambda db, p: PomodoroService(db).update_settings(
+            PomodoroSettings(
+                workTime=30,
+                shortBreakTime=5,
+                longBreakTime=15,
+                sessionsUntilLongBreak=4,
+            ),
+            p.user_id,
+        ),
+    ),
+    Check(
+        "ProfileService.get_profile",
+        lambda db, p: ProfileService(db).get_profile(p.user_id),
+    ),
+    Check(
+        "ProfileService.update_profile",
+        lambda db, p: ProfileService(db).update_profile(
+            ProfileUpdate(name="Plan Check"), p.user_id
+        ),
+    ),
+]
+
+
+def expected_indexes() -> dict[str, list[tuple[tuple[str, ...], bool]]]:
+    """ORM 声明的索引：表名 -> [(列, 是否唯一)]"""
+    expected: dict[str, list[tuple[tuple[str, ...], bool]]] = {}
+    for table in Base.metadata.sorted_tables:
+        entries = [(tuple(column.name for column in table.primary_key.columns), True)]
+        entries += [
+            (tuple(column.name for column in constraint.columns), True)
+            for constraint in table.constraints
+            if isinstance(constraint, UniqueConstraint)
+        ]
+        entries += [
+            (tuple(column.name for column in index.columns), bool(index.unique))
+            for index in table.indexes
+        ]
+        expected[table.name] = entries
+    return expected
+
+
+def expected_columns() -> dict[str, dict[str, str]]:
+    """ORM 声明的列：表名 -> {列名: PostgreSQL 类型（format_type 的写法）}"""
+    dialect = postgresql.dialect()
+    return {
+        table.name: {
+            column.name: column.type.compile(dialect=dialect)
+            .lower()
+            .replace("varchar", "character varying")
+            for column in table.columns
+        }
+        for table in Base.metadata.sorted_tables
+    }
+
+
+async def check_columns(conn: AsyncConnection) -> list[str]:
+    """返回与 ORM 不一致之处（缺表、缺列、多列、类型不同）"""
+    expected = expected_columns()
+    result = await conn.execute(_COLUMN_SQL, {"tables": list(expected)})
+    actual: dict[str, dict[str, str]] = {}
+    for table, column, column_type in result.all():
+        actual.setdefault(table, {})[column] = column_type
+
+    problems = []
+    for table, columns in expected.items():
+        if table not in actual:
+            problems.append(f"缺少表 {table}")
+            continue
+        present = actual[table]
+        for column, column_type in columns.items():
+            if column not in present:
+                problems.append(f"{table} 缺少列 {column} {column_type}")
+            elif present[column] != column_type:
+                problems.append(
+                    f"{table}.{column} 类型为 {present[column]}，ORM 为 {column_type}"
+                )
+        problems += [
+            f"{table} 多出 ORM 未声明的列 {column}"
+            for column in present.keys() - columns.keys()
+        ]
+    return problems
+
+
+async def check_indexes(conn: AsyncConnection) -> tuple[list[str], list[str]]:
+    """返回 (缺失的索引, 未在 ORM 中声明的索引)"""
+    expected = expected_indexes()
+    result = await conn.execute(_INDEX_SQL, {"tables": list(expected)})
+    actual: dict[str, list[tuple[str, tuple[str, ...], bool]]] = {}
+    for table, name, unique, columns in result.all():
+        actual.setdefault(table, []).append((name, tuple(columns), unique))
+
+    missing = []
+    for table, entries in expected.items():
+        present = actual.get(table, [])
+        for columns, unique in entries:
+            # 唯一约束须完全一致；普通索引允许由以其为前缀的复合索引覆盖
+            covered = any(
+                cols == columns if unique else cols[: len(columns)] == columns
+                for _, cols, is_unique in present
+                if is_unique or not unique
+            )
+            if not covered:
+                kind = "唯一索引" if unique else "索引"
+                missing.append(f"{table}({', '.join(columns)}) 缺少{kind}")
+
+    declared = {
+        (table, columns)
+        for table, entries in expected.items()
+        for columns, _ in entries
+    }
+    extra = [
+        f"{table}.{name}({', '.join(cols)})"
+        for table, indexes in actual.items()
+        for name, cols, _ in indexes
+        if (table, cols) not in declared
+    ]
+    return missing, extra
+
+
+async def seed(conn: AsyncConnection, users: int, seed_value: int) -> Probe:
+    """在当前事务中写入合成数据并 ANALYZE，返回数据量最大的用户"""
+    args = argparse.Namespace(
+        seed=seed_value,
+        days=365,
+        todos_dist=parse_distribution("lognormal:2.3,1.1"),
+        sessions_dist=parse_distribution("pareto:1.3,40"),
+        tokens_dist=parse_distribution("uniform:0,3"),
+        max_per_user=20_000,
+    )
+    until = datetime.now(UTC).replace(hour=0, minute=0, second=0, microsecond=0)
+    password_hash = get_password_hash(_PASSWORD)
+    raw = await conn.get_raw_connection()
+    driver = raw.driver_connection
+
+    probe: Probe | None = None
+    most_todos = -1
+    for first in range(0, users, 5_000):
+        tables: dict[str, list[tuple[Any, ...]]] = {table: [] for table, _ in TABLES}
+        for index in range(first, min(first + 5_000, users)):
+            user_rows = generate_user(index, args, password_hash, until)
+            for table, rows in user_rows.items():
+                tables[table].extend(rows)
+            if len(user_rows["todos"]) > most_todos:
+                most_todos = len(user_rows["todos"])
+                user = user_rows["users"][0]
+                probe = Probe(
+                    user_id=user[0],
+                    email=user[1],
+                    todo_id=str(user_rows["todos"][0][0]),
+                )
+        for table, columns in TABLES:
+            if tables[table]:
+                await driver.copy_records_to_table(
+                    table, records=tables[table], columns=list(columns)
+                )
+    await conn.execute(text("ANALYZE " + ", ".join(sorted(LARGE_TABLES))))
+    assert probe is not None
+    return probe
+
+
+def _walk(node: dict[str, Any], found: list[dict[str, Any]]) -> None:
+    found.append(node)
+    for child in node.get("Plans", ()):
+        _walk(child, found)
+
+
+def plan_problems(plan: dict[str, Any], check: Check, cost_factor: float) -> list[str]:
+    """顺序扫描大表、有序列表上的排序、总成本超限"""
+    nodes: list[dict[str, Any]] = []
+    _walk(plan["Plan"], nodes)
+    problems = []
+    for node in nodes:
+        relation = node.get("Relation Name")
+        if node["Node Type"] == "Seq Scan" and relation in LARGE_TABLES:
+            problems.append(f"顺序扫描 {relation}")
+        if check.ordered and node["Node Type"] in ("Sort", "Incremental Sort"):
+            problems.append(f"额外排序（{', '.join(node.get('Sort Key', []))}）")
+    cost = plan["Plan"]["Total Cost"]
+    max_cost = check.max_cost * cost_factor
+    if cost > max_cost:
+        problems.append(f"总成本 {cost:.0f} 超过上限 {max_cost:.0f}")
+    return problems
+
+
+async def run_check(
+    conn: AsyncConnection, check: Check, probe: Probe, analyze: bool, cost_factor: float
+) -> list[tuple[str, list[str]]]:
+    """调用服务方法并 EXPLAIN 期间发出的每条语句，返回 (SQL, 问题) 列表"""
+    captured: list[tuple[str, Any]] = []
+
+    def capture(
+        conn: Any,
+        cursor: Any,
+        statement: str,
+        parameters: Any,
+        context: Any,
+        executemany: bool,
+    ) -> None:
+        # 跳过 SAVEPOINT 等事务语句；executemany 只取第一组参数
+        if statement.lstrip().split(None, 1)[0].upper() not in _EXPLAINABLE:
+            return
+        captured.append((statement, parameters[0] if executemany else parameters))
+
+    sync_conn = conn.sync_connection
+    event.listen(sync_conn, "before_cursor_execute", capture)
+    savepoint = await conn.begin_nested()
+    try:
+        async with AsyncSession(
+            bind=conn, join_transaction_mode="create_savepoint"
+        ) as db:
+            try:
+                await check.call(db, probe)
+            except Exception as exc:
+                if check.expected_error is None or not isinstance(
+                    exc, check.expected_error
+                ):
+                    raise
+    finally:
+        event.remove(sync_conn, "before_cursor_execute", capture)
+        await savepoint.rollback()
+
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    results = []
+    for statement, parameters in captured:
+        savepoint = await conn.begin_nested()
+        try:
+            result = await conn.exec_driver_sql(
+                f"EXPLAIN ({options}) {statement}", parameters
+            )
+            plan = result.scalar_one()
+        finally:
+            await savepoint.rollback()
+        plan = json.loads(plan) if isinstance(plan, str) else plan
+        results.append((statement, plan_problems(plan[0], check, cost_factor)))
+    return results
+
+
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def plan_conn() -> AsyncIterator[AsyncConnection]:
+    """
+    模块共用的连接：所有写入都在一个最终回滚的事务里。
+    init-db 脚本在临时 schema 中执行，测试库里已有的表不影响检查
+    """
+    if shard_router.enabled:
+        pytest.skip("请连接未分片的测试库（DATABASE_SHARD_URLS 为空）")
+    try:
+        async with shard_router.engines[0].connect() as conn:
+            transaction = await conn.begin()
+            try:
+                await conn.execute(text(f"CREATE SCHEMA {_SCHEMA}"))
+                await conn.execute(text(f"SET LOCAL search_path TO {_SCHEMA}, public"))
+                # 多语句脚本（含函数体）走简单查询协议
+                raw = await conn.get_raw_connection()
+                await raw.driver_connection.execute(
+                    INIT_SQL.read_text(encoding="utf-8")
+                )
+                yield conn
+            finally:
+                await transaction.rollback()
+    finally:
+        await close_db()
+
+
+@pytest_asyncio.fixture(scope="module", loop_scope="module")
+async def probe(plan_conn: AsyncConnection) -> Probe:
+    return await seed(plan_conn, _USERS, _SEED)
+
+
+async def test_init_sql_columns_match_orm(plan_conn: AsyncConnection) -> None:
+    problems = await check_columns(plan_conn)
+    assert not problems, "\n".join(problems)
+
+
+async def test_orm_indexes_exist(plan_conn: AsyncConnection) -> None:
+    missing, extra = await check_indexes(plan_conn)
+    for index in extra:
+        warnings.warn(f"ORM 未声明的索引: {index}", stacklevel=1)
+    assert not missing, "\n".join(missing)
+
+
+@pytest.mark.parametrize("check", CHECKS, ids=lambda check: check.name)
+async def test_query_plan(
+    plan_conn: AsyncConnection, probe: Probe, check: Check
+) -> None:
+    results = await run_check(plan_conn, check, probe, _ANALYZE, _COST_FACTOR)
+    failures = [
+        f"{' '.join(statement.split())[:160]}\n    {'; '.join(problems)}"
+        for statement, problems in results
+        if problems
+    ]
+    assert not failures, "\n".join(failures)
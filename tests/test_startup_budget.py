@@ -0,0 +1,69 @@
+"""
+启动耗时预算
+
+在全新的子进程中计时 `import app.main`（导入耗时）与应用生命周期的启动阶段（预热，需要数据库），
+取多次运行的最小值以减少抖动。预算可用环境变量 STARTUP_IMPORT_BUDGET / STARTUP_LIFESPAN_BUDGET
+（秒）覆盖。
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.slow
+
+_IMPORT_BUDGET = float(os.environ.get("STARTUP_IMPORT_BUDGET", "2.0"))
+_LIFESPAN_BUDGET = float(os.environ.get("STARTUP_LIFESPAN_BUDGET", "5.0"))
+_RUNS = 3
+
+# 在子进程中执行，避免本进程已导入的模块影响计时
+_PROBE = """
+import asyncio, json, sys, time
+
+start = time.perf_counter()
+import app.main
+result = {"import": time.perf_counter() - start}
+
+if sys.argv[1] == "1":
+    async def startup():
+        async with app.main.app.router.lifespan_context(app.main.app):
+            result["startup"] = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    asyncio.run(startup())
+
+print(json.dumps(result))
+"""
+
+
+def _best(phase: str, with_lifespan: bool, env: dict[str, str]) -> float:
+    timings = []
+    for _ in range(_RUNS):
+        completed = subprocess.run(
+            [sys.executable, "-c", _PROBE, "1" if with_lifespan else "0"],
+            capture_output=True,
+            text=True,
+            env=env,
+            check=False,
+        )
+        assert completed.returncode == 0, completed.stderr
+        timings.append(json.loads(completed.stdout.strip().splitlines()[-1])[phase])
+    return min(timings)
+
+
+def test_import_time_within_budget(subprocess_env: dict[str, str]) -> None:
+    best = _best("import", with_lifespan=False, env=subprocess_env)
+    assert best <= _IMPORT_BUDGET, (
+        f"导入耗时 {best:.3f}s 超出预算 {_IMPORT_BUDGET:.3f}s"
+    )
+
+
+@pytest.mark.integration
+def test_lifespan_startup_within_budget(subprocess_env: dict[str, str]) -> None:
+    best = _best("startup", with_lifespan=True, env=subprocess_env)
+    assert best <= _LIFESPAN_BUDGET, (
+        f"启动预热耗时 {best:.3f}s 超出预算 {_LIFESPAN_BUDGET:.3f}s"
+    )
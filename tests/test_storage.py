@@ -0,0 +1,255 @@
+"""
+本地存储：预签名直传 URL 的签名校验、路径穿越防护、上传大小限制，
+以及 申请直传 URL -> PUT -> 确认上传 的完整流程（记录语句的会话代替数据库）
+"""
+
+import hashlib
+import time
+import uuid
+from collections.abc import AsyncIterator, Iterator
+from io import BytesIO
+from pathlib import Path
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI, HTTPException
+from PIL import Image
+
+from app.api.v1.endpoints import storage as storage_endpoint
+from app.core.config import settings
+from app.core.storage import LocalStorage
+from app.models.schemas import AvatarUploadUrlRequest
+from app.services import profile_service
+from app.services.profile_service import ProfileService
+from app.utils.images import shutdown_image_pool
+
+_MAX_UPLOAD_BYTES = settings.avatar_max_bytes + 64 * 1024
+
+
+class RecordingSession:
+    """只记录执行的语句的会话（确认上传只写一条资料 UPSERT）"""
+
+    def __init__(self) -> None:
+        self.statements: list[Any] = []
+
+    async def execute(self, statement: Any) -> None:
+        self.statements.append(statement)
+
+
+@pytest.fixture
+def storage(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> LocalStorage:
+    local = LocalStorage(str(tmp_path / "objects"), "http://test")
+    monkeypatch.setattr(storage_endpoint, "get_storage", lambda: local)
+    monkeypatch.setattr(profile_service, "get_storage", lambda: local)
+    return local
+
+
+@pytest_asyncio.fixture
+async def client(storage: LocalStorage) -> AsyncIterator[httpx.AsyncClient]:
+    app = FastAPI()
+    app.include_router(storage_endpoint.router)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+
+@pytest.fixture
+def image_pool() -> Iterator[None]:
+    yield
+    shutdown_image_pool()
+
+
+def _signed(url: str) -> tuple[str, dict[str, str]]:
+    """预签名 URL 拆成 (路径, 查询参数)"""
+    parts = urlsplit(url)
+    return parts.path, {
+        name: values[0] for name, values in parse_qs(parts.query).items()
+    }
+
+
+def _png(size: int = 300) -> bytes:
+    buffer = BytesIO()
+    Image.new("RGB", (size, size), (200, 80, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_verify_accepts_fresh_signature(storage: LocalStorage) -> None:
+    expires_at = int(time.time()) + 60
+    signature = storage.sign("uploads/a.png", "image/png", expires_at)
+    assert storage.verify("uploads/a.png", "image/png", expires_at, signature)
+
+
+def test_verify_rejects_expired_signature(storage: LocalStorage) -> None:
+    expires_at = int(time.time()) - 1
+    signature = storage.sign("uploads/a.png", "image/png", expires_at)
+    assert not storage.verify("uploads/a.png", "image/png", expires_at, signature)
+
+
+def test_verify_rejects_tampered_signature(storage: LocalStorage) -> None:
+    expires_at = int(time.time()) + 60
+    signature = storage.sign("uploads/a.png", "image/png", expires_at)
+    tampered = signature[:-1] + ("0" if signature[-1] != "0" else "1")
+    assert not storage.verify("uploads/a.png", "image/png", expires_at, tampered)
+    # 签名绑定对象键、内容类型与过期时间
+    assert not storage.verify("uploads/b.png", "image/png", expires_at, signature)
+    assert not storage.verify("uploads/a.png", "image/jpeg", expires_at, signature)
+    assert not storage.verify("uploads/a.png", "image/png", expires_at + 60, signature)
+
+
+@pytest.mark.parametrize(
+    "key", ["../outside.png", "a/../../outside.png", "/etc/passwd", ".", ""]
+)
+def test_path_for_rejects_traversal(storage: LocalStorage, key: str) -> None:
+    with pytest.raises(ValueError):
+        storage.path_for(key)
+
+
+def test_path_for_stays_under_root(storage: LocalStorage) -> None:
+    path = storage.path_for("uploads/avatars/u/a.png")
+    assert path == str(Path(storage.root) / "uploads" / "avatars" / "u" / "a.png")
+
+
+@pytest.mark.asyncio
+async def test_put_with_valid_signature(
+    client: httpx.AsyncClient, storage: LocalStorage
+) -> None:
+    path, params = _signed(storage.presign_put("uploads/a.png", "image/png", 60))
+    response = await client.put(
+        path, params=params, content=b"data", headers={"Content-Type": "image/png"}
+    )
+    assert response.status_code == 200, response.text
+    assert Path(storage.path_for("uploads/a.png")).read_bytes() == b"data"
+
+
+@pytest.mark.asyncio
+async def test_put_rejects_expired_url(
+    client: httpx.AsyncClient, storage: LocalStorage
+) -> None:
+    path, params = _signed(storage.presign_put("uploads/a.png", "image/png", -1))
+    response = await client.put(
+        path, params=params, content=b"data", headers={"Content-Type": "image/png"}
+    )
+    assert response.status_code == 403
+    assert not await storage.exists("uploads/a.png")
+
+
+@pytest.mark.asyncio
+async def test_put_rejects_tampered_signature(
+    client: httpx.AsyncClient, storage: LocalStorage
+) -> None:
+    path, params = _signed(storage.presign_put("uploads/a.png", "image/png", 60))
+    params["signature"] = "0" * len(params["signature"])
+    response = await client.put(
+        path, params=params, content=b"data", headers={"Content-Type": "image/png"}
+    )
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_put_rejects_other_key(
+    client: httpx.AsyncClient, storage: LocalStorage
+) -> None:
+    path, params = _signed(storage.presign_put("uploads/a.png", "image/png", 60))
+    response = await client.put(
+        path.replace("a.png", "b.png"),
+        params=params,
+        content=b"data",
+        headers={"Content-Type": "image/png"},
+    )
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_put_rejects_content_type_mismatch(
+    client: httpx.AsyncClient, storage: LocalStorage
+) -> None:
+    path, params = _signed(storage.presign_put("uploads/a.png", "image/png", 60))
+    response = await client.put(
+        path, params=params, content=b"data", headers={"Content-Type": "image/jpeg"}
+    )
+    assert response.status_code == 403
+
+
+@pytest.mark.asyncio
+async def test_put_rejects_oversized_body(
+    client: httpx.AsyncClient, storage: LocalStorage
+) -> None:
+    path, params = _signed(storage.presign_put("uploads/a.png", "image/png", 60))
+    response = await client.put(
+        path,
+        params=params,
+        content=b"x" * (_MAX_UPLOAD_BYTES + 1),
+        headers={"Content-Type": "image/png"},
+    )
+    assert response.status_code == 413
+    assert not await storage.exists("uploads/a.png")
+
+
+@pytest.mark.asyncio
+async def test_put_rejects_oversized_chunked_body(
+    client: httpx.AsyncClient, storage: LocalStorage
+) -> None:
+    # 不带 Content-Length：边收边计数，超限中止且不落盘
+    async def body() -> AsyncIterator[bytes]:
+        for _ in range(_MAX_UPLOAD_BYTES // (64 * 1024) + 2):
+            yield b"x" * (64 * 1024)
+
+    path, params = _signed(storage.presign_put("uploads/a.png", "image/png", 60))
+    response = await client.put(
+        path, params=params, content=body(), headers={"Content-Type": "image/png"}
+    )
+    assert response.status_code == 413
+    assert not await storage.exists("uploads/a.png")
+
+
+@pytest.mark.asyncio
+async def test_presign_put_confirm_flow(
+    client: httpx.AsyncClient, storage: LocalStorage, image_pool: None
+) -> None:
+    user_id = uuid.uuid4()
+    data = _png()
+    db = RecordingSession()
+    service = ProfileService(db)  # type: ignore[arg-type]
+
+    upload = await service.create_avatar_upload_url(
+        AvatarUploadUrlRequest(content_type="image/png", size=len(data)), user_id
+    )
+    path, params = _signed(upload.upload_url)
+    response = await client.put(
+        path, params=params, content=data, headers=upload.headers
+    )
+    assert response.status_code == 200, response.text
+    assert await storage.exists(upload.key)
+
+    # 其他用户不能确认这个对象
+    with pytest.raises(HTTPException) as denied:
+        await service.confirm_avatar_upload(upload.key, uuid.uuid4())
+    assert denied.value.status_code == 403
+
+    result = await service.confirm_avatar_upload(upload.key, user_id)
+
+    digest = hashlib.sha256(data).hexdigest()
+    largest = max(settings.avatar_sizes)
+    assert result.url == storage.public_url(f"avatars/{digest}/{largest}.webp")
+    assert set(result.variants) == {str(size) for size in settings.avatar_sizes}
+    for size in settings.avatar_sizes:
+        with Image.open(storage.path_for(f"avatars/{digest}/{size}.webp")) as image:
+            assert image.format == "WEBP"
+            assert image.size == (size, size)
+    # 原始上传已删除，资料只写一条 UPSERT
+    assert not await storage.exists(upload.key)
+    assert len(db.statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_confirm_missing_upload(storage: LocalStorage) -> None:
+    user_id = uuid.uuid4()
+    service = ProfileService(RecordingSession())  # type: ignore[arg-type]
+    with pytest.raises(HTTPException) as missing:
+        await service.confirm_avatar_upload(
+            f"uploads/avatars/{user_id}/missing.png", user_id
+        )
+    assert missing.value.status_code == 404
@@ -0,0 +1,189 @@
+"""
+写缓冲：攒批、定时落库、背压、永久错误二分拆批与死信（注入 flush，不连接数据库）
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from pathlib import Path
+
+import pytest
+
+from app.core.config import settings
+from app.services.pomodoro_service import _dead_letter_sessions
+from app.utils.write_buffer import WriteBuffer
+
+pytestmark = pytest.mark.asyncio
+
+
+class Recorder:
+    """记录 flush 与死信；flush 遇到 bad 中的行时抛出 error"""
+
+    def __init__(
+        self, bad: frozenset[object] = frozenset(), error: type[Exception] = ValueError
+    ):
+        self.bad = bad
+        self.error = error
+        self.batches: list[list[object]] = []
+        self.dead: list[tuple[list[object], Exception]] = []
+
+    async def flush(self, rows: list[object]) -> None:
+        if self.bad.intersection(rows):
+            raise self.error("bad row")
+        self.batches.append(list(rows))
+
+    def dead_letter(self, rows: list[object], error: Exception) -> None:
+        self.dead.append((list(rows), error))
+
+
+def _buffer(recorder: Recorder, **options: object) -> WriteBuffer:
+    params: dict = {
+        "flush_interval": 10.0,
+        "batch_size": 3,
+        "max_queue": 100,
+        "enqueue_timeout": 0.05,
+        "permanent_errors": (ValueError,),
+        "dead_letter": recorder.dead_letter,
+        **options,
+    }
+    return WriteBuffer(recorder.flush, **params)
+
+
+async def test_batches_by_size_and_drains_on_stop() -> None:
+    recorder = Recorder()
+    buffer = _buffer(recorder)
+    buffer.start()
+    for i in range(7):
+        assert await buffer.submit(i)
+    await buffer.stop()
+    assert recorder.batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+async def test_flushes_partial_batch_after_interval() -> None:
+    recorder = Recorder()
+    buffer = _buffer(recorder, flush_interval=0.05, batch_size=100)
+    buffer.start()
+    try:
+        await buffer.submit("a")
+        await buffer.submit("b")
+        await asyncio.sleep(0.3)
+        assert recorder.batches == [["a", "b"]]
+    finally:
+        await buffer.stop()
+
+
+async def test_submit_returns_false_when_queue_stays_full() -> None:
+    started = asyncio.Event()
+    release = asyncio.Event()
+    flushed: list[list[object]] = []
+
+    async def slow_flush(rows: list[object]) -> None:
+        started.set()
+        await release.wait()
+        flushed.append(rows)
+
+    buffer = WriteBuffer(
+        slow_flush, flush_interval=0, batch_size=1, max_queue=1, enqueue_timeout=0.05
+    )
+    buffer.start()
+    try:
+        assert await buffer.submit(1)
+        await asyncio.wait_for(started.wait(), 1)
+        # 后台任务卡在 flush：队列容量 1，第 2 行入队，第 3 行等待超时
+        assert await buffer.submit(2)
+        assert not await buffer.submit(3)
+    finally:
+        release.set()
+        await buffer.stop()
+    assert flushed == [[1], [2]]
+
+
+async def test_submit_rejected_when_not_running() -> None:
+    recorder = Recorder()
+    buffer = _buffer(recorder)
+    assert not await buffer.submit("before start")
+    buffer.start()
+    await buffer.stop()
+    assert not buffer.running
+    assert not await buffer.submit("after stop")
+    assert recorder.batches == []
+
+
+async def test_permanent_error_bisects_to_failing_row() -> None:
+    recorder = Recorder(bad=frozenset({5}))
+    buffer = _buffer(recorder, batch_size=8)
+    buffer.start()
+    for i in range(8):
+        await buffer.submit(i)
+    await buffer.stop()
+
+    flushed = sorted(row for batch in recorder.batches for row in batch)
+    assert flushed == [0, 1, 2, 3, 4, 6, 7]
+    assert [rows for rows, _ in recorder.dead] == [[5]]
+    assert isinstance(recorder.dead[0][1], ValueError)
+
+
+async def test_transient_error_retries_then_dead_letters_batch() -> None:
+    recorder = Recorder(bad=frozenset({1}), error=RuntimeError)
+    buffer = _buffer(recorder, max_retries=2)
+    buffer.start()
+    for i in range(3):
+        await buffer.submit(i)
+    await buffer.stop()
+
+    assert recorder.batches == []
+    assert [rows for rows, _ in recorder.dead] == [[0, 1, 2]]
+
+
+@pytest.fixture
+def dead_letter_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    path = tmp_path / "dead_letter.log"
+    monkeypatch.setattr(settings, "pomodoro_write_behind_dead_letter_file", str(path))
+    # 死信日志器按名称复用处理器：本测试使用新的处理器写入临时文件
+    monkeypatch.setattr(logging.getLogger("app.pomodoro_dead_letter"), "handlers", [])
+    return path
+
+
+async def _read_lines(path: Path, count: int) -> list[str]:
+    # 文件由后台线程写入
+    for _ in range(100):
+        if path.exists():
+            lines = path.read_text(encoding="utf-8").splitlines()
+            if len(lines) >= count:
+                return lines
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"死信文件未写入 {count} 行: {path}")
+
+
+async def test_dead_letter_file_records_failing_rows(dead_letter_file: Path) -> None:
+    user_id = uuid.uuid4()
+    rows = [
+        {"id": uuid.uuid4(), "user_id": user_id, "client_id": f"c{i}", "duration": 25}
+        for i in range(4)
+    ]
+    bad = rows[2]
+
+    async def flush(batch: list[dict]) -> None:
+        if bad in batch:
+            raise ValueError("duration out of range")
+
+    buffer = WriteBuffer(
+        flush,
+        flush_interval=10.0,
+        batch_size=4,
+        max_queue=10,
+        enqueue_timeout=0.05,
+        permanent_errors=(ValueError,),
+        dead_letter=_dead_letter_sessions,
+    )
+    buffer.start()
+    for row in rows:
+        await buffer.submit(row)
+    await buffer.stop()
+
+    (line,) = await _read_lines(dead_letter_file, 1)
+    entry = json.loads(line)
+    assert entry["error"] == "ValueError: duration out of range"
+    assert entry["row"]["id"] == str(bad["id"])
+    assert entry["row"]["client_id"] == "c2"